@@ -0,0 +1,41 @@
+"""
+Wire codec microbenchmark on JsonAst request and response frames.
+
+    pdm run bench_codec
+"""
+import sys
+import timeit
+
+from lacia.core.proxy import ProxyObj
+from lacia.network.codec import codecs, get_codec
+
+NUMBER = 20000
+
+def payloads():
+    ast = ProxyObj().Test(1, b=2).output("lacia", {"tags": ["a", "b"], "size": 3.5})._obj
+    nested = ProxyObj().ping(ProxyObj().Test(1, 2).a)._obj
+    return {
+        "request": {"id": 1024, "jsonrpc": "jsonast", "method": ast.dumps()},
+        "nested": {"to": "client_2", "id": 1025, "jsonrpc": "jsonast", "method": nested.dumps(), "retain": False},
+        "result": {"id": 1024, "jsonrpc": "jsonast", "result": {"name": "lacia", "values": list(range(32)), "ratio": 0.25}},
+        "bytes": {"id": 1026, "jsonrpc": "jsonast", "result": b"x" * 4096},
+        "item": {"id": 1027, "item": 42},
+    }
+
+def main(number: int = NUMBER):
+    names = [name for name in codecs if get_codec(name).name == name and get_codec(name).serializes]
+    print(f"{'payload':<10}{'codec':<10}{'size':>8}{'dumps us':>12}{'loads us':>12}")
+    for label, payload in payloads().items():
+        for name in names:
+            codec = get_codec(name)
+            try:
+                data = codec.dumps(payload)
+            except Exception:
+                print(f"{label:<10}{name:<10}{'-':>8}{'-':>12}{'-':>12}")
+                continue
+            dumps = timeit.timeit(lambda: codec.dumps(payload), number=number) / number * 1e6
+            loads = timeit.timeit(lambda: codec.loads(data), number=number) / number * 1e6
+            print(f"{label:<10}{name:<10}{len(data):>8}{dumps:>12.2f}{loads:>12.2f}")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else NUMBER)
@@ -0,0 +1,39 @@
+"""
+Per-message compression benchmark on encoded frames, with and without a
+dictionary trained on similar frames.
+
+    pdm run bench_compress
+"""
+import sys
+import timeit
+
+from lacia.network.codec import get_codec
+from lacia.network.compress import available_compressions, get_compression, train_dictionary, dictionary_id
+
+from codec import payloads
+
+NUMBER = 5000
+
+def frames():
+    codec = get_codec("msgpack")
+    result = {label: codec.dumps(payload) for label, payload in payloads().items()}
+    result["listing"] = codec.dumps({"id": 1028, "jsonrpc": "jsonast", "result": [{"name": f"item{i}", "size": i * 10, "tags": ["a", "b"]} for i in range(64)]})
+    return result
+
+def main(number: int = NUMBER):
+    data = frames()
+    samples = [get_codec("msgpack").dumps(payload | {"id": i}) for i in range(200) for payload in payloads().values()]
+    dictionary = train_dictionary(samples, 4096)
+    print(f"{'frame':<10}{'algorithm':<20}{'size':>8}{'packed':>8}{'comp us':>10}{'decomp us':>11}")
+    for label, frame in data.items():
+        for name in available_compressions():
+            for did in ("", f".{dictionary_id(dictionary)}"):
+                compression = get_compression(name + did, dictionary, threshold=0)
+                assert compression is not None
+                packed = compression.compress(frame)
+                comp = timeit.timeit(lambda: compression.compress(frame), number=number) / number * 1e6
+                decomp = timeit.timeit(lambda: compression.decompress(packed), number=number) / number * 1e6
+                print(f"{label:<10}{compression.name:<20}{len(frame):>8}{len(packed):>8}{comp:>10.2f}{decomp:>11.2f}")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else NUMBER)
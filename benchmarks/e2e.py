@@ -0,0 +1,282 @@
+"""
+End-to-end benchmark: a server in a child process and N clients on
+loopback over websockets, or raw TCP or Unix domain sockets with
+`--transport tcp|unix`; with `--transport memory` a MemoryServer and its
+clients in one process, free of network stack noise. Measures calls/s and latency percentiles of simple calls, deep
+chains, nested arguments, streams, reverse (server to client) calls and
+client-to-client relays over payload sizes and concurrency levels.
+
+    pdm run bench_e2e --output before.json
+    pdm run bench_e2e --output after.json --compare before.json
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from lacia.core.core import JsonRpc
+from lacia.core.proxy import ProxyObj
+from lacia.core.workers import Workers
+from lacia.logger import logger
+from lacia.network.client.aioclient import AioClient
+from lacia.network.server.aioserver import AioServer
+from lacia.network.client.memoryclient import MemoryClient
+from lacia.network.server.memoryserver import MemoryServer
+from lacia.network.client.streamclient import StreamClient
+from lacia.network.server.streamserver import StreamServer
+
+SIZES = (16, 1024, 64 * 1024)
+CONCURRENCY = (1, 16, 64)
+DEPTH = 8
+STREAM_ITEMS = 100
+
+class Chain:
+    def step(self, i: int) -> "Chain":
+        return self
+
+    def value(self) -> int:
+        return 1
+
+async def count(n: int):
+    for i in range(n):
+        yield i
+
+def echo(value: Any) -> Any:
+    return value
+
+def quiet():
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+async def measure(call: Callable[[int], Awaitable[Any]], total: int, concurrency: int) -> Dict[str, Any]:
+    """
+    Run `total` calls from `concurrency` workers; `call` gets the worker
+    index, so workers can be spread over several clients.
+    """
+    latencies: List[float] = []
+
+    async def worker(index: int, calls: int):
+        for _ in range(calls):
+            start = time.perf_counter()
+            await call(index)
+            latencies.append(time.perf_counter() - start)
+
+    shares = [total // concurrency + (1 if i < total % concurrency else 0) for i in range(concurrency)]
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i, n) for i, n in enumerate(shares) if n))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "calls": total,
+        "seconds": elapsed,
+        "calls_per_s": total / elapsed,
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000,
+    }
+
+def server_rpc() -> JsonRpc:
+    rpc = JsonRpc(name="bench_server")
+
+    async def reverse(name: str, size: int, total: int, concurrency: int) -> Dict[str, Any]:
+        payload = b"x" * size
+        peer = ProxyObj(rpc, name)
+        return await measure(lambda index: peer.echo(payload), total, concurrency)
+
+    rpc.add_namespace({"echo": echo, "Chain": Chain, "count": count, "reverse": reverse})
+    return rpc
+
+def server_transport(kind: str, address: Any):
+    if kind == "tcp":
+        return StreamServer(port=address)
+    if kind == "unix":
+        return StreamServer(path=address)
+    return AioServer(path="/ws", port=address, metrics_path=None)
+
+def client_transport(kind: str, address: Any):
+    if kind == "tcp":
+        return StreamClient(port=address)
+    if kind == "unix":
+        return StreamClient(path=address)
+    if kind.startswith("memory"):
+        return MemoryClient("bench")
+    return AioClient(path="/ws", port=address)
+
+def serve(kind: str, address: Any, workers: int) -> None:
+    quiet()
+    if workers > 1:
+        Workers(server_rpc(), server_transport(kind, address), workers=workers).run()
+    else:
+        asyncio.run(server_rpc().run_server(server_transport(kind, address)))
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+async def wait_ready(kind: str, address: Any, timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if kind == "unix":
+                _, writer = await asyncio.open_unix_connection(address)
+            else:
+                _, writer = await asyncio.open_connection("localhost", address)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+
+async def connect(kind: str, address: Any, name: str) -> JsonRpc:
+    rpc = JsonRpc(name=name, namespace={"echo": echo})
+    await rpc.run_client(client_transport(kind, address))
+    return rpc
+
+async def run(kind: str, address: Any, clients: int, total: int) -> List[Dict[str, Any]]:
+    rpcs = [await connect(kind, address, f"bench_{i}") for i in range(max(clients, 2))]
+    callers = rpcs[:max(clients, 1)]
+    peer = rpcs[-1]._name
+    results: List[Dict[str, Any]] = []
+
+    async def record(scenario: str, size: Optional[int], concurrency: int, call: Callable[[int], Awaitable[Any]], calls: int = total, **extra):
+        await measure(call, min(calls, 50), min(concurrency, 8))
+        result = await measure(call, calls, concurrency)
+        result.update(scenario=scenario, size=size, concurrency=concurrency, **extra)
+        results.append(result)
+        print(f"{scenario:<10}{size or '-':>8}{concurrency:>6}{result['calls_per_s']:>12.0f}{result['p50_ms']:>10.3f}{result['p99_ms']:>10.3f}", flush=True)
+
+    def server(index: int) -> ProxyObj:
+        return ProxyObj(callers[index % len(callers)])
+
+    print(f"{'scenario':<10}{'size':>8}{'conc':>6}{'calls/s':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    for size in SIZES:
+        payload = b"x" * size
+        for concurrency in CONCURRENCY:
+            await record("call", size, concurrency, lambda i: server(i).echo(payload))
+    for concurrency in CONCURRENCY:
+        def chain(i: int):
+            proxy = server(i).Chain()
+            for step in range(DEPTH):
+                proxy = proxy.step(step)
+            return proxy.value()
+        await record("chain", None, concurrency, chain, depth=DEPTH)
+    for size in SIZES:
+        payload = b"x" * size
+        for concurrency in CONCURRENCY:
+            await record("nested", size, concurrency, lambda i: server(i).echo(server(i).echo(server(i).echo(payload))))
+    for concurrency in CONCURRENCY:
+        async def stream(i: int):
+            async for _ in server(i).count(STREAM_ITEMS):
+                pass
+        await record("stream", None, concurrency, stream, calls=max(total // 10, 10), items=STREAM_ITEMS)
+        results[-1]["items_per_s"] = results[-1]["calls_per_s"] * STREAM_ITEMS
+    for size in SIZES:
+        for concurrency in CONCURRENCY:
+            result = await ProxyObj(rpcs[0]).reverse(rpcs[0]._name, size, total, concurrency)
+            result.update(scenario="reverse", size=size, concurrency=concurrency)
+            results.append(result)
+            print(f"{'reverse':<10}{size:>8}{concurrency:>6}{result['calls_per_s']:>12.0f}{result['p50_ms']:>10.3f}{result['p99_ms']:>10.3f}", flush=True)
+    for size in SIZES:
+        payload = b"x" * size
+        for concurrency in CONCURRENCY:
+            await record("ctoc", size, concurrency, lambda i: ProxyObj(rpcs[0], peer).echo(payload))
+    for rpc in rpcs:
+        await rpc._client.close()
+    return results
+
+async def run_memory(clients: int, total: int, serialize: bool) -> List[Dict[str, Any]]:
+    server = MemoryServer("bench", serialize=serialize)
+    await server_rpc().run_server(server)
+    try:
+        return await run("memory", None, clients, total)
+    finally:
+        await server.close()
+
+def key(result: Dict[str, Any]) -> tuple:
+    return (result["scenario"], result["size"], result["concurrency"])
+
+def compare(results: List[Dict[str, Any]], path: str) -> None:
+    with open(path) as f:
+        baseline = {key(result): result for result in json.load(f)["results"]}
+    print(f"\n{'scenario':<10}{'size':>8}{'conc':>6}{'calls/s':>10}{'p99':>10}   vs {path}")
+    for result in results:
+        old = baseline.get(key(result))
+        if old is not None:
+            print(f"{result['scenario']:<10}{result['size'] or '-':>8}{result['concurrency']:>6}"
+                  f"{result['calls_per_s'] / old['calls_per_s']:>9.2f}x{result['p99_ms'] / old['p99_ms']:>9.2f}x")
+
+def serve_and_run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    address = os.path.join(tempfile.mkdtemp(), "bench.sock") if args.transport == "unix" else free_port()
+    server = multiprocessing.get_context("spawn").Process(target=serve, args=(args.transport, address, args.workers), daemon=True)
+    server.start()
+    try:
+        asyncio.run(wait_ready(args.transport, address))
+        return asyncio.run(run(args.transport, address, args.clients, args.calls))
+    finally:
+        if args.workers > 1:
+            server.terminate()
+        else:
+            server.kill()
+        server.join()
+
+def meta(args: argparse.Namespace) -> Dict[str, Any]:
+    try:
+        from importlib.metadata import version
+        lacia = version("lacia")
+    except Exception:
+        lacia = "unknown"
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        commit = None
+    return {
+        "lacia": lacia,
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": datetime.now(timezone.utc).isoformat(),
+        "clients": args.clients,
+        "calls": args.calls,
+        "transport": args.transport,
+        "workers": args.workers,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="lacia end-to-end benchmark")
+    parser.add_argument("--clients", type=int, default=2, help="clients spreading the calls")
+    parser.add_argument("--calls", type=int, default=2000, help="calls per measurement")
+    parser.add_argument("--quick", action="store_true", help="200 calls per measurement")
+    parser.add_argument("--transport", choices=("aio", "tcp", "unix", "memory", "memory-serialize"), default="aio", help="websocket, raw TCP or Unix domain socket, or in-process with or without a codec")
+    parser.add_argument("--workers", type=int, default=1, help="server worker processes (not with --transport memory)")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+    if args.quick:
+        args.calls = 200
+
+    quiet()
+    if args.transport.startswith("memory"):
+        results = asyncio.run(run_memory(args.clients, args.calls, args.transport == "memory-serialize"))
+    else:
+        results = serve_and_run(args)
+
+    report = {"meta": meta(args), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from lacia.core.transfer import Blob, CHUNK, BLOB
+
+ATTACH = "$attach"
+Frame = Union[bytes, bytearray, memoryview]
+Place = Callable[[Union[memoryview, Blob]], Dict[str, int]]
+
+_BYTES = (bytes, bytearray, memoryview)
+_CONTAINERS = (dict, list, tuple)
+_LIFTED = frozenset(_BYTES + _CONTAINERS + (Blob,))
+
+class Parcel:
+    """
+    A header frame waiting for the binary frames it references.
+    """
+
+    __slots__ = ("header", "message", "count", "frames")
+
+    def __init__(self, header: Union[bytes, str], count: int, message: Optional[Dict[str, Any]] = None) -> None:
+        self.header = header
+        self.message = message
+        self.count = count
+        self.frames: List[bytes] = []
+
+    def add(self, frame: Any) -> bool:
+        self.frames.append(frame)
+        return len(self.frames) >= self.count
+
+def lift(value: Any, threshold: int, place: Place) -> Any:
+    """
+    Replace every `Blob` and every bytes-like value of at least
+    `threshold` bytes by the marker `place` returns for it (given a flat
+    memoryview). Containers are copied only along the path to a lifted
+    value.
+    """
+    tp = type(value)
+    if tp in _BYTES:
+        view = value if tp is memoryview else memoryview(value)
+        if view.nbytes < threshold:
+            return value
+        if not view.c_contiguous:
+            view = memoryview(view.tobytes())
+        return place(view.cast("B") if view.format != "B" or view.ndim != 1 else view)
+    elif tp is Blob:
+        return place(value)
+    elif tp is dict:
+        copy = None
+        for key, item in value.items():
+            if type(item) in _LIFTED:
+                lifted = lift(item, threshold, place)
+                if lifted is not item:
+                    if copy is None:
+                        copy = dict(value)
+                    copy[key] = lifted
+        return value if copy is None else copy
+    elif tp is list or tp is tuple:
+        items = None
+        for index, item in enumerate(value):
+            if type(item) in _LIFTED:
+                lifted = lift(item, threshold, place)
+                if lifted is not item:
+                    if items is None:
+                        items = list(value)
+                    items[index] = lifted
+        return value if items is None else tp(items)
+    return value
+
+def header(message: Dict[str, Any], chunks: int, attach: int) -> Dict[str, Any]:
+    """
+    `message` with its `"chunks"` and `"attach"` counts right after its id,
+    where a relaying server peeks for them.
+    """
+    result: Dict[str, Any] = {}
+    for key, value in message.items():
+        if key == "chunks" or key == "attach":
+            continue
+        result[key] = value
+        if key == "id":
+            if chunks:
+                result["chunks"] = chunks
+            if attach:
+                result["attach"] = attach
+    return result
+
+def restore(value: Any, frames: List[Any], accept: Optional[Callable[[str, int], Any]] = None) -> Any:
+    """
+    Put the received frames back in place of their markers, in place;
+    chunked values are replaced by whatever `accept(kind, id)` returns.
+    """
+    if type(value) is dict:
+        if len(value) == 1:
+            if ATTACH in value:
+                return frames[value[ATTACH]]
+            elif accept is not None and (CHUNK in value or BLOB in value):
+                kind = CHUNK if CHUNK in value else BLOB
+                return accept(kind, value[kind])
+        for key, item in value.items():
+            if type(item) in _CONTAINERS:
+                value[key] = restore(item, frames, accept)
+        return value
+    elif type(value) is list:
+        for index, item in enumerate(value):
+            if type(item) in _CONTAINERS:
+                value[index] = restore(item, frames, accept)
+        return value
+    elif type(value) is tuple:
+        return tuple(restore(item, frames, accept) for item in value)
+    return value
+
+def replace(value: Any, values: Dict[int, Any]) -> Any:
+    """
+    Swap the objects whose `id()` is in `values`, in place.
+    """
+    if id(value) in values:
+        return values[id(value)]
+    elif type(value) is dict:
+        for key, item in value.items():
+            value[key] = replace(item, values)
+    elif type(value) is list:
+        for index, item in enumerate(value):
+            value[index] = replace(item, values)
+    elif type(value) is tuple:
+        return tuple(replace(item, values) for item in value)
+    return value
@@ -1,24 +1,54 @@
+import sys
+import time
 import asyncio
-import json
-import richuru
+import weakref
+import orjson
 from uuid import uuid4
-from typing import Dict, Any, Optional, TypeVar, Generic
+from itertools import count
+from typing import Dict, Any, Optional, TypeVar, Generic, Union, List, Iterable, AsyncIterator, Tuple, Callable
 
 from nest_asyncio import apply as nest_apply
 
 from lacia.core.abcbase import BaseJsonRpc
 from lacia.core.proxy import BaseProxy, ResultProxy, ProxyObj
+from lacia.core.store import ResultStore
+from lacia.core.pending import PendingCalls
+from lacia.core.executor import ConnectionExecutor
+from lacia.core.offload import Offload, Policy
+from lacia.core.encoder import BatchItems, ResultEncoder, HandleResult
+from lacia.core.stream import RemoteStream, StreamProducer
+from lacia.core.relay import RelayTable, Relay
+from lacia.core.prepared import PreparedCall, TemplateStore
+from lacia.core.attach import ATTACH, Parcel, Frame, lift, header, restore, replace
+from lacia.core.intercept import Interceptors, Interceptor, STAGES
+from lacia.core.metrics import Metrics, CALLER, CALLEE, method_name, to_prometheus
+from lacia.core.peers import Peers
+from lacia.core.transfer import CHUNK, BLOB, Blob, BlobReader, ChunkSender, Transfers
+from lacia.network.codec import BaseCodec, BsonCodec, Field
+from lacia.network.compress import Compression
 from lacia.network.abcbase import BaseServer, BaseClient
 from lacia.standard.abcbase import BaseDataTrans, Namespace
 from lacia.standard.execute import Standard
-from lacia.logger import logger
-from lacia.types import RpcMessage, Context
-from lacia.exception import JsonRpcInitException
+from lacia.standard.jsonast.planner import Planner
+from lacia.standard.jsonast.runtime import RunTime
+from lacia.logger import logger, install, PayloadLog
+from lacia.types import RpcMessage, Context, JsonRpcCode, Message
+from lacia.exception import JsonRpcInitException, JsonRpcClosedException, JsonRpcRuntimeException, JsonRpcRejectedException
 
 T = TypeVar("T")
 
+def _frame(websocket: Any, data: Union[bytes, str]) -> Union[bytes, str]:
+    return data
+
+def _size(data: Any) -> int:
+    if isinstance(data, memoryview):
+        return data.nbytes
+    return len(data) if isinstance(data, (bytes, bytearray, str)) else 0
+
 class JsonRpc(BaseJsonRpc, Generic[T]):
-    
+
+    _stage_methods = {"decode": "_decode", "execute": "_execute_call", "encode": "_encode", "send": "_send"}
+
     def __init__(
         self,
         name: str,
@@ -27,11 +57,28 @@ class JsonRpc(BaseJsonRpc, Generic[T]):
         token: Optional[str] = None,
         loop: Optional[asyncio.AbstractEventLoop] = None,
         debug: bool = False,
- 
+        results: Optional[ResultStore] = None,
+        timeout: Optional[float] = None,
+        max_concurrency: int = 64,
+        policy: Union[Policy, str] = Policy.inline,
+        policies: Optional[Dict[str, Union[Policy, str]]] = None,
+        offload: Optional[Offload] = None,
+        encoder: Optional[ResultEncoder] = None,
+        codec: Optional[BaseCodec] = None,
+        stream_window: int = 64,
+        relay: bool = True,
+        attach_threshold: Optional[int] = 64 * 1024,
+        chunk_size: Optional[int] = 256 * 1024,
+        chunk_window: int = 16,
+        payload_log: Optional[PayloadLog] = None,
+        metrics: Optional[Metrics] = None,
+        interceptors: Optional[Interceptors] = None,
+        peers: Optional[Peers] = None,
     ) -> None:
         self._name = name
         self._execer = execer
         self._namespace = Namespace(
+            builtins={"rpc_metrics": self.metrics},
             globals=namespace if namespace else {},
         )
         self._token = token
@@ -39,24 +86,106 @@ class JsonRpc(BaseJsonRpc, Generic[T]):
         self._debug = debug
         self._uuid = str(uuid4())
 
-        self._wait_remote: Dict[str, asyncio.Event] = {}
-        self._wait_result: Dict[str, ResultProxy] = {}
+        self._pending = PendingCalls(timeout)
+        self._results = results if results is not None else ResultStore()
+        self._max_concurrency = max_concurrency
+        self._executors: Dict[Any, ConnectionExecutor] = {}
+        self._offload = offload if offload is not None else Offload(policy)
+        for name, func_policy in (policies or {}).items():
+            self._offload.set(self._namespace.globals[name], func_policy)
+        self._encoder = encoder if encoder is not None else ResultEncoder()
+        self._codec = codec if codec is not None else BsonCodec()
+        self._codecs: Dict[Any, BaseCodec] = {}
+        self._compressions: Dict[Any, Compression] = {}
+        self._chunk_size = chunk_size
+        self._chunk_window = chunk_window
+        thresholds = [size for size in (attach_threshold, chunk_size and chunk_size + 1) if size]
+        self._lift_threshold = min(thresholds) if thresholds else None
+        self._transfers = Transfers()
+        self._send_locks: Dict[Any, asyncio.Lock] = {}
+        self._stream_window = stream_window
+        self._streams: "weakref.WeakValueDictionary[int, RemoteStream]" = weakref.WeakValueDictionary()
+        self._producers: Dict[Any, Dict[Any, StreamProducer]] = {}
+        self._relay = relay
+        self._relays = RelayTable()
+        self._peers = peers
+        self._planner = Planner(False, self._name)
+        self._templates = TemplateStore()
+        self._template_ids = count(1)
 
         self._standard = Standard()
 
+        self._metrics = metrics if metrics is not None else Metrics()
+        self._interceptors = interceptors if interceptors is not None else Interceptors()
+        self._received: Optional[Callable[[T, Union[bytes, str]], Optional[Union[bytes, str]]]] = None
+        for stage in STAGES:
+            self._compile(stage)
+        self._payload_log = payload_log if payload_log is not None else PayloadLog(debug)
         if self._debug:
-            richuru.install(level="DEBUG")
+            install(level="DEBUG")
+
+    def intercept(self, stage: str, interceptor: Optional[Interceptor] = None, first: bool = False) -> Any:
+        """
+        Add an interceptor to `stage`, directly or as a decorator:
+
+        - `receive(call_next, websocket, data)`: each incoming header frame,
+          before it is decoded or relayed; returning `None` drops it.
+        - `decode(call_next, websocket, data)` -> message.
+        - `execute(call_next, websocket, message)` (async): an incoming
+          request, up to sending its response; raise
+          `JsonRpcRejectedException` to answer with an error instead.
+        - `encode(call_next, websocket, msg)` -> `(data, frames, transfers)`.
+        - `send(call_next, websocket, data, attachments=None, transfers=None)`
+          (async): every outgoing header frame.
+        """
+        def register(interceptor: Interceptor) -> Interceptor:
+            self._interceptors.add(stage, interceptor, first)
+            self._compile(stage)
+            return interceptor
+        return register if interceptor is None else register(interceptor)
 
-    def add_namespace(self, namespace: Dict[str, Any]) -> None:
-        self._namespace.globals.update(namespace)
+    def remove_interceptor(self, stage: str, interceptor: Interceptor) -> None:
+        self._interceptors.remove(stage, interceptor)
+        self._compile(stage)
+
+    def _compile(self, stage: str) -> None:
+        """
+        Bind the chain of `stage` over the method it wraps; without
+        interceptors the plain method is used again.
+        """
+        if stage == "receive":
+            chain = self._interceptors.compile(stage, _frame)
+            self._received = None if chain is _frame else chain
+            return
+        name = self._stage_methods[stage]
+        terminal = getattr(type(self), name).__get__(self)
+        chain = self._interceptors.compile(stage, terminal)
+        if chain is terminal:
+            self.__dict__.pop(name, None)
+        else:
+            setattr(self, name, chain)
+
+    def add_namespace(self, namespace: Dict[str, Any], policy: Optional[Union[Policy, str]] = None) -> None:
+        self._namespace.update(namespace)
+        if policy is not None:
+            for value in namespace.values():
+                if callable(value):
+                    self._offload.set(value, policy)
 
     async def run_client(self, client: BaseClient) -> None:
         self._standard.init_standard()
         self._client = client
         self._loop = self._loop or asyncio.get_event_loop()
         await client.start()
+        websocket = client.ws
+        self._codecs[websocket] = client.codec()
+        compression = client.compression()
+        if compression is not None:
+            self._compressions[websocket] = compression
+        self._executors[websocket] = ConnectionExecutor(self._max_concurrency)
         if self._loop:
-            self._loop.create_task(self._listening_server(self._client.ws))
+            self._loop.create_task(self._listening_server(websocket))
+            await self.run(ProxyObj().rpc_auto_register(self._name, self._token))
             logger.info("run client")
     
     async def run_server(self, server: BaseServer) -> None:
@@ -66,6 +195,11 @@ class JsonRpc(BaseJsonRpc, Generic[T]):
         self._server = server
         self._server.on("connect", self._listening_client)
         self._server.on("disconnect", self.on_server_close)
+        self._server.on("metrics", self.metrics_text)
+        if self._peers is not None:
+            if self._peers.secret is None:
+                self._peers.secret = self._token
+            await self._peers.start(self._route)
         logger.info("run server")
         await server.start()
     
@@ -80,38 +214,57 @@ class JsonRpc(BaseJsonRpc, Generic[T]):
 
         def rpc_auto_register(name, token):
             nonlocal by_name
+            if token != self._token:
+                raise JsonRpcInitException("rpc_auto_register fail")
             if self._server is not None:
                 self._server.active_connections.set_name_ws(name, websocket)
+                if self._peers is not None:
+                    self._peers.claim(name)
             Context.name.set(name)
             by_name = name
-            if token == self._token:
-                event.set()
-                return self._name
-            raise JsonRpcInitException("rpc_auto_register fail")
+            event.set()
+            return self._name
 
-        if self._namespace.locals.get(websocket) is None:
-            self._namespace.locals[websocket] = {}
         if self._server:
-            self._namespace.locals[websocket]["rpc_auto_register"] = rpc_auto_register
+            self._namespace.set_local(websocket, "rpc_auto_register", rpc_auto_register)
+            self._codecs[websocket] = self._server.codec(websocket)
+            compression = self._server.compression(websocket)
+            if compression is not None:
+                self._compressions[websocket] = compression
 
-        qmgs = asyncio.Queue()
+        executor = self._executors[websocket] = ConnectionExecutor(self._max_concurrency)
 
         if self._loop:
-            self._loop.create_task(self._client_auth(event, qmgs, websocket))
+            self._loop.create_task(self._client_auth(event, executor, websocket))
+
+        def dispatch(message: Message):
+            self._payload_log("receive", message)
+            msg = RpcMessage(message)
+            if msg.template is not None and "method" in message:
+                self._register_template(websocket, msg)
+            if msg.is_request and self._execer and self._loop:
+                if msg.is_auth:
+                    self._loop.create_task(self._execute(websocket, msg))
+                else:
+                    executor.put(msg)
+            elif msg.is_stream or msg.is_credit:
+                self._on_stream(websocket, msg)
+            elif msg.is_response:
+                self._pending.resolve(msg.id, ResultProxy(msg, core=self, by=by_name)) # type: ignore
 
         if self._server is not None:
-            async for message in self._server.iter_json(websocket):
-                logger.debug(f"receive: {message}")
-                msg = RpcMessage(message)
-                if msg.is_request and self._execer and self._loop:
-                    if msg.is_auth:
-                        self._loop.create_task(self._s_execute(websocket, msg))
-                    else:
-                        qmgs.put_nowait(msg)
-                elif msg.is_response:
-                    rmsg = ResultProxy(msg, core=self, by=by_name) # type: ignore
-                    self._wait_result[msg.id] = rmsg
-                    self._wait_remote[msg.id].set()    
+            async for data, message, attachments in self._receive(websocket, self._server.iter_raw(websocket)):
+                if self._relay and event.is_set() and not isinstance(data, str) and await self._forward(websocket, data, attachments):
+                    continue
+                try:
+                    message = self._open(websocket, data, message, attachments, dispatch)
+                except Exception as e:
+                    logger.error(e)
+                    continue
+                if message is not None:
+                    dispatch(message)
+            if websocket in self._server.active_connections:
+                await self._server.close_ws(websocket)
         else:
             raise JsonRpcInitException("server is None")
 
@@ -123,146 +276,836 @@ class JsonRpc(BaseJsonRpc, Generic[T]):
         Context.name.set(None) # type: ignore
 
         if self._client is not None:
-            
-            if self._loop:
-                self._loop.create_task(self.run(ProxyObj().rpc_auto_register(self._name, self._token)))
+            executor = self._executors[websocket]
+            executor.start(lambda msg: self._execute(websocket, msg))
 
-            async for message in self._client.iter_json():
-                logger.debug(f"receive: {message}")
+            def dispatch(message: Message):
+                self._payload_log("receive", message)
                 msg = RpcMessage(message)
+                if msg.template is not None and "method" in message:
+                    self._register_template(websocket, msg)
 
                 if msg.is_request and self._execer and self._loop:
-                    self._loop.create_task(self._c_execute(websocket, msg))
+                    executor.put(msg)
+                elif msg.is_stream or msg.is_credit:
+                    self._on_stream(websocket, msg)
                 elif msg.is_response:
-                    rmsg = ResultProxy(msg, core=self, by=None) # type: ignore
-                    self._wait_result[msg.id] = rmsg
-                    self._wait_remote[msg.id].set()
+                    self._pending.resolve(msg.id, ResultProxy(msg, core=self, by=None)) # type: ignore
+
+            async for data, message, attachments in self._receive(websocket, self._client.iter_raw()):
+                try:
+                    message = self._open(websocket, data, message, attachments, dispatch)
+                except Exception as e:
+                    logger.error(e)
+                    continue
+                if message is not None:
+                    dispatch(message)
+            self.on_client_close(websocket)
         else:
             raise JsonRpcInitException("client is None")
     
-    async def _s_execute(self, websocket: T, message: RpcMessage): 
+    def _known(self, websocket: T, name: str) -> str:
+        """
+        `name` if it is registered for `websocket`, else `"<unknown>"`, so
+        peers cannot grow the callee metrics with made-up names.
+        """
+        if name == "<result>" or self._namespace.shares(name) or name in self._namespace.locals.get(websocket, ()):
+            return name
+        return "<unknown>"
+
+    async def _execute(self, websocket: T, message: RpcMessage):
+        if message.is_batch:
+            name = "<batch>"
+        elif message.template is not None:
+            name = self._known(websocket, self._templates.name(websocket, message.template))
+        else:
+            name = self._known(websocket, method_name(message.method))
+        with self._metrics.call(CALLEE, name) as call:
+            try:
+                call.error = not await self._execute_call(websocket, message)
+            except JsonRpcRejectedException as e:
+                call.error = True
+                msg = {
+                    "id": message.id,
+                    "jsonrpc": message.jsonrpc,
+                    "error": {"code": JsonRpcCode.InvalidRequest, "message": str(e)}
+                }
+                await self._send(websocket, *self._encode(websocket, msg))
+
+    async def _execute_call(self, websocket: T, message: RpcMessage) -> bool:
+        """
+        Run one request and send its response; false if it failed.
+        """
+        if message.is_batch:
+            return await self._execute_batch(websocket, message)
 
-        result, error = await self._standard.rpc_request(message.data, self._namespace[websocket], ProxyObj, ResultProxy)
+        if message.template is not None:
+            try:
+                message.data["method"] = self._templates.bind(
+                    websocket, message.template, message.params, RunTime.compiler_for(self.is_server(), self._name)
+                )
+            except Exception as e:
+                logger.error(e)
+                msg = {
+                    "id": message.id,
+                    "jsonrpc": message.jsonrpc,
+                    "error": {"code": JsonRpcCode.InvalidRequest, "message": str(e)}
+                }
+                await self._send(websocket, self._codec_for(websocket).dumps(msg))
+                return False
+
+        result, error = await self._standard.rpc_request(message.data, self._scope(websocket), ProxyObj, ResultProxy)
+
+        if message.stream is not None:
+            await self._produce(websocket, message, result, error)
+            return error is None
 
         if error is None:
-            if websocket not in self._namespace.locals:
-                self._namespace.locals[websocket] = {}
-            self._namespace.locals[websocket][message.id] = result
+            if message.retain:
+                self._results.put(websocket, message.id, result)
             msg = {
-                "jsonrpc": message.jsonrpc,
                 "id": message.id,
-                "result": self._pretreatment(result)
+                "jsonrpc": message.jsonrpc,
+                "result": result
             }
         else:
             msg = {
-                "jsonrpc": message.jsonrpc,
                 "id": message.id,
+                "jsonrpc": message.jsonrpc,
                 "error": error
             }
-        if self._server is not None:
-            logger.debug(f"send: {msg}")
-            
-            await self._server.send_json(websocket, msg)
-    
-    async def _c_execute(self, websocket: T, message: RpcMessage):
 
-        result, error = await self._standard.rpc_request(message.data, self._namespace[websocket], ProxyObj, ResultProxy)
+        self._payload_log("send", msg)
+        await self._send(websocket, *self._encode_result(websocket, message, msg, result))
+        return error is None or error["code"] == JsonRpcCode.StopAsyncIterationError
+
+    async def _execute_batch(self, websocket: T, message: RpcMessage) -> bool:
+
+        scope = self._scope(websocket)
+        outcomes = await asyncio.gather(*(
+            self._standard.rpc_request({"jsonrpc": message.jsonrpc, "method": method}, scope, ProxyObj, ResultProxy)
+            for method in message.batch
+        ))
+        items = [{"result": result} if error is None else {"error": error} for result, error in outcomes]
+        msg = {
+            "id": message.id,
+            "jsonrpc": message.jsonrpc,
+            "results": items,
+        }
+
+        self._payload_log("send", msg)
+        while True:
+            hook = BatchItems(self._encoder.default)
+            try:
+                encoded = self._encode(websocket, msg, hook)
+            except Exception as e:
+                if hook.index < 0 or "result" not in items[hook.index]:
+                    raise
+                hook.failed[hook.index] = e
+            if not hook.failed:
+                break
+            for index, e in hook.failed.items():
+                items[index] = self._item_fallback(websocket, f"{message.id}:{index}", items[index]["result"], e)
+        await self._send(websocket, *encoded)
+        return all(error is None for _, error in outcomes)
+
+    async def _produce(self, websocket: T, message: RpcMessage, result: Any, error: Optional[dict]):
+
+        async def send(msg: Dict[str, Any]):
+            self._payload_log("send", msg)
+            try:
+                encoded = self._encode(websocket, msg)
+            except Exception as e:
+                encoded = self._codec_for(websocket).dumps({"id": msg["id"], "end": True, "error": {"code": JsonRpcCode.InternalError, "message": f"result encode error: {e}"}}), [], []
+            await self._send(websocket, *encoded)
 
         if error is None:
-            if websocket not in self._namespace.locals:
-                self._namespace.locals[websocket] = {}
-            self._namespace.locals[websocket][message.id] = result # TODO 内存泄漏
+            try:
+                if isinstance(result, ProxyObj):
+                    result = await self.stream(result)
+                elif not hasattr(result, "__anext__") and hasattr(result, "__aiter__"):
+                    result = result.__aiter__()
+                if not hasattr(result, "__anext__"):
+                    raise TypeError(f"{type(result).__name__} object is not an async iterator")
+            except Exception as e:
+                error = {"code": JsonRpcCode.InternalError, "message": str(e)}
+        if error is not None:
+            return await send({"id": message.id, "end": True, "error": error})
+
+        producer = StreamProducer(result, message.stream or self._stream_window, send, message.id)
+        producers = self._producers.setdefault(websocket, {})
+        producers[message.id] = producer
+
+        async def pump():
+            try:
+                await producer.pump()
+            finally:
+                if producers.get(message.id) is producer:
+                    del producers[message.id]
+
+        producer.task = asyncio.get_running_loop().create_task(pump())
+
+    def _on_stream(self, websocket: T, message: RpcMessage):
+        if message.is_credit:
+            producer = self._producers.get(websocket, {}).get(message.id)
+            if producer is None:
+                return
+            if message.data.get("cancel"):
+                producer.cancel()
+            else:
+                producer.grant(message.data["credit"])
+            return
+        stream = self._streams.get(message.id)
+        if stream is None:
+            if message.error is not None:
+                self._pending.reject(message.id, JsonRpcRuntimeException(message.error))
+            return
+        if "item" in message.data:
+            stream.feed(message.data["item"])
+        elif message.error is not None:
+            self._pending.reject(message.id, JsonRpcRuntimeException(message.error))
+        else:
+            self._pending.resolve(message.id, None)
+
+    async def _forward(self, websocket: T, data: bytes, attachments: Optional[List[bytes]] = None) -> bool:
+        """
+        Route a frame between two clients by its leading fields only.
+
+        Requests (and their credit frames) addressed to another client carry
+        `"to"` first and the caller's id second; responses and stream frames
+        carry the id first. Anything that does not match a relay is left to
+        the regular decode path. Attachment frames follow their header;
+        messages with chunked values are relayed through this side.
+        """
+        codec = self._codec_for(websocket)
+        fields = codec.peek(data, 4)
+        if not fields or len(fields) < 2 or self._server is None:
+            return False
+        head, second = fields[0], fields[1]
+        keys = [field.key for field in fields]
+        if head.key == "to" and second.key == "id" and isinstance(head.value, str):
+            target = self._server.active_connections.name_ws.get(head.value)
+            if target is None or target is websocket or self._codec_for(target).name != codec.name:
+                return False
+            relay_id = self._relays.outbound(websocket, second.value)
+            if relay_id is None:
+                if len(fields) > 2 and fields[2].key in ("credit", "cancel"):
+                    return False
+                relay_id = self._pending.reserve()
+                self._relays.open(relay_id, websocket, second.value, target)
+            try:
+                await self._pass(websocket, target, codec, data, second, relay_id, attachments, "chunks" in keys)
+            except Exception as e:
+                logger.error(e)
+                await self._abort_relay(relay_id, Relay(websocket, second.value, target), f"relay to {head.value} failed")
+            self._relays.forwarded += 1
+            return True
+        if head.key == "id" and second.key not in ("credit", "cancel"):
+            relay = self._relays.inbound(websocket, head.value)
+            if relay is None or self._codec_for(relay.src).name != codec.name:
+                return False
+            if "item" not in keys:
+                self._relays.close(head.value)
+            try:
+                await self._pass(websocket, relay.src, codec, data, head, relay.src_id, attachments, "chunks" in keys)
+            except Exception as e:
+                logger.error(e)
+            self._relays.forwarded += 1
+            return True
+        return False
+
+    async def _pass(self, websocket: T, target: T, codec: BaseCodec, data: bytes, field: Field, value: int, attachments: Optional[List[bytes]], chunked: bool):
+        if not chunked:
+            return await self._send(target, self._retag(codec, data, field, value), attachments)
+        message = restore(codec.loads(data), attachments or [], lambda kind, tid: Blob(self._accept(websocket, kind, tid, []), stream=kind == BLOB))
+        message["id"] = value
+        await self._send(target, *self._encode(target, message))
+
+    def _retag(self, codec: BaseCodec, data: bytes, field: Field, value: int) -> bytes:
+        patched = codec.patch(data, field, value)
+        if patched is not None:
+            return patched # type: ignore
+        message = codec.loads(data)
+        message["id"] = value
+        return codec.dumps(message)
+
+    async def _abort_relay(self, relay_id: int, relay: Relay, reason: str) -> None:
+        self._relays.close(relay_id)
+        try:
+            await self._send(relay.src, self._codec_for(relay.src).dumps({
+                "id": relay.src_id,
+                "end": True,
+                "error": {"code": JsonRpcCode.InternalError, "message": reason},
+            }))
+        except Exception:
+            pass
+
+    async def _drop_relays(self, websocket: T) -> None:
+        outgoing, incoming = self._relays.drop(websocket)
+        for relay_id, relay in outgoing:
+            try:
+                await self._send(relay.dst, self._codec_for(relay.dst).dumps({"id": relay_id, "cancel": True}))
+            except Exception:
+                pass
+        for relay_id, relay in incoming:
+            await self._abort_relay(relay_id, relay, "client connection closed")
+
+    async def _receive(self, websocket: T, frames: AsyncIterator[Union[bytes, str]]) -> AsyncIterator[Tuple[Union[bytes, str], Optional[Message], Optional[List[bytes]]]]:
+        """
+        Group a header frame with the attachment frames it announces. The
+        count is peeked when the codec allows it, otherwise the decoded
+        header is passed along so it is not decoded twice. Only header
+        frames go through the connection's compression.
+        """
+        parcel: Optional[Parcel] = None
+        compression = self._compressions.get(websocket)
+        traffic = self._metrics.connection(websocket)
+        async for data in frames:
+            traffic.frames_in += 1
+            traffic.bytes_in += _size(data)
+            if parcel is not None:
+                if parcel.add(data):
+                    yield parcel.header, parcel.message, parcel.frames
+                    parcel = None
+                continue
+            message = None
+            if compression is not None and isinstance(data, bytes):
+                try:
+                    data = compression.decompress(data)
+                except Exception as e:
+                    logger.error(e)
+                    continue
+            if self._received is not None:
+                data = self._received(websocket, data)
+                if data is None:
+                    continue
+            fields = self._codec_for(websocket).peek(data, 4) if not isinstance(data, str) else None
+            if fields is None:
+                try:
+                    message = self._decode(websocket, data)
+                except Exception as e:
+                    logger.error(e)
+                    continue
+                count = message.get("attach") if isinstance(message, dict) else None
+            else:
+                count = next((field.value for field in fields if field.key == "attach"), None)
+            if count:
+                parcel = Parcel(data, count, message)
+            else:
+                yield data, message, None
+
+    def _open(self, websocket: T, data: Union[bytes, str], message: Optional[Message], attachments: Optional[List[bytes]], dispatch: Callable[[Message], None]) -> Optional[Message]:
+        """
+        The complete message behind a header frame, or `None` when there is
+        nothing to dispatch yet: chunk frames are fed to their transfer, and
+        a message with chunked bytes values is dispatched once they arrived.
+        """
+        if message is None:
+            message = self._decode(websocket, data)
+        if "chunk" in message:
+            self._transfers.on_frame(websocket, message, attachments) # type: ignore
+            return None
+        if attachments or "chunks" in message:
+            waiting: List[BlobReader] = []
+            message = restore(message, attachments or [], lambda kind, tid: self._accept(websocket, kind, tid, waiting))
+            if waiting and self._loop:
+                self._loop.create_task(self._assemble(websocket, message, waiting, dispatch)) # type: ignore
+                return None
+        return message
+
+    def _accept(self, websocket: T, kind: str, tid: int, waiting: List[BlobReader]) -> BlobReader:
+        codec = self._codec_for(websocket)
+
+        async def send(msg: Dict[str, Any]):
+            await self._send(websocket, codec.dumps(msg))
+
+        reader = self._transfers.receive(websocket, tid, self._chunk_window, send)
+        if kind == CHUNK:
+            waiting.append(reader)
+        return reader
+
+    async def _assemble(self, websocket: T, message: Dict[str, Any], waiting: List[BlobReader], dispatch: Callable[[Message], None]):
+        try:
+            values = {id(reader): await reader.read() for reader in waiting}
+        except Exception as e:
+            logger.error(e)
+            if "method" in message or "batch" in message or "template" in message:
+                await self._send(websocket, self._codec_for(websocket).dumps({
+                    "id": message.get("id"),
+                    "jsonrpc": message.get("jsonrpc"),
+                    "error": {"code": JsonRpcCode.InternalError, "message": f"transfer failed: {e}"},
+                }))
+            else:
+                self._pending.reject(message.get("id"), e)
+            return
+        dispatch(replace(message, values))
+
+    def _encode(self, websocket: T, msg: Dict[str, Any], items: Optional[BatchItems] = None) -> Tuple[bytes, List[Frame], List[ChunkSender]]:
+        """
+        Encode `msg`, lifting large bytes values out of it: into attachment
+        frames sent right behind it, or into chunked transfers that start
+        once it is sent. A codec that does not serialize only gets its
+        `Blob` values lifted. `items` tracks failures per batch result.
+        """
+        start = time.perf_counter()
+        codec = self._codec_for(websocket)
+        frames: List[Frame] = []
+        transfers: List[ChunkSender] = []
+        if self._lift_threshold is not None:
+
+            def place(value: Union[memoryview, Blob]) -> Dict[str, int]:
+                if isinstance(value, Blob) or (self._chunk_size is not None and value.nbytes > self._chunk_size):
+                    blob = value if isinstance(value, Blob) else Blob(value, stream=False)
+                    sender = self._sender(websocket, blob)
+                    transfers.append(sender)
+                    return {BLOB if blob.stream else CHUNK: sender.id}
+                frames.append(value)
+                return {ATTACH: len(frames) - 1}
+
+            msg = lift(msg, self._lift_threshold if codec.serializes else sys.maxsize, place)
+            if frames or transfers:
+                msg = header(msg, len(transfers), len(frames))
+        default = self._encoder.default
+        if items is not None and codec.serializes:
+            msg, default = items.wrap(msg), items.default
+        data = codec.dumps(msg, default)
+        self._metrics.encode_time += time.perf_counter() - start
+        self._metrics.encoded += 1
+        return data, frames, transfers
+
+    def _sender(self, websocket: T, blob: Blob) -> ChunkSender:
+        codec = self._codec_for(websocket)
+
+        async def send(msg: Dict[str, Any], frames: List[Any]):
+            await self._send(websocket, codec.dumps(msg), frames)
+
+        return ChunkSender(self._pending.reserve(), blob, self._chunk_size or 1 << 20, self._chunk_window, send)
+
+    def _decode(self, websocket: T, data: Union[bytes, str]) -> Message:
+        start = time.perf_counter()
+        message = orjson.loads(data) if isinstance(data, str) else self._codec_for(websocket).loads(data)
+        self._metrics.decode_time += time.perf_counter() - start
+        self._metrics.decoded += 1
+        return message
+
+    def _codec_for(self, websocket: T) -> BaseCodec:
+        return self._codecs.get(websocket, self._codec)
+
+    def _relay_target(self, proxy: BaseProxy[BaseDataTrans]) -> Optional[str]:
+        if not self._relay or self._client is None:
+            return None
+        owner = self._planner.target(proxy._obj)
+        return owner[1] if owner is not None else None
+
+    def _register_template(self, websocket: T, message: RpcMessage):
+        try:
+            self._templates.register(websocket, message.template, message.method)
+        except Exception as e:
+            logger.error(e)
+
+    def _websocket_for(self, proxy: BaseProxy[BaseDataTrans]) -> Any:
+        if self._client is not None:
+            return self._client.ws
+        elif self._server is not None:
+            name = getattr(proxy, "_name", None)
+            if name is None:
+                raise JsonRpcRuntimeException("client name is None")
+            node = self._peer_of(name)
+            if node is not None:
+                raise JsonRpcRuntimeException(f"client {name} is connected to peer {node}, streams are not routed across peers")
+            try:
+                return self._server.active_connections.get_ws(name)
+            except KeyError:
+                raise JsonRpcRuntimeException(f"client {name} is not connected") from None
+        raise JsonRpcInitException("server and client are None")
+
+    def prepare(self, proxy: ProxyObj) -> PreparedCall:
+        return PreparedCall(proxy, next(self._template_ids))
+
+    async def call_prepared(self, prepared: PreparedCall, params: List[Any]) -> ResultProxy:
+        proxy = prepared.proxy
+        name = getattr(proxy, "_name", None) if self._server is not None else None
+        node = self._peer_of(name) if name is not None else None
+        if node is not None:
+            remote: Dict[str, Any] = {"jsonrpc": proxy._jsonrpc, "id": None, "method": prepared.bind(params)}
+            if proxy._vision:
+                remote["retain"] = False
+            if proxy._order is not None:
+                remote["order"] = proxy._order
+            with self._metrics.call(CALLER, prepared.name) as call:
+                result = await self._remote(node, name, remote, proxy._timeout) # type: ignore
+                call.error = result._result.is_error
+                return result
+        websocket = self._websocket_for(proxy)
+        call_id, future = self._pending.create(websocket, proxy._timeout)
+
+        msg: Dict[str, Any] = {"id": call_id, "jsonrpc": proxy._jsonrpc}
+        if any(isinstance(param, BaseProxy) for param in params):
+            msg["method"] = prepared.bind(params)
+        else:
+            msg["template"] = prepared.id
+            msg["params"] = params
+            if websocket not in prepared.sent:
+                msg["method"] = prepared.method
+        if proxy._vision:
+            msg["retain"] = False
+        if proxy._order is not None:
+            msg["order"] = proxy._order
+
+        try:
+            with self._metrics.call(CALLER, prepared.name) as call:
+                self._payload_log("send", msg)
+                await self._send(websocket, *self._encode(websocket, msg))
+                result: ResultProxy = await future
+                call.error = result._result.is_error
+        finally:
+            self._pending.discard(call_id)
+        if "template" in msg:
+            if not result._result.is_error:
+                prepared.sent.add(websocket)
+            elif "method" not in msg and "unknown template" in str(result._result.error):
+                prepared.sent.discard(websocket)
+                return await self.call_prepared(prepared, params)
+        return result
+
+    async def stream(self, proxy: BaseProxy[BaseDataTrans], window: Optional[int] = None) -> RemoteStream:
+        if proxy._obj is None:
+            raise JsonRpcInitException("proxy._obj is None")
+        websocket = self._websocket_for(proxy)
+
+        window = window or self._stream_window
+        to = self._relay_target(proxy)
+        call_id, future = self._pending.create(websocket, 0)
+        stream = self._streams[call_id] = RemoteStream(self, websocket, call_id, future, window, to)
+
+        msg: Dict[str, Any] = {} if to is None else {"to": to}
+        msg.update({
+            "id": call_id,
+            "jsonrpc": proxy._jsonrpc,
+            "method": proxy._obj.dumps(),
+            "stream": window,
+            "retain": False,
+        })
+        try:
+            self._payload_log("send", msg)
+            await self._send(websocket, *self._encode(websocket, msg))
+        except BaseException:
+            self._streams.pop(call_id, None)
+            self._pending.discard(call_id)
+            raise
+        return stream
+
+    def _item_fallback(self, websocket: T, key: str, result: Any, error: Exception) -> Dict[str, Any]:
+        if isinstance(error, HandleResult):
+            self._results.put(websocket, key, result)
+            return {"result": None, "handle": key}
+        logger.error(error)
+        return {"error": {"code": JsonRpcCode.InternalError, "message": f"result encode error: {error}"}}
+
+    def _encode_result(self, websocket: T, message: RpcMessage, msg: Dict[str, Any], result: Any) -> Tuple[bytes, List[Frame], List[ChunkSender]]:
+        try:
+            return self._encode(websocket, msg)
+        except HandleResult:
+            self._results.put(websocket, message.id, result)
             msg = {
-                "jsonrpc": message.jsonrpc,
                 "id": message.id,
-                "result": self._pretreatment(result)
+                "jsonrpc": message.jsonrpc,
+                "result": None,
+                "handle": str(message.id),
             }
-        else:
+        except Exception as e:
+            logger.error(e)
             msg = {
-                "jsonrpc": message.jsonrpc,
                 "id": message.id,
-                "error": error
+                "jsonrpc": message.jsonrpc,
+                "error": {"code": JsonRpcCode.InternalError, "message": f"result encode error: {e}"}
             }
+        return self._codec_for(websocket).dumps(msg), [], []
 
-        if self._client is not None:
-            logger.debug(f"send: {msg}")
-            await self._client.send_json(msg) 
+    async def _send(self, websocket: T, data: bytes, attachments: Optional[List[Frame]] = None, transfers: Optional[List[ChunkSender]] = None):
+        compression = self._compressions.get(websocket)
+        if compression is not None:
+            data = compression.compress(data)
+        lock = self._send_locks.get(websocket)
+        if attachments:
+            if lock is None:
+                lock = self._send_locks[websocket] = asyncio.Lock()
+            async with lock:
+                await self._write(websocket, data)
+                for frame in attachments:
+                    await self._write(websocket, frame)
+        elif lock is not None and lock.locked():
+            async with lock:
+                await self._write(websocket, data)
+        else:
+            await self._write(websocket, data)
+        for sender in transfers or ():
+            self._transfers.start(websocket, sender)
+
+    async def _write(self, websocket: T, data: Frame):
+        traffic = self._metrics.connection(websocket)
+        traffic.frames_out += 1
+        traffic.bytes_out += _size(data)
+        if self._server is not None:
+            await self._server.send_bytes(websocket, data) # type: ignore
+        elif self._client is not None:
+            await self._client.send_bytes(data) # type: ignore
+        else:
+            raise JsonRpcInitException("server and client are None")
 
     def on_client_close(self, websocket: T):
-        del self._namespace.locals[websocket]
+        self._close(websocket, "server connection closed")
     
     def on_server_close(self, websocket: T):
-        del self._namespace.locals[websocket]
+        if self._peers is not None and self._server is not None:
+            info = self._server.active_connections.infos.get(websocket)
+            if info is not None and info.name is not None:
+                self._peers.release(info.name)
+        self._close(websocket, "client connection closed")
+        if self._relays and self._loop:
+            self._loop.create_task(self._drop_relays(websocket))
+
+    def _close(self, websocket: T, reason: str):
+        self._namespace.drop(websocket)
+        self._templates.drop(websocket)
+        self._results.drop(websocket)
+        self._codecs.pop(websocket, None)
+        self._compressions.pop(websocket, None)
+        self._metrics.drop(websocket)
+        self._send_locks.pop(websocket, None)
+        self._transfers.drop(websocket, JsonRpcClosedException(reason))
+        self._pending.fail(websocket, JsonRpcClosedException(reason))
+        executor = self._executors.pop(websocket, None)
+        if executor is not None:
+            executor.close()
+        for producer in self._producers.pop(websocket, {}).values():
+            producer.cancel()
+
+    def _scope(self, websocket: T):
+        return self._namespace.scope(websocket, self._results.bucket(websocket))
 
-    async def run(self, proxy: BaseProxy[BaseDataTrans]):
-        uuid_str = str(uuid4())
+    def result_stats(self) -> Dict[str, Any]:
+        return self._results.stats()
+
+    def offload_stats(self) -> Dict[str, Any]:
+        return self._offload.stats()
+
+    def transfer_stats(self) -> Dict[str, Any]:
+        return self._transfers.stats()
+
+    def compression_stats(self) -> Dict[str, Any]:
+        """
+        Compression ratio and CPU time of every compressed connection, by
+        peer name (`"server"` on a client).
+        """
+        return {self._peer_name(websocket): compression.stats() for websocket, compression in self._compressions.items()}
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Call counts, errors and latencies per method, traffic per
+        connection, codec time and the current in-flight calls and queue
+        depths. Also callable remotely as `rpc_metrics()`.
+        """
+        gauges = {
+            "pending_calls": len(self._pending),
+            "executing_calls": {self._peer_name(ws): executor.in_flight for ws, executor in self._executors.items()},
+            "queue_depth": {self._peer_name(ws): executor.depth for ws, executor in self._executors.items()},
+            "relays": len(self._relays),
+            "transfers": len(self._transfers.outgoing) + len(self._transfers.incoming),
+        }
+        return self._metrics.snapshot(gauges, self._peer_name)
+
+    def metrics_text(self) -> str:
+        return to_prometheus(self.metrics())
+
+    def _peer_name(self, websocket: T) -> str:
+        if self._server is None:
+            return "server"
+        try:
+            return self._server.active_connections.get_name(websocket)
+        except KeyError:
+            return str(websocket)
+
+    def relay_stats(self) -> Dict[str, Any]:
+        return {"active": len(self._relays), "forwarded": self._relays.forwarded}
+
+    def peer_stats(self) -> Dict[str, Any]:
+        return self._peers.stats() if self._peers is not None else {}
+
+    async def run(self, proxy: BaseProxy[BaseDataTrans], retain: bool = True, timeout: Optional[float] = None, order: Optional[str] = None) -> ResultProxy:
         if proxy._obj is None:
             raise JsonRpcInitException("proxy._obj is None")
+        if self._client is None:
+            raise JsonRpcInitException("server and client are None R")
         data = proxy._obj.dumps()
-        event = asyncio.Event()
+        to = None if retain else self._relay_target(proxy)
 
-        self._wait_remote[uuid_str] = event
+        call_id, future = self._pending.create(self._client.ws, timeout)
 
-        msg = {
+        msg: Dict[str, Any] = {} if to is None else {"to": to}
+        msg.update({
+            "id": call_id,
             "jsonrpc": proxy._jsonrpc,
-            "id": uuid_str,
             "method": data,
-        }
-
-        if self._client is not None:
-            logger.debug(f"send: {msg}")
-            await self._client.send_json(msg)
-        else:
-            raise JsonRpcInitException("server and client are None R")
+        })
+        if not retain:
+            msg["retain"] = False
+        if order is not None:
+            msg["order"] = order
 
-        await event.wait()
-
-        return self._wait_result.pop(uuid_str)
+        try:
+            with self._metrics.call(CALLER, method_name(data)) as call:
+                self._payload_log("send", msg)
+                await self._send(self._client.ws, *self._encode(self._client.ws, msg))
+                result: ResultProxy = await future
+                call.error = result._result.is_error
+        finally:
+            self._pending.discard(call_id)
+        if to is not None:
+            result._by = to
+        return result
  
-    async def reverse_run(self, name: str, proxy: BaseProxy[BaseDataTrans]):
-        uuid_str = str(uuid4())
+    async def reverse_run(self, name: str, proxy: BaseProxy[BaseDataTrans], retain: bool = True, timeout: Optional[float] = None, order: Optional[str] = None) -> ResultProxy:
         if proxy._obj is None:
             raise JsonRpcInitException("proxy._obj is None")
+        if self._server is None:
+            raise JsonRpcInitException("server and client are None S")
         data = proxy._obj.dumps()
-        event = asyncio.Event()
-
-        self._wait_remote[uuid_str] = event
-
-        msg = {
+        msg: Dict[str, Any] = {
             "jsonrpc": proxy._jsonrpc,
-            "id": uuid_str,
+            "id": None,
             "method": data,
         }
+        if not retain:
+            msg["retain"] = False
+        if order is not None:
+            msg["order"] = order
 
-        if self._server is not None:
-            logger.debug(f"send: {msg}")
-            await self._server.send_json(self._server.active_connections.get_ws(name), msg)
-        else:
-            raise JsonRpcInitException("server and client are None S")
+        node = self._peer_of(name)
+        if node is not None:
+            with self._metrics.call(CALLER, method_name(data)) as call:
+                result = await self._remote(node, name, msg, timeout)
+                call.error = result._result.is_error
+                return result
 
-        await event.wait()
+        websocket = self._server.active_connections.get_ws(name)
+        call_id, future = self._pending.create(websocket, timeout)
+        msg["id"] = call_id
+        try:
+            with self._metrics.call(CALLER, method_name(data)) as call:
+                self._payload_log("send", msg)
+                await self._send(websocket, *self._encode(websocket, msg))
+                result: ResultProxy = await future
+                call.error = result._result.is_error
+                return result
+        finally:
+            self._pending.discard(call_id)
 
-        return self._wait_result.pop(uuid_str)
+    def _peer_of(self, name: str) -> Optional[str]:
+        """
+        The peer holding client `name` when it is not connected here.
+        """
+        if self._peers is None or self._server is None or name in self._server.active_connections.name_ws:
+            return None
+        return self._peers.owner(name)
 
-    async def _client_auth(self, event: asyncio.Event, qmgs: asyncio.Queue, websocket: T):
-        await event.wait()
-        if self._server is not None:
-            Context.name.set(self._server.active_connections.get_name(websocket))
-        while True:
-            msg = await qmgs.get()
-            await self._s_execute(websocket, msg)
-
-    def _pretreatment(self, data: Any) -> Any:
-        class BytesEncoder(json.JSONEncoder):
-            def default(self, obj):
-                if isinstance(obj, bytes):
-                    return None
-                return super().default(obj)
+    async def _remote(self, node: str, name: str, msg: Dict[str, Any], timeout: Optional[float]) -> ResultProxy:
+        self._payload_log("send", msg)
+        response = await self._peers.call(node, name, msg, self._pending.timeout if timeout is None else timeout) # type: ignore
+        self._payload_log("receive", response)
+        return ResultProxy(RpcMessage(response), core=self, by=name)
+
+    async def _route(self, name: str, msg: Dict[str, Any], timeout: Optional[float]) -> Message:
+        """
+        Make a call a peer forwarded to our client `name`; returns the raw
+        response, whose id stays valid for calls on a retained result.
+        """
+        if self._server is None:
+            raise JsonRpcInitException("server is None")
+        websocket = self._server.active_connections.get_ws(name)
+        call_id, future = self._pending.create(websocket, timeout)
+        msg["id"] = call_id
         try:
-            json.dumps(data, cls=BytesEncoder)
-            return data
-        except TypeError:
-            return str(data)
+            await self._send(websocket, *self._encode(websocket, msg))
+            result: ResultProxy = await future
+        finally:
+            self._pending.discard(call_id)
+        return result._result.data
+
+    async def batch(self, proxies: Iterable[BaseProxy[BaseDataTrans]], timeout: Optional[float] = None, return_exceptions: bool = False) -> List[Any]:
+        proxies = list(proxies)
+        groups: Dict[Optional[str], List[int]] = {}
+        for index, proxy in enumerate(proxies):
+            if proxy._obj is None:
+                raise JsonRpcInitException("proxy._obj is None")
+            groups.setdefault(getattr(proxy, "_name", None) if self._server is not None else None, []).append(index)
+
+        results: List[Any] = [None] * len(proxies)
+
+        async def call(name: Optional[str], indexes: List[int]):
+            msg: Dict[str, Any] = {
+                "jsonrpc": proxies[indexes[0]]._jsonrpc,
+                "id": None,
+                "batch": [proxies[i]._obj.dumps() for i in indexes],
+                "retain": False,
+            }
+            if self._client is not None:
+                websocket = self._client.ws
+            elif self._server is not None:
+                if name is None:
+                    raise JsonRpcInitException("client name is None")
+                node = self._peer_of(name)
+                if node is not None:
+                    with self._metrics.call(CALLER, "<batch>") as call:
+                        response = await self._remote(node, name, msg, timeout)
+                        call.error = response._result.is_error
+                    return unpack(response, indexes)
+                websocket = self._server.active_connections.get_ws(name)
+            else:
+                raise JsonRpcInitException("server and client are None")
+
+            call_id, future = self._pending.create(websocket, timeout)
+            msg["id"] = call_id
+            try:
+                with self._metrics.call(CALLER, "<batch>") as call:
+                    self._payload_log("send", msg)
+                    await self._send(websocket, *self._encode(websocket, msg))
+                    response: ResultProxy = await future
+                    call.error = response._result.is_error
+            finally:
+                self._pending.discard(call_id)
+            unpack(response, indexes)
+
+        def unpack(response: ResultProxy, indexes: List[int]):
+            if response._result.is_error:
+                raise JsonRpcRuntimeException(response._result.error)
+            for index, item in zip(indexes, response._result.results):
+                proxy = ResultProxy(RpcMessage({"id": response._result.id, **item}), core=self, by=response._by) # type: ignore
+                try:
+                    results[index] = proxy.visions
+                except Exception as e:
+                    if not return_exceptions:
+                        raise
+                    results[index] = e
+
+        await asyncio.gather(*(call(name, indexes) for name, indexes in groups.items()))
+        return results
+
+    async def _client_auth(self, event: asyncio.Event, executor: ConnectionExecutor, websocket: T):
+        await event.wait()
+        if self._server is None:
+            raise JsonRpcInitException("server is None")
+        Context.name.set(self._server.active_connections.get_name(websocket))
+        info = self._server.active_connections.info(websocket)
+
+        async def execute(msg: RpcMessage):
+            info.in_flight += 1
+            try:
+                await self._execute(websocket, msg)
+            finally:
+                info.in_flight -= 1
+
+        executor.start(execute)
 
     def is_server(self) -> bool:
         if self._server is None and self._client is None:
@@ -271,6 +1114,10 @@ class JsonRpc(BaseJsonRpc, Generic[T]):
             return True
         return False
 
+    @property
+    def encoder(self) -> ResultEncoder:
+        return self._encoder
+
     @property
     def jsonast(self):
         return ProxyObj(self) # type: ignore
@@ -0,0 +1,92 @@
+from typing import Any, Callable, Dict, Type, Union
+
+Fallback = Union[str, Callable[[Any], Any]]
+
+class HandleResult(Exception):
+    ...
+
+class ResultEncoder:
+    """
+    Fallback for values the wire codec cannot encode natively.
+
+    The codec calls `default` only for unknown types, so a result is
+    serialized exactly once. The fallback chosen for a type (a custom
+    encoder, `"str"` or `"handle"`) is looked up along its MRO the first
+    time the type is seen and cached afterwards. A `"handle"` fallback
+    keeps the whole result on the callee and answers with a reference.
+    """
+
+    def __init__(self, fallback: Fallback = "str") -> None:
+        self.fallback = fallback
+        self._encoders: Dict[type, Fallback] = {
+            set: list,
+            frozenset: list,
+            bytearray: bytes,
+            memoryview: bytes,
+        }
+        self._cache: Dict[type, Callable[[Any], Any]] = {}
+
+    def register(self, tp: Type, fallback: Fallback) -> None:
+        self._encoders[tp] = fallback
+        self._cache.clear()
+
+    def default(self, obj: Any) -> Any:
+        func = self._cache.get(type(obj))
+        if func is None:
+            func = self._cache[type(obj)] = self._resolve(type(obj))
+        return func(obj)
+
+    def _resolve(self, tp: type) -> Callable[[Any], Any]:
+        for base in tp.__mro__:
+            if base in self._encoders:
+                return self._compile(self._encoders[base])
+        return self._compile(self.fallback)
+
+    @staticmethod
+    def _compile(fallback: Fallback) -> Callable[[Any], Any]:
+        if fallback == "str":
+            return str
+        elif fallback == "handle":
+            return _handle
+        elif callable(fallback):
+            return fallback
+        raise ValueError(f"unknown fallback: {fallback}")
+
+def _handle(obj: Any) -> Any:
+    raise HandleResult(obj)
+
+class _Slot:
+    __slots__ = ("index", "item")
+
+    def __init__(self, index: int, item: Any) -> None:
+        self.index = index
+        self.item = item
+
+class BatchItems:
+    """
+    Default hook for encoding a batch response in one pass. Each item is
+    wrapped so the codec reports which one it is in; a fallback failing
+    inside an item is recorded in `failed` and encoded as `None`, instead
+    of aborting the whole frame.
+    """
+
+    def __init__(self, default: Callable[[Any], Any]) -> None:
+        self._default = default
+        self.index = -1
+        self.failed: Dict[int, Exception] = {}
+
+    def wrap(self, msg: Dict[str, Any]) -> Dict[str, Any]:
+        self.index = -1
+        return {**msg, "results": [_Slot(index, item) for index, item in enumerate(msg["results"])]}
+
+    def default(self, obj: Any) -> Any:
+        if type(obj) is _Slot:
+            self.index = obj.index
+            return obj.item
+        try:
+            return self._default(obj)
+        except Exception as e:
+            if self.index < 0:
+                raise
+            self.failed.setdefault(self.index, e)
+            return None
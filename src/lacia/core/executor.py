@@ -0,0 +1,88 @@
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Set
+
+from lacia.logger import logger
+from lacia.types import RpcMessage
+
+class ConnectionExecutor:
+    """
+    Runs the requests of one connection concurrently, at most `limit` at a
+    time. Requests carrying the same ordering key run one after another in
+    arrival order.
+    """
+
+    def __init__(self, limit: int = 64) -> None:
+        self.limit = limit
+        self.queue: "asyncio.Queue[RpcMessage]" = asyncio.Queue()
+        self.in_flight = 0
+        self._sem = asyncio.Semaphore(limit)
+        self._tasks: Set[asyncio.Task] = set()
+        self._ordered: Dict[Hashable, Deque[Awaitable]] = {}
+        self._drainer: Optional[asyncio.Task] = None
+
+    def put(self, message: RpcMessage) -> None:
+        self.queue.put_nowait(message)
+
+    def start(self, execute: Callable[[RpcMessage], Awaitable[Any]]) -> None:
+        self._drainer = asyncio.get_running_loop().create_task(self._drain(execute))
+
+    async def submit(self, coro: Awaitable, key: Optional[Hashable] = None) -> None:
+        if key is None:
+            await self._sem.acquire()
+            self._spawn(self._run(coro))
+            return
+        queue = self._ordered.get(key)
+        if queue is None:
+            self._ordered[key] = deque((coro,))
+            self._spawn(self._run_ordered(key))
+        else:
+            queue.append(coro)
+
+    def close(self) -> None:
+        if self._drainer is not None:
+            self._drainer.cancel()
+        for task in tuple(self._tasks):
+            task.cancel()
+        for queue in self._ordered.values():
+            for coro in queue:
+                coro.close() # type: ignore
+        self._ordered.clear()
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize() + sum(len(i) for i in self._ordered.values())
+
+    async def _drain(self, execute: Callable[[RpcMessage], Awaitable[Any]]) -> None:
+        while True:
+            msg = await self.queue.get()
+            await self.submit(execute(msg), msg.order)
+
+    def _spawn(self, coro: Awaitable) -> None:
+        task = asyncio.get_running_loop().create_task(coro) # type: ignore
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, coro: Awaitable) -> None:
+        self.in_flight += 1
+        try:
+            await coro
+        except Exception as e:
+            logger.error(e)
+        finally:
+            self.in_flight -= 1
+            self._sem.release()
+
+    async def _run_ordered(self, key: Hashable) -> None:
+        queue = self._ordered[key]
+        while queue:
+            coro = queue.popleft()
+            async with self._sem:
+                self.in_flight += 1
+                try:
+                    await coro
+                except Exception as e:
+                    logger.error(e)
+                finally:
+                    self.in_flight -= 1
+        del self._ordered[key]
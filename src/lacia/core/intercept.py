@@ -0,0 +1,41 @@
+from functools import partial
+from typing import Any, Callable, Dict, List
+
+STAGES = ("receive", "decode", "execute", "encode", "send")
+
+Interceptor = Callable[..., Any]
+
+class Interceptors:
+    """
+    Interceptors per stage, each called as `interceptor(call_next, *args)`
+    and expected to return `call_next(*args)` (awaited on the async
+    `execute` and `send` stages) unless it handles the call itself.
+
+    A stage is compiled into one direct call chain whenever its list
+    changes; a stage without interceptors compiles to its terminal.
+    """
+
+    def __init__(self) -> None:
+        self.chains: Dict[str, List[Interceptor]] = {stage: [] for stage in STAGES}
+
+    def add(self, stage: str, interceptor: Interceptor, first: bool = False) -> None:
+        chain = self._chain(stage)
+        if first:
+            chain.insert(0, interceptor)
+        else:
+            chain.append(interceptor)
+
+    def remove(self, stage: str, interceptor: Interceptor) -> None:
+        self._chain(stage).remove(interceptor)
+
+    def compile(self, stage: str, terminal: Callable[..., Any]) -> Callable[..., Any]:
+        call = terminal
+        for interceptor in reversed(self._chain(stage)):
+            call = partial(interceptor, call)
+        return call
+
+    def _chain(self, stage: str) -> List[Interceptor]:
+        chain = self.chains.get(stage)
+        if chain is None:
+            raise ValueError(f"unknown stage: {stage}, expected one of {', '.join(STAGES)}")
+        return chain
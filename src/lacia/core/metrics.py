@@ -0,0 +1,213 @@
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+
+CALLER, CALLEE = "caller", "callee"
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def method_name(method: Any) -> str:
+    """
+    Root name of a dumped JsonAst: the first attribute looked up on the
+    peer, e.g. `"Test"` for `Test(1).output("x")`. Calls on stored
+    results are all counted as `"<result>"`, not by result id.
+    """
+    while isinstance(method, dict):
+        obj = method.get("obj")
+        if not isinstance(obj, dict):
+            args = method.get("args")
+            if method.get("method") == "__getattr__" and args:
+                name = args[0]
+                return name if isinstance(name, str) and name.isidentifier() else "<result>"
+            break
+        method = obj
+    return "<unknown>"
+
+class Histogram:
+    """
+    Latencies in seconds over the fixed `BUCKETS`, as Prometheus expects.
+    """
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the `q` quantile.
+        """
+        rank, seen = q * self.count, 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf") if self.count else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "buckets": list(self.counts),
+        }
+
+class MethodStats:
+    __slots__ = ("calls", "errors", "latency")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.latency = Histogram()
+
+class Call:
+    """
+    Times one call, counted as an error if it raises or `error` is set.
+    """
+
+    __slots__ = ("metrics", "side", "method", "error", "start")
+
+    def __init__(self, metrics: "Metrics", side: str, method: str) -> None:
+        self.metrics = metrics
+        self.side = side
+        self.method = method
+        self.error = False
+
+    def __enter__(self) -> "Call":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, tp, value, tb) -> None:
+        self.metrics.record(self.side, self.method, time.perf_counter() - self.start, self.error or tp is not None)
+
+class ConnectionStats:
+    __slots__ = ("bytes_in", "bytes_out", "frames_in", "frames_out")
+
+    def __init__(self) -> None:
+        self.bytes_in = self.bytes_out = 0
+        self.frames_in = self.frames_out = 0
+
+class Metrics:
+    """
+    Counters of one `JsonRpc`: calls, errors and latencies per method on
+    both sides, traffic per connection and time spent encoding and
+    decoding messages. Gauges are read from the core at snapshot time.
+    Past `max_methods` names per side, new ones are counted as
+    `"<unknown>"`.
+    """
+
+    def __init__(self, max_methods: int = 1024) -> None:
+        self.max_methods = max_methods
+        self.methods: Dict[str, Dict[str, MethodStats]] = {CALLER: {}, CALLEE: {}}
+        self.connections: Dict[Hashable, ConnectionStats] = {}
+        self.encode_time = self.decode_time = 0.0
+        self.encoded = self.decoded = 0
+
+    def call(self, side: str, method: str) -> Call:
+        return Call(self, side, method)
+
+    def record(self, side: str, method: str, seconds: float, error: bool = False) -> None:
+        methods = self.methods[side]
+        stats = methods.get(method)
+        if stats is None:
+            if len(methods) >= self.max_methods:
+                method = "<unknown>"
+                stats = methods.get(method)
+            if stats is None:
+                stats = methods[method] = MethodStats()
+        stats.calls += 1
+        if error:
+            stats.errors += 1
+        stats.latency.observe(seconds)
+
+    def connection(self, conn: Hashable) -> ConnectionStats:
+        stats = self.connections.get(conn)
+        if stats is None:
+            stats = self.connections[conn] = ConnectionStats()
+        return stats
+
+    def drop(self, conn: Hashable) -> None:
+        self.connections.pop(conn, None)
+
+    def snapshot(self, gauges: Dict[str, Any], name: Callable[[Hashable], str]) -> Dict[str, Any]:
+        return {
+            "methods": {
+                side: {
+                    method: {"calls": stats.calls, "errors": stats.errors, "latency": stats.latency.snapshot()}
+                    for method, stats in methods.items()
+                }
+                for side, methods in self.methods.items()
+            },
+            "connections": {
+                name(conn): {
+                    "bytes_in": stats.bytes_in,
+                    "bytes_out": stats.bytes_out,
+                    "frames_in": stats.frames_in,
+                    "frames_out": stats.frames_out,
+                }
+                for conn, stats in self.connections.items()
+            },
+            "codec": {
+                "encoded": self.encoded,
+                "encode_seconds": self.encode_time,
+                "decoded": self.decoded,
+                "decode_seconds": self.decode_time,
+            },
+            "gauges": gauges,
+        }
+
+def _labels(**labels: Any) -> str:
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def to_prometheus(snapshot: Dict[str, Any], prefix: str = "lacia") -> str:
+    """
+    A `Metrics.snapshot` in the Prometheus text exposition format.
+    """
+    lines: List[str] = []
+
+    def metric(name: str, kind: str, help: str, samples: List[Tuple[str, Any]]) -> None:
+        lines.append(f"# HELP {prefix}_{name} {help}")
+        lines.append(f"# TYPE {prefix}_{name} {kind}")
+        lines.extend(f"{prefix}_{name}{suffix} {value}" for suffix, value in samples)
+
+    methods = [(side, method, stats) for side, items in snapshot["methods"].items() for method, stats in items.items()]
+    metric("calls_total", "counter", "Calls per method and side.", [(_labels(side=side, method=method), stats["calls"]) for side, method, stats in methods])
+    metric("errors_total", "counter", "Failed calls per method and side.", [(_labels(side=side, method=method), stats["errors"]) for side, method, stats in methods])
+
+    samples: List[Tuple[str, Any]] = []
+    for side, method, stats in methods:
+        latency, cumulative = stats["latency"], 0
+        for bound, count in zip(BUCKETS + (float("inf"),), latency["buckets"]):
+            cumulative += count
+            samples.append((f"_bucket{_labels(side=side, method=method, le='+Inf' if bound == float('inf') else bound)}", cumulative))
+        samples.append((f"_sum{_labels(side=side, method=method)}", latency["sum"]))
+        samples.append((f"_count{_labels(side=side, method=method)}", latency["count"]))
+    metric("call_seconds", "histogram", "Call latency per method and side.", samples)
+
+    connections = snapshot["connections"].items()
+    for field, help in (("bytes_in", "Bytes received."), ("bytes_out", "Bytes sent."), ("frames_in", "Frames received."), ("frames_out", "Frames sent.")):
+        metric(f"connection_{field}_total", "counter", help, [(_labels(peer=peer), stats[field]) for peer, stats in connections])
+
+    codec = snapshot["codec"]
+    metric("encode_seconds_total", "counter", "Time spent encoding messages.", [("", codec["encode_seconds"])])
+    metric("encoded_total", "counter", "Messages encoded.", [("", codec["encoded"])])
+    metric("decode_seconds_total", "counter", "Time spent decoding messages.", [("", codec["decode_seconds"])])
+    metric("decoded_total", "counter", "Messages decoded.", [("", codec["decoded"])])
+
+    for name, value in snapshot["gauges"].items():
+        if isinstance(value, dict):
+            metric(name, "gauge", f"{name.replace('_', ' ').capitalize()}.", [(_labels(peer=peer), count) for peer, count in value.items()])
+        else:
+            metric(name, "gauge", f"{name.replace('_', ' ').capitalize()}.", [("", value)])
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,100 @@
+import asyncio
+import contextvars
+from enum import Enum
+from functools import partial
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+class Policy(str, Enum):
+    inline = "inline"
+    thread = "thread"
+    process = "process"
+
+class Pool:
+
+    def __init__(self, factory: Callable[[], Executor], workers: Optional[int]) -> None:
+        self._factory = factory
+        self._executor: Optional[Executor] = None
+        self.workers = workers
+        self.pending = 0
+        self.completed = 0
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = self._factory()
+            self.workers = getattr(self._executor, "_max_workers", self.workers)
+        return self._executor
+
+    async def call(self, func: Callable) -> Any:
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func)
+        finally:
+            self.pending -= 1
+            self.completed += 1
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "started": self._executor is not None,
+            "workers": self.workers,
+            "pending": self.pending,
+            "completed": self.completed,
+        }
+
+class Offload:
+    """
+    Decides where synchronous namespace callables run: inline on the event
+    loop, on a thread pool or on a process pool.
+    """
+
+    def __init__(
+        self,
+        default: Union[Policy, str] = Policy.inline,
+        max_threads: Optional[int] = None,
+        max_processes: Optional[int] = None,
+    ) -> None:
+        self.default = Policy(default)
+        self._policies: Dict[Any, Policy] = {}
+        self.thread = Pool(partial(ThreadPoolExecutor, max_threads, "lacia"), max_threads)
+        self.process = Pool(partial(ProcessPoolExecutor, max_processes), max_processes)
+
+    def set(self, func: Callable, policy: Union[Policy, str]) -> None:
+        self._policies[self._key(func)] = Policy(policy)
+
+    def policy(self, func: Callable) -> Policy:
+        if not self._policies:
+            return self.default
+        try:
+            return self._policies.get(self._key(func), self.default)
+        except TypeError:
+            return self.default
+
+    async def call(self, func: Callable, args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> Any:
+        policy = self.policy(func)
+        if policy is Policy.inline:
+            return func(*args, **kwargs)
+        elif policy is Policy.thread:
+            ctx = contextvars.copy_context()
+            return await self.thread.call(partial(ctx.run, func, *args, **kwargs))
+        return await self.process.call(partial(func, *args, **kwargs))
+
+    def shutdown(self) -> None:
+        self.thread.shutdown()
+        self.process.shutdown()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "default": self.default.value,
+            "thread": self.thread.stats(),
+            "process": self.process.stats(),
+        }
+
+    @staticmethod
+    def _key(func: Callable) -> Any:
+        return getattr(func, "__func__", func)
@@ -0,0 +1,311 @@
+import os
+import hmac
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Coroutine, Dict, List, Optional, Set, Tuple
+
+from lacia.core.pending import PendingCalls
+from lacia.network.codec import available_codecs, get_codec
+from lacia.network.server.streamserver import StreamSocket, tune
+from lacia.logger import logger
+from lacia.types import Message
+from lacia.exception import JsonRpcInitException, JsonRpcRuntimeException, JsonRpcWsConnectException
+
+Handler = Callable[[str, Message, Optional[float]], Awaitable[Message]]
+
+def parse_address(address: str) -> Tuple[str, Any]:
+    """
+    `("unix", path)` for `unix:///path`, `("tcp", (host, port))` for
+    `tcp://host:port`.
+    """
+    scheme, _, rest = address.partition("://")
+    if scheme == "unix":
+        return scheme, rest
+    if scheme == "tcp":
+        host, _, port = rest.rpartition(":")
+        return scheme, (host.strip("[]"), int(port))
+    raise ValueError(f"unsupported peer address: {address}")
+
+async def open_address(address: str, buffer: int) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    scheme, target = parse_address(address)
+    if scheme == "unix":
+        return await asyncio.open_unix_connection(target, limit=buffer)
+    return await asyncio.open_connection(*target, limit=buffer)
+
+async def listen(address: str, handler: Callable[..., Coroutine], buffer: int) -> asyncio.AbstractServer:
+    scheme, target = parse_address(address)
+    if scheme == "unix":
+        return await asyncio.start_unix_server(handler, target, limit=buffer)
+    return await asyncio.start_server(handler, *target, limit=buffer)
+
+class Peers:
+    """
+    Mesh of servers sharing one registry of client names, so a call to a
+    client held by another server is forwarded to it.
+
+    Every node links to every other node at its `addresses` entry. A link
+    first carries the names its sender holds, then each claim and release.
+    Claims are versioned by a Lamport clock, so a claim made after another
+    node's claim was seen always wins, whatever the hosts' clocks say; ties
+    go to the greater node name. A forwarded call is one request to the
+    holding node, which makes the call and returns the raw response.
+
+    `addresses` may hold only this node when it joins through `seeds`:
+    links exchange the addresses they know, so nodes started with any
+    running member as seed end up fully meshed. `close` leaves the mesh.
+
+    Every accepted link is challenged with a nonce and must answer with its
+    HMAC under the shared `secret` (the `JsonRpc` token unless given)
+    before anything it sends is served. Nodes listening on TCP require a
+    secret.
+    """
+
+    def __init__(
+        self,
+        node: str,
+        addresses: Dict[str, str],
+        codec: Optional[str] = None,
+        max_msg_size: int = 64 * 1024 * 1024,
+        buffer: int = 1024 * 1024,
+        retry: float = 0.5,
+        seeds: Optional[List[str]] = None,
+        secret: Optional[str] = None,
+    ) -> None:
+        self.node = node
+        self.secret = secret
+        self.addresses = dict(addresses)
+        self.seeds = [seed for seed in seeds or () if seed != self.addresses[node]]
+        self.left: Set[str] = set()
+        self.codec = get_codec(codec or available_codecs()[0])
+        self.max_msg_size = max_msg_size
+        self.buffer = buffer
+        self.retry = retry
+        self.clock = 0
+        self.names: Dict[str, int] = {}
+        self.owners: Dict[str, Tuple[str, int]] = {}
+        self.links: Dict[str, StreamSocket] = {}
+        self.accepted: Set[StreamSocket] = set()
+        self.forwarded = 0
+        self._pending = PendingCalls()
+        self._handler: Optional[Handler] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def start(self, handler: Handler) -> None:
+        """
+        Listen for peers and link to each of them; `handler(name, message,
+        timeout)` makes the calls forwarded to this node.
+        """
+        if self.secret is None and parse_address(self.addresses[self.node])[0] == "tcp":
+            raise JsonRpcInitException(f"peer {self.node} listens on TCP without a secret")
+        self._handler = handler
+        self._server = await listen(self.addresses[self.node], self._accept, self.buffer)
+        logger.info(f"peer {self.node} listening: {self.addresses[self.node]}")
+        for node in self.addresses:
+            if node != self.node:
+                self._spawn(self._link(node))
+        if self.seeds:
+            self._spawn(self._join())
+
+    def owner(self, name: str) -> Optional[str]:
+        """
+        The node holding `name`, `None` if it is held here or unknown.
+        """
+        entry = self.owners.get(name)
+        if entry is None or (name in self.names and (self.names[name], self.node) >= (entry[1], entry[0])):
+            return None
+        return entry[0]
+
+    def claim(self, name: str) -> None:
+        self.clock += 1
+        version = self.names[name] = self.clock
+        self._broadcast({"claim": name, "version": version})
+
+    def release(self, name: str) -> None:
+        if self.names.pop(name, None) is not None:
+            self._broadcast({"release": name})
+
+    async def call(self, node: str, name: str, message: Message, timeout: Optional[float] = None) -> Message:
+        """
+        Have `node` send `message` to its client `name`; returns the response.
+        """
+        link = self.links.get(node)
+        if link is None:
+            raise JsonRpcWsConnectException(f"peer {node} is not linked")
+        call_id, future = self._pending.create(node, timeout)
+        try:
+            await link.send(self.codec.dumps({"id": call_id, "to": name, "call": message, "timeout": timeout}))
+            response = await future
+        finally:
+            self._pending.discard(call_id)
+        self.forwarded += 1
+        return response
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "node": self.node,
+            "members": sorted(self.addresses),
+            "linked": sorted(self.links),
+            "names": len(self.names),
+            "remote_names": len(self.owners),
+            "forwarded": self.forwarded,
+        }
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        for task in tuple(self._tasks):
+            task.cancel()
+        data = self.codec.dumps({"leave": self.node})
+        for link in tuple(self.links.values()):
+            await self._send(link, data)
+            await link.close()
+        self.links.clear()
+        for link in tuple(self.accepted):
+            await link.close()
+
+    async def _link(self, node: str) -> None:
+        while self._server is not None and node in self.addresses:
+            try:
+                reader, writer = await open_address(self.addresses[node], self.buffer)
+            except OSError:
+                await asyncio.sleep(self.retry)
+                continue
+            tune(writer, self.buffer)
+            link = StreamSocket(reader, writer, self.max_msg_size)
+            try:
+                auth = self._sign(await link.receive())
+                await link.send(self.codec.dumps({"hello": self.node, "auth": auth, "names": dict(self.names), "members": dict(self.addresses)}))
+                self.links[node] = link
+                logger.info(f"peer {self.node} linked to {node}")
+                while True:
+                    self._on_response(self.codec.loads(await link.receive()))
+            except JsonRpcWsConnectException:
+                pass
+            if self.links.get(node) is link:
+                del self.links[node]
+            self._pending.fail(node, JsonRpcWsConnectException(f"peer {node} disconnected"))
+            await link.close()
+            logger.warning(f"peer {self.node} lost link to {node}")
+            await asyncio.sleep(self.retry)
+
+    async def _join(self) -> None:
+        """
+        Announce this node to the first reachable seed, which links back and
+        so passes on the members it knows.
+        """
+        while self._server is not None:
+            for seed in self.seeds:
+                try:
+                    reader, writer = await open_address(seed, self.buffer)
+                except OSError:
+                    continue
+                link = StreamSocket(reader, writer, self.max_msg_size)
+                try:
+                    auth = self._sign(await link.receive())
+                    await link.send(self.codec.dumps({"join": self.node, "auth": auth, "members": dict(self.addresses)}))
+                    logger.info(f"peer {self.node} joined through {seed}")
+                    return
+                except JsonRpcWsConnectException:
+                    pass
+                finally:
+                    await link.close()
+            await asyncio.sleep(self.retry)
+
+    def _meet(self, members: Dict[str, str], sender: Optional[str] = None) -> None:
+        """
+        Link to members not known yet; only `sender` itself updates its
+        own address or returns after leaving.
+        """
+        for node, address in members.items():
+            if node == self.node or (node in self.left and node != sender):
+                continue
+            self.left.discard(node)
+            known = self.addresses.get(node)
+            if known is None or node == sender:
+                self.addresses[node] = address
+            if known is None:
+                logger.info(f"peer {self.node} met {node}: {address}")
+                self._spawn(self._link(node))
+
+    def _sign(self, nonce: bytes) -> str:
+        return hmac.new((self.secret or "").encode(), nonce, hashlib.sha256).hexdigest()
+
+    def _on_response(self, message: Message) -> None:
+        if "error" in message:
+            self._pending.reject(message["id"], JsonRpcRuntimeException(message["error"]))
+        else:
+            self._pending.resolve(message["id"], message["response"])
+
+    async def _accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        tune(writer, self.buffer)
+        link = StreamSocket(reader, writer, self.max_msg_size)
+        self.accepted.add(link)
+        node: Optional[str] = None
+        try:
+            nonce = os.urandom(16)
+            await link.send(nonce)
+            message = self.codec.loads(await link.receive())
+            if not isinstance(message, dict) or not hmac.compare_digest(str(message.get("auth", "")), self._sign(nonce)):
+                logger.warning(f"peer {self.node} rejected unauthenticated link {link}")
+                return
+            if "join" in message:
+                self._meet(message["members"], message["join"])
+                return
+            node = message["hello"]
+            self._meet(message.get("members", {}), node)
+            for name, version in message["names"].items():
+                self._own(name, node, version)
+            while True:
+                message = self.codec.loads(await link.receive())
+                if "id" in message:
+                    self._spawn(self._serve(link, message))
+                elif "claim" in message:
+                    self._own(message["claim"], node, message["version"])
+                elif "release" in message:
+                    if self.owners.get(message["release"], (None,))[0] == node:
+                        del self.owners[message["release"]]
+                elif "leave" in message:
+                    self.left.add(node)
+                    self.addresses.pop(node, None)
+        except (JsonRpcWsConnectException, asyncio.CancelledError):
+            pass
+        except Exception as e:
+            logger.warning(f"peer {self.node} dropped link {link}: {e!r}")
+        finally:
+            if node is not None:
+                for name, (owner, _) in tuple(self.owners.items()):
+                    if owner == node:
+                        del self.owners[name]
+            self.accepted.discard(link)
+            await link.close()
+
+    def _own(self, name: str, node: str, version: int) -> None:
+        self.clock = max(self.clock, version)
+        entry = self.owners.get(name)
+        if entry is None or entry[0] == node or (version, node) > (entry[1], entry[0]):
+            self.owners[name] = (node, version)
+
+    async def _serve(self, link: StreamSocket, message: Message) -> None:
+        try:
+            response: Message = {"id": message["id"], "response": await self._handler(message["to"], message["call"], message.get("timeout"))} # type: ignore
+        except Exception as e:
+            response = {"id": message["id"], "error": f"{e.__class__.__name__}: {e}"}
+        await self._send(link, self.codec.dumps(response))
+
+    async def _send(self, link: StreamSocket, data: bytes) -> None:
+        try:
+            await link.send(data)
+        except JsonRpcWsConnectException:
+            pass
+
+    def _broadcast(self, message: Message) -> None:
+        data = self.codec.dumps(message)
+        for link in tuple(self.links.values()):
+            self._spawn(self._send(link, data))
+
+    def _spawn(self, coro: Coroutine) -> None:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
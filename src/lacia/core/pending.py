@@ -0,0 +1,81 @@
+import asyncio
+from itertools import count
+from typing import Any, Dict, Hashable, Optional, Set, Tuple
+
+from lacia.exception import JsonRpcTimeoutException
+
+class PendingCalls:
+    """
+    Outgoing calls waiting for a response, keyed by compact integer ids.
+    """
+
+    def __init__(self, timeout: Optional[float] = None) -> None:
+        self.timeout = timeout
+        self._ids = count(1)
+        self._calls: Dict[int, Tuple[asyncio.Future, Hashable, Optional[asyncio.TimerHandle]]] = {}
+        self._conns: Dict[Hashable, Set[int]] = {}
+
+    def create(self, conn: Hashable, timeout: Optional[float] = None) -> Tuple[int, asyncio.Future]:
+        loop = asyncio.get_running_loop()
+        call_id = next(self._ids)
+        future = loop.create_future()
+        timeout = self.timeout if timeout is None else timeout
+        timer = loop.call_later(timeout, self._expire, call_id, timeout) if timeout else None
+        self._calls[call_id] = (future, conn, timer)
+        ids = self._conns.get(conn)
+        if ids is None:
+            ids = self._conns[conn] = set()
+        ids.add(call_id)
+        return call_id, future
+
+    def reserve(self) -> int:
+        return next(self._ids)
+
+    def resolve(self, call_id: Any, value: Any) -> bool:
+        call = self._calls.get(call_id)
+        if call is None or call[0].done():
+            return False
+        call[0].set_result(value)
+        return True
+
+    def reject(self, call_id: Any, exc: BaseException) -> bool:
+        call = self._calls.get(call_id)
+        if call is None or call[0].done():
+            return False
+        call[0].set_exception(exc)
+        return True
+
+    def discard(self, call_id: int) -> None:
+        call = self._calls.pop(call_id, None)
+        if call is None:
+            return
+        future, conn, timer = call
+        if timer is not None:
+            timer.cancel()
+        ids = self._conns.get(conn)
+        if ids is not None:
+            ids.discard(call_id)
+            if not ids:
+                del self._conns[conn]
+
+    def fail(self, conn: Hashable, exc: BaseException) -> int:
+        ids = self._conns.pop(conn, ())
+        for call_id in ids:
+            call = self._calls.get(call_id)
+            if call is not None and not call[0].done():
+                call[0].set_exception(exc)
+        return len(ids)
+
+    def in_flight(self, conn: Optional[Hashable] = None) -> int:
+        if conn is None:
+            return len(self._calls)
+        return len(self._conns.get(conn, ()))
+
+    def __contains__(self, call_id: Any) -> bool:
+        return call_id in self._calls
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def _expire(self, call_id: int, timeout: float) -> None:
+        self.reject(call_id, JsonRpcTimeoutException(f"call {call_id} timed out after {timeout}s"))
@@ -0,0 +1,111 @@
+import weakref
+from typing import Any, Dict, Hashable, List, Union, TYPE_CHECKING
+
+from lacia.core.metrics import method_name
+from lacia.exception import JsonRpcRuntimeException
+from lacia.standard.jsonast.compiler import Compiler, Prepared, Template
+
+if TYPE_CHECKING:
+    from lacia.core.proxy import ProxyObj
+
+class Param:
+    """
+    Placeholder for an argument of a prepared call: an `int` key binds a
+    positional argument, a `str` key a keyword argument.
+    """
+
+    __slots__ = ("key",)
+
+    def __init__(self, key: Union[int, str]) -> None:
+        self.key = key
+
+    def __repr__(self) -> str:
+        return f"Param({self.key!r})"
+
+class PreparedCall:
+    """
+    A call graph sent to each connection once as a template, then invoked
+    with only its id and parameter values.
+    """
+
+    def __init__(self, proxy: "ProxyObj", template_id: int) -> None:
+        if proxy._obj is None or proxy._core is None:
+            raise JsonRpcRuntimeException("ProxyObj is not bind to JsonRpc")
+        self.proxy = proxy
+        self.id = template_id
+        self.keys: List[Union[int, str]] = []
+        self.method = self._mark(proxy._obj.dumps())
+        self.name = method_name(self.method)
+        self.sent: "weakref.WeakSet[Any]" = weakref.WeakSet()
+
+    def params(self, args: tuple, kwargs: Dict[str, Any]) -> List[Any]:
+        try:
+            return [args[key] if isinstance(key, int) else kwargs[key] for key in self.keys]
+        except (IndexError, KeyError) as e:
+            raise TypeError(f"missing prepared call argument: {e}") from None
+
+    def bind(self, params: List[Any]) -> Dict[str, Any]:
+        def substitute(value: Any) -> Any:
+            if isinstance(value, dict):
+                if len(value) == 1 and "$param" in value:
+                    param = self.proxy._expand(params[value["$param"]])
+                    return param.dumps() if hasattr(param, "dumps") else param
+                return {k: substitute(v) for k, v in value.items()}
+            elif isinstance(value, (list, tuple)):
+                return type(value)(substitute(v) for v in value)
+            return value
+        return substitute(self.method)
+
+    async def __call__(self, *args, **kwargs) -> Any:
+        result = await self.proxy._core.call_prepared(self, self.params(args, kwargs)) # type: ignore
+        return result.visions if self.proxy._vision else result
+
+    def _mark(self, value: Any) -> Any:
+        if isinstance(value, Param):
+            if value.key not in self.keys:
+                self.keys.append(value.key)
+            return {"$param": self.keys.index(value.key)}
+        elif isinstance(value, dict):
+            return {k: self._mark(v) for k, v in value.items()}
+        elif isinstance(value, (list, tuple)):
+            return type(value)(self._mark(v) for v in value)
+        return value
+
+class TemplateStore:
+    """
+    Templates registered by the peers of a connection, compiled on first
+    use.
+    """
+
+    def __init__(self, max_templates: int = 1024) -> None:
+        self.max_templates = max_templates
+        self._templates: Dict[Hashable, Dict[Any, Union[dict, Template]]] = {}
+        self._names: Dict[Hashable, Dict[Any, str]] = {}
+
+    def register(self, conn: Hashable, template_id: Any, method: dict) -> None:
+        templates = self._templates.get(conn)
+        if templates is None:
+            templates = self._templates[conn] = {}
+        if template_id not in templates and len(templates) >= self.max_templates:
+            raise JsonRpcRuntimeException(f"too many templates: {self.max_templates}")
+        templates[template_id] = method
+        self._names.setdefault(conn, {})[template_id] = method_name(method)
+
+    def bind(self, conn: Hashable, template_id: Any, params: List[Any], compiler: Compiler) -> Prepared:
+        templates = self._templates.get(conn, {})
+        template = templates.get(template_id)
+        if template is None:
+            raise JsonRpcRuntimeException(f"unknown template: {template_id}")
+        if not isinstance(template, Template):
+            template = templates[template_id] = compiler.template(template)
+        return template.bind(params)
+
+    def name(self, conn: Hashable, template_id: Any) -> str:
+        return self._names.get(conn, {}).get(template_id, "<unknown>")
+
+    def drop(self, conn: Hashable) -> None:
+        self._templates.pop(conn, None)
+        self._names.pop(conn, None)
+
+    def __len__(self) -> int:
+        return sum(len(templates) for templates in self._templates.values())
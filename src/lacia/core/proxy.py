@@ -7,6 +7,8 @@ from lacia.exception import JsonRpcRuntimeException
 
 if TYPE_CHECKING:
     from lacia.core.core import JsonRpc
+    from lacia.core.stream import RemoteStream
+    from lacia.core.prepared import PreparedCall
 
 T = TypeVar("T", bound=BaseDataTrans)
 
@@ -25,12 +27,21 @@ class BaseProxy(Generic[T]):
 class ProxyObj(BaseProxy):
     _jsonrpc: str = "jsonast"
 
-    def __init__(self, core: Optional["JsonRpc[JsonAst]"] = None, name: Optional[str] = None, vision: bool = True):
-        self._aiter: Optional["ResultProxy"] = None
+    def __init__(
+        self,
+        core: Optional["JsonRpc[JsonAst]"] = None,
+        name: Optional[str] = None,
+        vision: bool = True,
+        timeout: Optional[float] = None,
+        order: Optional[str] = None,
+    ):
+        self._aiter: Optional["RemoteStream"] = None
         self._obj = ["server", None] if name is None else ["client", name]
         self._core = core
         self._name = name
         self._vision = vision
+        self._timeout = timeout
+        self._order = order
 
     def __getattr__(self, name: str) -> "ProxyObj":
         self = self._newobj()
@@ -79,8 +90,13 @@ class ProxyObj(BaseProxy):
         else:
             return obj
 
+    def _prepare(self) -> "PreparedCall":
+        if self._core is None:
+            raise TypeError("ProxyObj is not bind to JsonRpc")
+        return self._core.prepare(self)
+
     def _newobj(self):
-        new = ProxyObj(self._core, self._name, self._vision)
+        new = ProxyObj(self._core, self._name, self._vision, self._timeout, self._order)
         setattr(new, "_obj", self._obj)
         setattr(new, "_aiter", self._aiter)
         return new
@@ -115,30 +131,18 @@ class ProxyObj(BaseProxy):
         if self._core is None:
             raise TypeError("ProxyObj is not bind to JsonRpc")
         if not self._aiter:
-            if not self._core._client is None:
-                data = await self._core.run(self)
-            elif not self._core._server is None:
-                if self._name is None:
-                    raise JsonRpcRuntimeException("client name is None")
-                data = await self._core.reverse_run(self._name, self)
-            else:
-                raise JsonRpcRuntimeException("server and client are None")
-            self._aiter = data
-            r = await data.__anext__()
-            return r
-        else:
-            r = await self._aiter.__anext__()
-            return r
+            self._aiter = await self._core.stream(self)
+        return await self._aiter.__anext__()
 
     def __await__(self):
         if self._core is None:
             raise TypeError("ProxyObj is not bind to JsonRpc")
         if not self._core._client is None:
-            data = yield from self._core.run(self).__await__()
+            data = yield from self._core.run(self, retain=not self._vision, timeout=self._timeout, order=self._order).__await__()
         elif not self._core._server is None:
             if self._name is None:
                 raise JsonRpcRuntimeException("client name is None")
-            data = yield from self._core.reverse_run(self._name, self).__await__()
+            data = yield from self._core.reverse_run(self._name, self, retain=not self._vision, timeout=self._timeout, order=self._order).__await__()
         else:
             raise JsonRpcRuntimeException("server and client are None")
         self._obj = None
@@ -160,10 +164,12 @@ class ResultProxy(BaseProxy):
             if self._result.error_code == JsonRpcCode.StopAsyncIterationError:
                 raise StopAsyncIteration
             raise JsonRpcRuntimeException(self._result.error)
+        if self._result.handle is not None:
+            return getattr(ProxyObj(self._core, self._by), self._result.handle)
         return self._result.result
 
     def __getattr__(self, name: str) -> "ProxyObj":
-        return getattr(getattr(ProxyObj(self._core, self._by), self._result.id), name) # type: ignore
+        return getattr(getattr(ProxyObj(self._core, self._by), str(self._result.id)), name) # type: ignore
 
     async def __aiter__(self):
         return self
@@ -171,14 +177,14 @@ class ResultProxy(BaseProxy):
     async def __anext__(self):
         if self._core is None:
             raise TypeError("ProxyObj is not bind to JsonRpc")
-        obj = getattr(ProxyObj(self._core, self._by), self._result.id).__anext_proxy__()
+        obj = getattr(ProxyObj(self._core, self._by), str(self._result.id)).__anext_proxy__()
 
         if not self._core._client is None:
-            data = await self._core.run(obj)
+            data = await self._core.run(obj, retain=False)
         elif not self._core._server is None:
             if self._by is None:
                 raise JsonRpcRuntimeException("client name is None")
-            data = await self._core.reverse_run(self._by, obj)
+            data = await self._core.reverse_run(self._by, obj, retain=False)
         else:
             raise JsonRpcRuntimeException("server and client are None")
         return data.visions
@@ -0,0 +1,53 @@
+from typing import Any, Dict, Hashable, List, NamedTuple, Optional, Tuple
+
+class Relay(NamedTuple):
+    src: Hashable
+    src_id: int
+    dst: Hashable
+
+class RelayTable:
+    """
+    Calls the server forwards between two clients without decoding them.
+
+    Each forwarded call gets a server-side id (drawn from the same counter
+    as the server's own calls, so it never collides with them) that
+    replaces the caller's id on the way out and is swapped back on the way
+    in.
+    """
+
+    def __init__(self) -> None:
+        self._relays: Dict[int, Relay] = {}
+        self._by_src: Dict[Tuple[Hashable, int], int] = {}
+        self.forwarded = 0
+
+    def open(self, relay_id: int, src: Hashable, src_id: int, dst: Hashable) -> None:
+        self._relays[relay_id] = Relay(src, src_id, dst)
+        self._by_src[(src, src_id)] = relay_id
+
+    def outbound(self, src: Hashable, src_id: int) -> Optional[int]:
+        return self._by_src.get((src, src_id))
+
+    def inbound(self, dst: Hashable, relay_id: Any) -> Optional[Relay]:
+        relay = self._relays.get(relay_id)
+        if relay is None or relay.dst != dst:
+            return None
+        return relay
+
+    def close(self, relay_id: int) -> None:
+        relay = self._relays.pop(relay_id, None)
+        if relay is not None:
+            self._by_src.pop((relay.src, relay.src_id), None)
+
+    def drop(self, ws: Hashable) -> Tuple[List[Tuple[int, Relay]], List[Tuple[int, Relay]]]:
+        outgoing, incoming = [], []
+        for relay_id, relay in tuple(self._relays.items()):
+            if relay.src == ws:
+                outgoing.append((relay_id, relay))
+                self.close(relay_id)
+            elif relay.dst == ws:
+                incoming.append((relay_id, relay))
+                self.close(relay_id)
+        return outgoing, incoming
+
+    def __len__(self) -> int:
+        return len(self._relays)
@@ -0,0 +1,182 @@
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterator, MutableMapping, Optional, Tuple
+
+class ResultBucket(MutableMapping[str, Any]):
+    """
+    Per-connection LRU of retained results, keyed by request id.
+    """
+
+    def __init__(self, store: "ResultStore"):
+        self._store = store
+        self._items: "OrderedDict[str, Tuple[Any, int, float]]" = OrderedDict()
+        self.nbytes = 0
+
+    def __getitem__(self, key: str) -> Any:
+        item = self._items.get(key)
+        if item is None:
+            self._store.misses += 1
+            raise KeyError(key)
+        value, size, expire = item
+        now = time.monotonic()
+        if expire and expire < now:
+            self._evict(key, expired=True)
+            self._store.misses += 1
+            raise KeyError(key)
+        self._store.hits += 1
+        self._items[key] = (value, size, self._store._deadline(now))
+        self._items.move_to_end(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in self._items:
+            self._evict(key)
+        size = self._store.sizeof(value)
+        self._items[key] = (value, size, self._store._deadline(time.monotonic()))
+        self.nbytes += size
+        self._store.nbytes += size
+        self._store.entries += 1
+        self._store._shrink(self)
+
+    def __delitem__(self, key: str) -> None:
+        if key not in self._items:
+            raise KeyError(key)
+        self._evict(key, count=False)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._items)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._items
+
+    def _evict(self, key: str, expired: bool = False, count: bool = True):
+        _, size, _ = self._items.pop(key)
+        self.nbytes -= size
+        self._store.nbytes -= size
+        self._store.entries -= 1
+        if count:
+            if expired:
+                self._store.expirations += 1
+            else:
+                self._store.evictions += 1
+
+    def _oldest(self) -> Optional[Tuple[str, float]]:
+        for key, (_, _, expire) in self._items.items():
+            return key, expire
+        return None
+
+    def clear(self) -> None:
+        for key in list(self._items):
+            self._evict(key, count=False)
+
+class ResultStore:
+    """
+    Bounded store for results that a peer may reference again (chained
+    `ResultProxy` access and remote iteration).
+
+    Every connection gets its own `ResultBucket` with an entry and byte
+    budget; entries are evicted in LRU order and expire `ttl` seconds after
+    their last access.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: Optional[float] = 600,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._buckets: Dict[Hashable, ResultBucket] = {}
+
+        self.entries = 0
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def bucket(self, conn: Hashable) -> ResultBucket:
+        bucket = self._buckets.get(conn)
+        if bucket is None:
+            bucket = self._buckets[conn] = ResultBucket(self)
+        return bucket
+
+    def put(self, conn: Hashable, key: Any, value: Any) -> None:
+        self.bucket(conn)[str(key)] = value
+
+    def get(self, conn: Hashable, key: Any, default: Any = None) -> Any:
+        bucket = self._buckets.get(conn)
+        if bucket is None:
+            return default
+        try:
+            return bucket[str(key)]
+        except KeyError:
+            return default
+
+    def drop(self, conn: Hashable) -> None:
+        bucket = self._buckets.pop(conn, None)
+        if bucket is not None:
+            bucket.clear()
+
+    def sizeof(self, value: Any, depth: int = 8) -> int:
+        """
+        Estimated bytes held by `value`: containers and object attributes
+        are followed `depth` levels down, each object counted once.
+        """
+        return self._sizeof(value, depth, set())
+
+    def _sizeof(self, value: Any, depth: int, seen: set) -> int:
+        if id(value) in seen:
+            return 0
+        seen.add(id(value))
+        if isinstance(value, memoryview):
+            return sys.getsizeof(value) + value.nbytes
+        try:
+            size = sys.getsizeof(value)
+        except TypeError:
+            size = 64
+        if depth <= 0 or isinstance(value, (str, bytes, bytearray)):
+            return size
+        if isinstance(value, dict):
+            return size + sum(self._sizeof(k, depth - 1, seen) + self._sizeof(v, depth - 1, seen) for k, v in value.items())
+        if isinstance(value, (list, tuple, set, frozenset)):
+            return size + sum(self._sizeof(item, depth - 1, seen) for item in value)
+        attrs = getattr(value, "__dict__", None)
+        if isinstance(attrs, dict):
+            return size + self._sizeof(attrs, depth - 1, seen)
+        return size
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "connections": len(self._buckets),
+            "entries": self.entries,
+            "bytes": self.nbytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+        }
+
+    def _deadline(self, now: float) -> float:
+        return now + self.ttl if self.ttl else 0.0
+
+    def _shrink(self, bucket: ResultBucket) -> None:
+        now = time.monotonic()
+        while len(bucket) > 0:
+            key, expire = bucket._oldest() # type: ignore
+            if expire and expire < now:
+                bucket._evict(key, expired=True)
+            elif len(bucket) > self.max_entries or bucket.nbytes > self.max_bytes:
+                bucket._evict(key)
+            else:
+                break
@@ -0,0 +1,161 @@
+import asyncio
+import weakref
+from functools import partial
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, TYPE_CHECKING
+
+from lacia.logger import logger
+from lacia.types import JsonRpcCode
+
+if TYPE_CHECKING:
+    from lacia.core.core import JsonRpc
+
+class RemoteStream:
+    """
+    Consumer side of a pushed stream.
+
+    Items arrive as `{"id", "item"}` frames and are buffered until read;
+    every `window // 2` consumed items are returned to the producer as
+    credit. The stream ends on an `{"id", "end"}` frame, which may carry an
+    error. A stream dropped before its end, e.g. by breaking out of
+    `async for`, is cancelled on the producer once it is collected;
+    `aclose` does so right away.
+    """
+
+    def __init__(self, core: "JsonRpc", websocket: Any, call_id: int, future: asyncio.Future, window: int, to: Optional[str] = None) -> None:
+        self._core = core
+        self._websocket = websocket
+        self._id = call_id
+        self._to = to
+        self._future = future
+        self.window = window
+        self._items: Deque[Any] = deque()
+        self._waiter: Optional[asyncio.Future] = None
+        self._error: Optional[BaseException] = None
+        self._done = False
+        self._consumed = 0
+        self._finalizer = weakref.finalize(self, _abandon, core, websocket, call_id, to)
+        self._finalizer.atexit = False
+        future.add_done_callback(partial(_on_done, weakref.ref(self)))
+
+    def feed(self, item: Any) -> None:
+        self._items.append(item)
+        self._wake()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        if self._done:
+            return
+        self._done = True
+        self._error = error
+        self._finalizer.detach()
+        self._wake()
+
+    def __aiter__(self) -> "RemoteStream":
+        return self
+
+    async def __anext__(self) -> Any:
+        while not self._items:
+            if self._done:
+                self._core._streams.pop(self._id, None)
+                self._core._pending.discard(self._id)
+                if self._error is not None:
+                    raise self._error
+                raise StopAsyncIteration
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        self._consumed += 1
+        if self._consumed >= max(self.window // 2, 1) and not self._done:
+            credit, self._consumed = self._consumed, 0
+            await self._control("credit", credit)
+        return self._items.popleft()
+
+    async def aclose(self) -> None:
+        if not self._done:
+            self.finish()
+            await self._control("cancel", True)
+        self._core._streams.pop(self._id, None)
+        self._core._pending.discard(self._id)
+
+    async def _control(self, key: str, value: Any) -> None:
+        await _control(self._core, self._websocket, self._id, self._to, key, value)
+
+    def _wake(self) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+async def _control(core: "JsonRpc", websocket: Any, call_id: int, to: Optional[str], key: str, value: Any) -> None:
+    msg: Dict[str, Any] = {"id": call_id, key: value} if to is None else {"to": to, "id": call_id, key: value}
+    await core._send(websocket, core._codec_for(websocket).dumps(msg))
+
+async def _cancel(core: "JsonRpc", websocket: Any, call_id: int, to: Optional[str]) -> None:
+    try:
+        await _control(core, websocket, call_id, to, "cancel", True)
+    except Exception as e:
+        logger.debug(f"stream {call_id} cancel not sent: {e}")
+
+def _abandon(core: "JsonRpc", websocket: Any, call_id: int, to: Optional[str]) -> None:
+    core._streams.pop(call_id, None)
+    core._pending.discard(call_id)
+    loop = core._loop
+    if loop is not None and not loop.is_closed():
+        loop.create_task(_cancel(core, websocket, call_id, to))
+
+def _on_done(ref: "weakref.ref[RemoteStream]", future: asyncio.Future) -> None:
+    stream = ref()
+    if stream is None:
+        return
+    if not future.cancelled() and future.exception() is not None:
+        stream.finish(future.exception())
+    else:
+        stream.finish()
+
+class StreamProducer:
+    """
+    Producer side of a pushed stream: drives the iterator and sends each
+    item as soon as the consumer has credit for it.
+    """
+
+    def __init__(self, iterator: AsyncIterator, window: int, send: Callable[[dict], Awaitable[None]], call_id: Any) -> None:
+        self.iterator = iterator
+        self.credit = window
+        self._send = send
+        self._id = call_id
+        self._event = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def grant(self, credit: int) -> None:
+        self.credit += credit
+        self._event.set()
+
+    def cancel(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+
+    async def pump(self) -> None:
+        try:
+            while True:
+                while self.credit <= 0:
+                    self._event.clear()
+                    await self._event.wait()
+                try:
+                    item = await self.iterator.__anext__()
+                except StopAsyncIteration:
+                    await self._send({"id": self._id, "end": True})
+                    break
+                self.credit -= 1
+                await self._send({"id": self._id, "item": item})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(e)
+            await self._send({"id": self._id, "end": True, "error": {"code": JsonRpcCode.InternalError, "message": str(e)}})
+        finally:
+            aclose = getattr(type(self.iterator), "aclose", None)
+            if aclose is not None:
+                try:
+                    await self.iterator.aclose() # type: ignore
+                except Exception:
+                    pass
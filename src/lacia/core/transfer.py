@@ -0,0 +1,232 @@
+import asyncio
+from collections import deque
+from tempfile import SpooledTemporaryFile
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+from lacia.logger import logger
+from lacia.types import JsonRpcCode
+from lacia.exception import JsonRpcRuntimeException
+
+CHUNK, BLOB = "$chunk", "$blob"
+
+Send = Callable[[Dict[str, Any], List[Any]], Awaitable[None]]
+
+class Blob:
+    """
+    A value sent in chunks instead of inside its message: bytes-like data,
+    a binary file object (read in a thread) or an async iterable of bytes.
+
+    The receiver gets a `BlobReader`, or plain `bytes` once every chunk
+    arrived if `stream` is false.
+    """
+
+    __slots__ = ("source", "stream")
+
+    def __init__(self, source: Any, stream: bool = True) -> None:
+        self.source = source
+        self.stream = stream
+
+    async def chunks(self, size: int) -> AsyncIterator[Any]:
+        source = self.source
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            async for chunk in _slices(memoryview(source).cast("B"), size):
+                yield chunk
+        elif hasattr(source, "__aiter__"):
+            async for item in source:
+                async for chunk in _slices(memoryview(item).cast("B"), size):
+                    yield chunk
+        else:
+            while True:
+                chunk = await asyncio.to_thread(source.read, size)
+                if not chunk:
+                    break
+                yield chunk
+
+async def _slices(view: memoryview, size: int) -> AsyncIterator[memoryview]:
+    for offset in range(0, view.nbytes, size):
+        yield view[offset:offset + size]
+
+class BlobReader:
+    """
+    Receiving side of a chunked value: an async iterator over its chunks.
+
+    Every `window // 2` consumed chunks are returned to the sender as
+    credit, so an unread blob holds at most `window` chunks in memory.
+    """
+
+    def __init__(self, tid: int, window: int, send: Callable[[Dict[str, Any]], Awaitable[None]], release: Callable[[], None]) -> None:
+        self.id = tid
+        self.window = window
+        self.size = 0
+        self._send = send
+        self._release = release
+        self._chunks: Deque[bytes] = deque()
+        self._waiter: Optional[asyncio.Future] = None
+        self._error: Optional[BaseException] = None
+        self._done = False
+        self._consumed = 0
+
+    def feed(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        self._chunks.append(chunk)
+        self._wake()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        if self._done:
+            return
+        self._done = True
+        self._error = error
+        self._wake()
+
+    def __aiter__(self) -> "BlobReader":
+        return self
+
+    async def __anext__(self) -> bytes:
+        while not self._chunks:
+            if self._done:
+                if self._error is not None:
+                    raise self._error
+                raise StopAsyncIteration
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        self._consumed += 1
+        if self._consumed >= max(self.window // 2, 1) and not self._done:
+            credit, self._consumed = self._consumed, 0
+            await self._send({"chunk": self.id, "credit": credit})
+        return self._chunks.popleft()
+
+    async def read(self) -> bytes:
+        return b"".join([chunk async for chunk in self])
+
+    async def spool(self, max_size: int = 16 * 1024 * 1024) -> SpooledTemporaryFile:
+        """
+        Write every chunk to a `SpooledTemporaryFile` that rolls over to
+        disk past `max_size`, rewound for reading.
+        """
+        buffer = SpooledTemporaryFile(max_size=max_size)
+        async for chunk in self:
+            buffer.write(chunk)
+        buffer.seek(0)
+        return buffer
+
+    async def aclose(self) -> None:
+        if not self._done:
+            self.finish(JsonRpcRuntimeException("blob closed"))
+            self._release()
+            await self._send({"chunk": self.id, "cancel": True})
+
+    def __repr__(self) -> str:
+        return f"BlobReader(id={self.id}, size={self.size}, done={self._done})"
+
+    def _wake(self) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+class ChunkSender:
+    """
+    Sending side of a chunked value: one `{"chunk", "attach"}` header and
+    data frame per chunk, as long as the receiver has credit for it.
+    """
+
+    def __init__(self, tid: int, blob: Blob, size: int, window: int, send: Send) -> None:
+        self.id = tid
+        self.blob = blob
+        self.size = size
+        self.credit = window
+        self.sent = 0
+        self._send = send
+        self._event = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def grant(self, credit: int) -> None:
+        self.credit += credit
+        self._event.set()
+
+    def cancel(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+
+    async def pump(self) -> None:
+        try:
+            async for chunk in self.blob.chunks(self.size):
+                while self.credit <= 0:
+                    self._event.clear()
+                    await self._event.wait()
+                self.credit -= 1
+                await self._send({"chunk": self.id, "attach": 1}, [chunk])
+                self.sent += 1
+            await self._send({"chunk": self.id, "end": True}, [])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(e)
+            await self._send({"chunk": self.id, "end": True, "error": {"code": JsonRpcCode.InternalError, "message": str(e)}}, [])
+
+class Transfers:
+    """
+    Chunked values in flight, per connection: the ones this side sends
+    (keyed by its own ids) and the ones it receives (keyed by the peer's).
+    """
+
+    def __init__(self) -> None:
+        self.outgoing: Dict[Tuple[Hashable, int], ChunkSender] = {}
+        self.incoming: Dict[Tuple[Hashable, int], BlobReader] = {}
+        self.chunks_sent = 0
+        self.chunks_received = 0
+
+    def start(self, conn: Hashable, sender: ChunkSender) -> None:
+        key = (conn, sender.id)
+        self.outgoing[key] = sender
+
+        async def pump():
+            try:
+                await sender.pump()
+            finally:
+                self.chunks_sent += sender.sent
+                if self.outgoing.get(key) is sender:
+                    del self.outgoing[key]
+
+        sender.task = asyncio.get_running_loop().create_task(pump())
+
+    def receive(self, conn: Hashable, tid: int, window: int, send: Callable[[Dict[str, Any]], Awaitable[None]]) -> BlobReader:
+        key = (conn, tid)
+        reader = self.incoming[key] = BlobReader(tid, window, send, lambda: self.incoming.pop(key, None))
+        return reader
+
+    def on_frame(self, conn: Hashable, message: Dict[str, Any], attachments: Optional[List[bytes]]) -> None:
+        key = (conn, message["chunk"])
+        if "credit" in message or "cancel" in message:
+            sender = self.outgoing.get(key)
+            if sender is None:
+                return
+            if message.get("cancel"):
+                sender.cancel()
+            else:
+                sender.grant(message["credit"])
+            return
+        reader = self.incoming.get(key)
+        if reader is None:
+            return
+        if attachments:
+            self.chunks_received += 1
+            reader.feed(attachments[0])
+        if message.get("end"):
+            del self.incoming[key]
+            reader.finish(JsonRpcRuntimeException(message["error"]) if "error" in message else None)
+
+    def drop(self, conn: Hashable, error: BaseException) -> None:
+        for key in [key for key in self.outgoing if key[0] == conn]:
+            self.outgoing.pop(key).cancel()
+        for key in [key for key in self.incoming if key[0] == conn]:
+            self.incoming.pop(key).finish(error)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sending": len(self.outgoing),
+            "receiving": len(self.incoming),
+            "chunks_sent": self.chunks_sent + sum(sender.sent for sender in self.outgoing.values()),
+            "chunks_received": self.chunks_received,
+        }
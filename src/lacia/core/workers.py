@@ -0,0 +1,132 @@
+import os
+import time
+import socket
+import signal
+import shutil
+import asyncio
+import secrets
+import tempfile
+from typing import Dict, Optional
+
+from lacia.core.core import JsonRpc
+from lacia.core.peers import Peers
+from lacia.network.abcbase import BaseServer
+from lacia.network.server.streamserver import StreamServer
+from lacia.logger import logger
+
+class Workers:
+    """
+    Runs `rpc` and `server` in `workers` forked processes sharing one
+    listening address: each binds it with SO_REUSEPORT so the kernel
+    spreads connections over them, or, for a Unix socket or without
+    SO_REUSEPORT, accepts on one socket bound before forking.
+
+    The workers join a `Peers` mesh over Unix sockets in `ipc_dir`,
+    authenticated by the rpc token or a secret drawn per run, so calls by
+    client name reach clients connected to any of them. A worker
+    that dies is restarted; SIGINT or SIGTERM stops them all. Call `run`
+    from a process without a running event loop.
+    """
+
+    def __init__(
+        self,
+        rpc: JsonRpc,
+        server: BaseServer,
+        workers: Optional[int] = None,
+        ipc_dir: Optional[str] = None,
+        reuse_port: bool = True,
+        grace: float = 5.0,
+    ) -> None:
+        self.rpc = rpc
+        self.server = server
+        self.workers = workers or os.cpu_count() or 1
+        self.ipc_dir = ipc_dir
+        self.reuse_port = reuse_port and hasattr(socket, "SO_REUSEPORT")
+        self.grace = grace
+        self.index: Optional[int] = None
+
+    def run(self) -> None:
+        ipc_dir = self.ipc_dir or tempfile.mkdtemp(prefix="lacia-")
+        addresses = {f"worker-{i}": f"unix://{os.path.join(ipc_dir, f'worker-{i}.sock')}" for i in range(self.workers)}
+        sock = self._listen()
+        secret = self.rpc._token or secrets.token_hex(16)
+        children: Dict[int, int] = {}
+        stopping = False
+
+        def stop(signum, frame):
+            nonlocal stopping
+            stopping = True
+            for pid in children:
+                os.kill(pid, signal.SIGTERM)
+
+        previous = {sig: signal.signal(sig, stop) for sig in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            for index in range(self.workers):
+                children[self._fork(index, addresses, sock, secret)] = index
+            logger.info(f"{self.workers} workers started")
+            deadline = None
+            while children:
+                if stopping and deadline is None:
+                    deadline = time.monotonic() + self.grace
+                elif deadline is not None and time.monotonic() > deadline:
+                    for pid in children:
+                        os.kill(pid, signal.SIGKILL)
+                    deadline = float("inf")
+                try:
+                    pid, status = os.waitpid(-1, os.WNOHANG)
+                except ChildProcessError:
+                    break
+                if pid == 0:
+                    time.sleep(0.1)
+                    continue
+                index = children.pop(pid, None)
+                if index is not None and not stopping:
+                    logger.warning(f"worker {index} exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+                    children[self._fork(index, addresses, sock, secret)] = index
+        finally:
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+            if sock is not None:
+                sock.close()
+            if self.ipc_dir is None:
+                shutil.rmtree(ipc_dir, ignore_errors=True)
+
+    def _listen(self) -> Optional[socket.socket]:
+        """
+        The socket all workers accept on, `None` when each binds its own
+        with SO_REUSEPORT.
+        """
+        path = self.server.path if isinstance(self.server, StreamServer) else None
+        if path is not None:
+            if os.path.exists(path):
+                os.unlink(path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.bind(path)
+            sock.listen(1024)
+            return sock
+        if self.reuse_port:
+            return None
+        return socket.create_server((self.server.host, self.server.port), backlog=1024) # type: ignore
+
+    def _fork(self, index: int, addresses: Dict[str, str], sock: Optional[socket.socket], secret: str) -> int:
+        pid = os.fork()
+        if pid:
+            return pid
+        code = 0
+        try:
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            self.index = index
+            if sock is not None:
+                self.server.sock = sock # type: ignore
+            else:
+                self.server.reuse_port = True # type: ignore
+            self.rpc._peers = Peers(f"worker-{index}", addresses, secret=secret)
+            asyncio.run(self.rpc.run_server(self.server))
+        except KeyboardInterrupt:
+            pass
+        except BaseException as e:
+            logger.exception(e)
+            code = 1
+        finally:
+            os._exit(code)
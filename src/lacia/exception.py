@@ -12,4 +12,13 @@ class JsonRpcWsConnectException(JsonRpcWsException):
     ...
 
 class JsonRpcRuntimeException(JsonRpcWsException):
-    ...
\ No newline at end of file
+    ...
+
+class JsonRpcTimeoutException(JsonRpcRuntimeException):
+    ...
+
+class JsonRpcClosedException(JsonRpcWsConnectException):
+    ...
+
+class JsonRpcRejectedException(JsonRpcRuntimeException):
+    ...
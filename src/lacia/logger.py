@@ -1,4 +1,60 @@
-import richuru
-richuru.install()
+import reprlib
+from typing import Any, Union
 
-from loguru import logger
\ No newline at end of file
+from loguru import logger
+
+def install(level: Union[int, str] = "INFO") -> None:
+    """
+    Send loguru's output through richuru. Not done on import, so an
+    application keeps the logging setup it configured itself.
+    """
+    import richuru
+    richuru.install(level=level)
+
+class _Repr(reprlib.Repr):
+    """
+    `reprlib.Repr` that also cuts bytes-like values before formatting
+    them, so the cost does not grow with the size of the payload.
+    """
+
+    def repr_bytes(self, value: bytes, level: int) -> str:
+        if len(value) <= self.maxstring:
+            return repr(value)
+        return f"{bytes(value[:self.maxstring])!r}...<{len(value)} bytes>"
+
+    repr_bytearray = repr_bytes
+
+    def repr_memoryview(self, value: memoryview, level: int) -> str:
+        return f"<memoryview {value.nbytes} bytes>"
+
+class PayloadLog:
+    """
+    Debug logging of the messages sent and received. Nothing is
+    formatted unless `enabled` and DEBUG reaches a sink, only one message
+    in `sample` is logged, and every payload is cut to about `limit`
+    characters.
+    """
+
+    def __init__(self, enabled: bool = False, sample: int = 1, limit: int = 512) -> None:
+        self.enabled = enabled
+        self.sample = max(sample, 1)
+        self.seen = 0
+        self._repr = _Repr()
+        self._repr.maxstring = self._repr.maxother = max(limit // 4, 16)
+        self._repr.maxdict = self._repr.maxlist = self._repr.maxtuple = 16
+        self._repr.maxlevel = 6
+        self.limit = limit
+
+    def __call__(self, direction: str, message: Any) -> None:
+        if not self.enabled:
+            return
+        self.seen += 1
+        if self.seen % self.sample:
+            return
+        logger.opt(lazy=True, depth=1).debug("{}: {}", lambda: direction, lambda: self.format(message))
+
+    def format(self, message: Any) -> str:
+        text = self._repr.repr(message)
+        if len(text) > self.limit:
+            return f"{text[:self.limit]}...<{len(text)} chars>"
+        return text
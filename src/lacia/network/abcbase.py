@@ -1,41 +1,95 @@
 import asyncio
+import time
 from abc import abstractmethod
-from typing import Optional, TypeVar, Generic, Generator, Dict, Callable
+from typing import Optional, TypeVar, Generic, Generator, Dict, Callable, Union, Iterator, Tuple
 
 from lacia.types import Message
 from lacia.utils.tool import CallObj
+from lacia.network.codec import BaseCodec
+from lacia.network.compress import Compression
+from lacia.logger import logger
 
 T = TypeVar('T')
 
+class ConnectionInfo:
+    __slots__ = ("event", "name", "connected_at", "in_flight")
+
+    def __init__(self, event: asyncio.Event) -> None:
+        self.event = event
+        self.name: Optional[str] = None
+        self.connected_at = time.time()
+        self.in_flight = 0
+
 class Connection(Generic[T]):
+    """
+    Registry of live connections, indexed by websocket and by name.
+
+    Every operation is a dict lookup. A name belongs to at most one
+    connection: registering it again moves it to the new connection (or
+    raises with `replace=False`), and renaming a connection releases its
+    previous name. Iteration works on a snapshot, so connections may come
+    and go while it runs.
+    """
 
     def __init__(self):
         self.ws: Dict[T, asyncio.Event] = {}
         self.name_ws: Dict[str, T] = {}
-    
+        self.infos: Dict[T, ConnectionInfo] = {}
+
     def set_ws(self, ws: T, event: asyncio.Event):
         self.ws[ws] = event
-    
-    def set_name_ws(self, name: str, ws: T):
+        self.infos[ws] = ConnectionInfo(event)
+
+    def set_name_ws(self, name: str, ws: T, replace: bool = True):
+        info = self.infos.get(ws)
+        if info is None:
+            raise KeyError("no such websocket")
+        holder = self.name_ws.get(name)
+        if holder is not None and holder is not ws:
+            if not replace:
+                raise ValueError(f"name {name!r} is already in use")
+            logger.warning(f"name {name!r} moved to a new connection")
+            self.infos[holder].name = None
+        if info.name is not None and info.name != name:
+            self.name_ws.pop(info.name, None)
+        info.name = name
         self.name_ws[name] = ws
 
     def clear_ws(self, ws: T):
-        self.ws.pop(ws)
-        for name, _ws in self.name_ws.items():
-            if _ws == ws:
-                self.name_ws.pop(name)
+        self.ws.pop(ws, None)
+        info = self.infos.pop(ws, None)
+        if info is not None and info.name is not None and self.name_ws.get(info.name) is ws:
+            del self.name_ws[info.name]
 
     def clear_name_ws(self, name: str):
-        self.name_ws.pop(name)
-    
+        ws = self.name_ws.pop(name)
+        info = self.infos.get(ws)
+        if info is not None:
+            info.name = None
+
     def get_ws(self, name: str) -> T:
         return self.name_ws[name]
-    
+
     def get_name(self, ws: T) -> str:
-        for name, _ws in self.name_ws.items():
-            if _ws == ws:
-                return name
-        raise KeyError("no such websocket")
+        info = self.infos.get(ws)
+        if info is None or info.name is None:
+            raise KeyError("no such websocket")
+        return info.name
+
+    def info(self, ws: T) -> ConnectionInfo:
+        return self.infos[ws]
+
+    def connections(self) -> Iterator[Tuple[T, ConnectionInfo]]:
+        return iter(tuple(self.infos.items()))
+
+    def names(self) -> Iterator[Tuple[str, T]]:
+        return iter(tuple(self.name_ws.items()))
+
+    def __contains__(self, ws: object) -> bool:
+        return ws in self.infos
+
+    def __len__(self) -> int:
+        return len(self.infos)
 
 class BaseServer(Generic[T]):
     active_connections: Connection[T]
@@ -65,10 +119,22 @@ class BaseServer(Generic[T]):
     async def iter_json(self, websocket: T) -> Generator[Message, None, None]:
         ...
 
+    @abstractmethod
+    async def iter_raw(self, websocket: T) -> Generator[Union[bytes, str], None, None]:
+        ...
+
     @abstractmethod
     async def send_bytes(self, websocket: T, message: bytes) -> None:
         ...
 
+    @abstractmethod
+    def codec(self, websocket: T) -> BaseCodec:
+        ...
+
+    @abstractmethod
+    def compression(self, websocket: T) -> Optional[Compression]:
+        ...
+
     @abstractmethod
     async def send_json(self, websocket: T, message: Message, binary = True) -> None:
         ...
@@ -116,10 +182,22 @@ class BaseClient(Generic[T]):
     async def iter_json(self) -> Generator[Message, None, None]:
         ...
 
+    @abstractmethod
+    async def iter_raw(self) -> Generator[Union[bytes, str], None, None]:
+        ...
+
     @abstractmethod
     async def send_bytes(self, message: bytes) -> None:
         ...
 
+    @abstractmethod
+    def codec(self) -> BaseCodec:
+        ...
+
+    @abstractmethod
+    def compression(self) -> Optional[Compression]:
+        ...
+
     @abstractmethod
     async def send_json(self, message: Message, binary = True) -> None:
         ...
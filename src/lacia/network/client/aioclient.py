@@ -1,11 +1,12 @@
 import asyncio 
-from typing import Optional
+from typing import Optional, List
 
 import orjson
-import bson
 import aiohttp
 
 from lacia.network.abcbase import BaseClient
+from lacia.network.codec import BaseCodec, available_codecs, get_codec, to_protocols, from_protocol, compression_from_protocol
+from lacia.network.compress import Compression, available_compressions, get_compression, offers
 from lacia.logger import logger
 from lacia.types import Message
 from lacia.exception import JsonRpcWsConnectException
@@ -18,19 +19,39 @@ class AioClient(BaseClient):
         path: str = "",
         host: str = "localhost",
         port: int = 8080,
-        loop: Optional[asyncio.AbstractEventLoop] = None
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+        codecs: Optional[List[str]] = None,
+        max_msg_size: int = 4 * 1024 * 1024,
+        compression: Optional[List[str]] = None,
+        compress_dictionary: Optional[bytes] = None,
+        compress_threshold: Optional[int] = None,
+        compress_level: Optional[int] = None,
     ) -> None:
         self.path = path
         self.host = host
         self.port = port
         self.loop = loop
+        self.codecs = codecs if codecs is not None else available_codecs()
+        self.max_msg_size = max_msg_size
+        self.compression_names = offers(compression if compression is not None else available_compressions(), compress_dictionary)
+        self.compress_dictionary = compress_dictionary
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+        self._compression: Optional[Compression] = None
 
     async def start(self) -> "AioClient":
         self.session = aiohttp.ClientSession(loop=self.loop or asyncio.get_event_loop())
-        self.ws = await self.session.ws_connect(f"http://{self.host}:{self.port}{self.path}")
+        self.ws = await self.session.ws_connect(f"http://{self.host}:{self.port}{self.path}", protocols=to_protocols(self.codecs, self.compression_names), max_msg_size=self.max_msg_size)
+        self._compression = get_compression(compression_from_protocol(self.ws.protocol), self.compress_dictionary, self.compress_level, self.compress_threshold, self.max_msg_size)
         logger.success(f"📡 {self.__class__.__name__} success connected: http://{self.host}:{self.port}{self.path}.")
         return self
 
+    def codec(self) -> BaseCodec:
+        return get_codec(from_protocol(self.ws.protocol))
+
+    def compression(self) -> Optional[Compression]:
+        return self._compression
+
     async def receive(self):
 
         try:
@@ -48,10 +69,17 @@ class AioClient(BaseClient):
             data = orjson.loads(data.data)
             return data
         elif data and data.type == aiohttp.WSMsgType.BINARY:
-            data = bson.loads(data.data)
+            compression = self.compression()
+            data = self.codec().loads(data.data if compression is None else compression.decompress(data.data))
             return data
         raise JsonRpcWsConnectException("Invalid data type.")
 
+    async def receive_raw(self):
+        data = await self.receive()
+        if data and data.type in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+            return data.data
+        raise JsonRpcWsConnectException("Invalid data type.")
+
     async def receive_bytes(self):
         data = await self.receive()
         if data and data.type == aiohttp.WSMsgType.BINARY:
@@ -73,6 +101,22 @@ class AioClient(BaseClient):
         finally:
             return
 
+    async def iter_raw(self):
+        try:
+            while True:
+                data = await self.receive_raw()
+                if data:
+                    yield data
+        except JsonRpcWsConnectException as e:
+            logger.error(f"http://{self.host}:{self.port}{self.path} closed.")
+            await self.close()
+        except Exception as e:
+            logger.error(e)
+            logger.error(f"http://{self.host}:{self.port}{self.path} closed.")
+            await self.close()
+        finally:
+            return
+
     async def iter_bytes(self):
         try:
             while True:
@@ -95,11 +139,14 @@ class AioClient(BaseClient):
 
     async def send_json(self, message: Message, binary: bool = True):
         if binary:
-            return await self.ws.send_bytes(bson.dumps(message))
+            data = self.codec().dumps(message)
+            compression = self.compression()
+            return await self.ws.send_bytes(data if compression is None else compression.compress(data))
         return await self.ws.send_json(message)
 
     async def close(self) -> None:
         await self.ws.close()
+        await self.session.close()
 
     def closed(self) -> bool:
         return self.ws.closed
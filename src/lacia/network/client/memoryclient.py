@@ -0,0 +1,76 @@
+from typing import Any, Optional, Union
+
+from lacia.network.abcbase import BaseClient
+from lacia.network.codec import BaseCodec, get_codec
+from lacia.network.compress import Compression
+from lacia.network.server.memoryserver import MemoryServer, MemorySocket, servers
+from lacia.logger import logger
+from lacia.types import Message
+from lacia.exception import JsonRpcWsConnectException
+
+
+class MemoryClient(BaseClient[MemorySocket]):
+    """
+    Client of a `MemoryServer` in the same process and event loop, given
+    as the server itself or by its name.
+    """
+
+    def __init__(self, server: Union[str, MemoryServer] = "default") -> None:
+        self.server = server
+
+    async def start(self) -> "MemoryClient":
+        server = servers.get(self.server) if isinstance(self.server, str) else self.server
+        if server is None:
+            raise JsonRpcWsConnectException(f"memory server {self.server!r} is not running")
+        self.ws = await server.connect()
+        logger.success(f"📡 {self.__class__.__name__} success connected: memory://{server.name}.")
+        return self
+
+    def codec(self) -> BaseCodec:
+        return get_codec(self.ws.protocol)
+
+    def compression(self) -> Optional[Compression]:
+        return None
+
+    async def receive(self):
+        return await self.ws.receive()
+
+    async def receive_json(self):
+        return self.codec().loads(await self.receive())
+
+    async def receive_raw(self):
+        return await self.receive()
+
+    async def receive_bytes(self):
+        return await self.receive()
+
+    async def iter_raw(self):
+        try:
+            while True:
+                yield await self.receive()
+        except JsonRpcWsConnectException:
+            logger.info(f"{self.__class__.__name__} closed.")
+            await self.close()
+
+    iter_bytes = iter_raw
+
+    async def iter_json(self):
+        async for data in self.iter_raw():
+            yield self.codec().loads(data)
+
+    async def send(self, message) -> None:
+        return await self.ws.send(message)
+
+    async def send_bytes(self, message: Any):
+        if isinstance(message, (memoryview, bytearray)):
+            message = bytes(message)
+        return await self.ws.send(message)
+
+    async def send_json(self, message: Message, binary: bool = True):
+        return await self.ws.send(self.codec().dumps(message))
+
+    async def close(self) -> None:
+        await self.ws.close()
+
+    def closed(self) -> bool:
+        return self.ws.closed
@@ -0,0 +1,113 @@
+import asyncio
+from typing import List, Optional
+
+from lacia.network.abcbase import BaseClient
+from lacia.network.codec import BaseCodec, available_codecs, get_codec, to_protocols, from_protocol, compression_from_protocol
+from lacia.network.compress import Compression, available_compressions, get_compression, offers
+from lacia.network.server.streamserver import StreamSocket, tune
+from lacia.logger import logger
+from lacia.types import Message
+from lacia.exception import JsonRpcWsConnectException
+
+
+class StreamClient(BaseClient[StreamSocket]):
+    """
+    Client of a `StreamServer`, over TCP or the Unix domain socket at `path`.
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 8080,
+        path: Optional[str] = None,
+        codecs: Optional[List[str]] = None,
+        max_msg_size: int = 4 * 1024 * 1024,
+        compression: Optional[List[str]] = None,
+        compress_dictionary: Optional[bytes] = None,
+        compress_threshold: Optional[int] = None,
+        compress_level: Optional[int] = None,
+        buffer: int = 1024 * 1024,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.path = path
+        self.codecs = codecs if codecs is not None else available_codecs()
+        self.max_msg_size = max_msg_size
+        self.compression_names = offers(compression if compression is not None else available_compressions(), compress_dictionary)
+        self.compress_dictionary = compress_dictionary
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+        self.buffer = buffer
+        self._compression: Optional[Compression] = None
+
+    @property
+    def address(self) -> str:
+        return f"unix://{self.path}" if self.path is not None else f"tcp://{self.host}:{self.port}"
+
+    async def start(self) -> "StreamClient":
+        if self.path is not None:
+            reader, writer = await asyncio.open_unix_connection(self.path, limit=self.buffer)
+        else:
+            reader, writer = await asyncio.open_connection(self.host, self.port, limit=self.buffer)
+        tune(writer, self.buffer)
+        self.ws = StreamSocket(reader, writer, self.max_msg_size)
+        await self.ws.send(",".join(to_protocols(self.codecs, self.compression_names)).encode())
+        self.ws.protocol = (await self.ws.receive()).decode() or None
+        self._compression = get_compression(compression_from_protocol(self.ws.protocol), self.compress_dictionary, self.compress_level, self.compress_threshold, self.max_msg_size)
+        logger.success(f"📡 {self.__class__.__name__} success connected: {self.address}.")
+        return self
+
+    def codec(self) -> BaseCodec:
+        return get_codec(from_protocol(self.ws.protocol))
+
+    def compression(self) -> Optional[Compression]:
+        return self._compression
+
+    async def receive(self):
+        return await self.ws.receive()
+
+    async def receive_json(self):
+        data = await self.receive()
+        compression = self.compression()
+        return self.codec().loads(data if compression is None else compression.decompress(data))
+
+    async def receive_raw(self):
+        return await self.receive()
+
+    async def receive_bytes(self):
+        return await self.receive()
+
+    async def iter_raw(self):
+        try:
+            while True:
+                yield await self.receive()
+        except JsonRpcWsConnectException:
+            logger.info(f"{self.address} closed.")
+            await self.close()
+
+    iter_bytes = iter_raw
+
+    async def iter_json(self):
+        try:
+            while True:
+                yield await self.receive_json()
+        except JsonRpcWsConnectException:
+            logger.info(f"{self.address} closed.")
+            await self.close()
+
+    async def send(self, message) -> None:
+        return await self.ws.send(message)
+
+    async def send_bytes(self, message: bytes):
+        return await self.ws.send(message)
+
+    async def send_json(self, message: Message, binary: bool = True):
+        data = self.codec().dumps(message)
+        compression = self.compression()
+        return await self.ws.send(data if compression is None else compression.compress(data))
+
+    async def close(self) -> None:
+        await self.ws.close()
+
+    def closed(self) -> bool:
+        return self.ws.closed
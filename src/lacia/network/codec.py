@@ -0,0 +1,263 @@
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Type
+
+import bson
+import orjson
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+from lacia.types import Message
+
+Default = Optional[Callable[[Any], Any]]
+
+class Field(NamedTuple):
+    key: str
+    value: Any
+    offset: int
+    width: int
+
+class BaseCodec(ABC):
+    name: str
+    serializes = True
+
+    @abstractmethod
+    def dumps(self, message: Message, default: Default = None) -> bytes:
+        ...
+
+    @abstractmethod
+    def loads(self, data: bytes) -> Message:
+        ...
+
+    def peek(self, data: bytes, count: int = 3) -> Optional[List[Field]]:
+        """
+        Read the leading fields of an encoded message without decoding the
+        rest. Codecs that cannot do this return `None`.
+        """
+        return None
+
+    def patch(self, data: bytes, field: Field, value: int) -> Optional[bytearray]:
+        """
+        Copy of `data` with the integer `field` replaced by `value`, or
+        `None` if that needs a full re-encode.
+        """
+        return None
+
+class BsonCodec(BaseCodec):
+    name = "bson"
+
+    def dumps(self, message: Message, default: Default = None) -> bytes:
+        return bson.dumps(message, on_unknown=default)
+
+    def loads(self, data: bytes) -> Message:
+        return bson.loads(data)
+
+    def peek(self, data: bytes, count: int = 3) -> Optional[List[Field]]:
+        fields: List[Field] = []
+        pos, size = 4, len(data)
+        try:
+            while len(fields) < count and pos < size and data[pos]:
+                kind = data[pos]
+                end = data.index(b"\x00", pos + 1)
+                key = data[pos + 1:end].decode()
+                pos = end + 1
+                if kind == 0x02:
+                    length = int.from_bytes(data[pos:pos + 4], "little")
+                    fields.append(Field(key, data[pos + 4:pos + 3 + length].decode(), pos, 0))
+                    pos += 4 + length
+                elif kind in _BSON_INTS:
+                    width = _BSON_INTS[kind]
+                    fields.append(Field(key, int.from_bytes(data[pos:pos + width], "little", signed=True), pos, width))
+                    pos += width
+                else:
+                    fields.append(Field(key, None, pos, 0))
+                    break
+        except (ValueError, UnicodeDecodeError):
+            return None
+        return fields
+
+    def patch(self, data: bytes, field: Field, value: int) -> Optional[bytearray]:
+        if not field.width or value.bit_length() >= field.width * 8:
+            return None
+        buffer = bytearray(data)
+        buffer[field.offset:field.offset + field.width] = value.to_bytes(field.width, "little", signed=True)
+        return buffer
+
+_BSON_INTS = {0x10: 4, 0x12: 8}
+
+class JsonCodec(BaseCodec):
+    name = "json"
+
+    def dumps(self, message: Message, default: Default = None) -> bytes:
+        return orjson.dumps(message, default=default, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, data: bytes) -> Message:
+        return orjson.loads(data)
+
+class MsgpackCodec(BaseCodec):
+    name = "msgpack"
+
+    def dumps(self, message: Message, default: Default = None) -> bytes:
+        return msgpack.packb(message, default=default, use_bin_type=True)
+
+    def loads(self, data: bytes) -> Message:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+    def peek(self, data: bytes, count: int = 3) -> Optional[List[Field]]:
+        fields: List[Field] = []
+        if not data:
+            return None
+        head = data[0]
+        if 0x80 <= head <= 0x8f:
+            size, pos = head & 0x0f, 1
+        elif head == 0xde:
+            size, pos = int.from_bytes(data[1:3], "big"), 3
+        elif head == 0xdf:
+            size, pos = int.from_bytes(data[1:5], "big"), 5
+        else:
+            return None
+        try:
+            while len(fields) < min(count, size):
+                key, pos = _msgpack_str(data, pos)
+                if key is None:
+                    return fields or None
+                kind = data[pos]
+                if kind < 0x80:
+                    fields.append(Field(key, kind, pos, 1))
+                    pos += 1
+                elif kind in _MSGPACK_UINTS:
+                    width = _MSGPACK_UINTS[kind]
+                    fields.append(Field(key, int.from_bytes(data[pos + 1:pos + width], "big"), pos, width))
+                    pos += width
+                else:
+                    value, end = _msgpack_str(data, pos)
+                    fields.append(Field(key, value, pos, 0))
+                    if value is None:
+                        break
+                    pos = end
+        except (IndexError, UnicodeDecodeError):
+            return None
+        return fields
+
+    def patch(self, data: bytes, field: Field, value: int) -> Optional[bytearray]:
+        if not field.width or not 0 <= value < 1 << 64:
+            return None
+        buffer = bytearray(data)
+        buffer[field.offset:field.offset + field.width] = msgpack.packb(value)
+        return buffer
+
+class CborCodec(BaseCodec):
+    name = "cbor"
+
+    def dumps(self, message: Message, default: Default = None) -> bytes:
+        if default is None:
+            return cbor2.dumps(message)
+        return cbor2.dumps(message, default=lambda encoder, value: encoder.encode(default(value)))
+
+    def loads(self, data: bytes) -> Message:
+        return cbor2.loads(data)
+
+class ObjectCodec(BaseCodec):
+    """
+    Passes messages through as they are, for transports that stay inside
+    the process. Never offered over a network handshake.
+    """
+    name = "object"
+    serializes = False
+
+    def dumps(self, message: Message, default: Default = None) -> Message: # type: ignore
+        return message
+
+    def loads(self, data: Message) -> Message: # type: ignore
+        return data
+
+    def peek(self, data: Message, count: int = 3) -> Optional[List[Field]]: # type: ignore
+        if type(data) is not dict:
+            return None
+        fields: List[Field] = []
+        for key, value in data.items():
+            if len(fields) >= count:
+                break
+            fields.append(Field(key, value, 0, 0))
+        return fields
+
+    def patch(self, data: Message, field: Field, value: int) -> Message: # type: ignore
+        return {**data, field.key: value}
+
+_MSGPACK_UINTS = {0xcc: 2, 0xcd: 3, 0xce: 5, 0xcf: 9}
+
+def _msgpack_str(data: bytes, pos: int):
+    kind = data[pos]
+    if 0xa0 <= kind <= 0xbf:
+        size, pos = kind & 0x1f, pos + 1
+    elif kind == 0xd9:
+        size, pos = data[pos + 1], pos + 2
+    elif kind == 0xda:
+        size, pos = int.from_bytes(data[pos + 1:pos + 3], "big"), pos + 3
+    else:
+        return None, pos
+    return data[pos:pos + size].decode(), pos + size
+
+PROTOCOL_PREFIX = "lacia."
+
+codecs: Dict[str, Type[BaseCodec]] = {}
+_instances: Dict[str, BaseCodec] = {}
+
+def register_codec(codec: Type[BaseCodec]) -> Type[BaseCodec]:
+    codecs[codec.name] = codec
+    _instances.pop(codec.name, None)
+    return codec
+
+def get_codec(name: Optional[str] = None) -> BaseCodec:
+    """
+    Codec registered as `name`, or BSON when nothing was negotiated.
+    """
+    name = name if name in codecs else BsonCodec.name
+    codec = _instances.get(name) # type: ignore
+    if codec is None:
+        codec = _instances[name] = codecs[name]() # type: ignore
+    return codec
+
+def available_codecs() -> List[str]:
+    """
+    Registered codecs that carry bytes natively, fastest first; these are
+    offered during the handshake unless a transport is given a list.
+    """
+    return [name for name in ("msgpack", "cbor", "bson") if name in codecs]
+
+def to_protocols(names: Iterable[str], compressions: Iterable[str] = ()) -> List[str]:
+    """
+    Subprotocols to offer: every codec with each compression
+    (`lacia.<codec>+<compression>`) ahead of the codec alone.
+    """
+    compressions = list(compressions)
+    protocols = []
+    for name in names:
+        protocols.extend(f"{PROTOCOL_PREFIX}{name}+{compression}" for compression in compressions)
+        protocols.append(PROTOCOL_PREFIX + name)
+    return protocols
+
+def from_protocol(protocol: Optional[str]) -> Optional[str]:
+    if protocol and protocol.startswith(PROTOCOL_PREFIX):
+        return protocol[len(PROTOCOL_PREFIX):].partition("+")[0]
+    return None
+
+def compression_from_protocol(protocol: Optional[str]) -> Optional[str]:
+    if protocol and protocol.startswith(PROTOCOL_PREFIX):
+        return protocol.partition("+")[2] or None
+    return None
+
+register_codec(BsonCodec)
+register_codec(JsonCodec)
+register_codec(ObjectCodec)
+if msgpack is not None:
+    register_codec(MsgpackCodec)
+if cbor2 is not None:
+    register_codec(CborCodec)
@@ -0,0 +1,222 @@
+import time
+import zlib
+import hashlib
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Optional, Type
+
+from lacia.exception import JsonRpcWsConnectException
+
+try:
+    import zstandard
+except ImportError: # pragma: no cover
+    zstandard = None
+
+RAW, PACKED = b"\x00", b"\x01"
+
+class BaseCompressor(ABC):
+    name: str
+
+    def __init__(self, level: Optional[int] = None, dictionary: Optional[bytes] = None) -> None:
+        self.level = level
+        self.dictionary = dictionary
+
+    @abstractmethod
+    def compress(self, data: bytes) -> bytes:
+        ...
+
+    @abstractmethod
+    def decompress(self, data: bytes, limit: Optional[int] = None) -> bytes:
+        """
+        Raises `JsonRpcWsConnectException` when the output would exceed
+        `limit` bytes.
+        """
+        ...
+
+def oversized(limit: int) -> JsonRpcWsConnectException:
+    return JsonRpcWsConnectException(f"decompressed frame exceeds {limit} bytes")
+
+class DeflateCompressor(BaseCompressor):
+    """
+    Raw deflate, one independent stream per message so frames can be
+    decoded in any order; a dictionary is used as the zlib preset.
+    """
+    name = "deflate"
+
+    def compress(self, data: bytes) -> bytes:
+        level = zlib.Z_DEFAULT_COMPRESSION if self.level is None else self.level
+        if self.dictionary:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=self.dictionary)
+        else:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data: bytes, limit: Optional[int] = None) -> bytes:
+        if self.dictionary:
+            decompressor = zlib.decompressobj(-15, zdict=self.dictionary)
+        else:
+            decompressor = zlib.decompressobj(-15)
+        if limit is None:
+            return decompressor.decompress(data) + decompressor.flush()
+        output = decompressor.decompress(data, limit + 1)
+        if len(output) > limit or decompressor.unconsumed_tail:
+            raise oversized(limit)
+        output += decompressor.flush()
+        if len(output) > limit:
+            raise oversized(limit)
+        return output
+
+class ZstdCompressor(BaseCompressor):
+    name = "zstd"
+
+    def __init__(self, level: Optional[int] = None, dictionary: Optional[bytes] = None) -> None:
+        super().__init__(level, dictionary)
+        data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None # type: ignore
+        self._compressor = zstandard.ZstdCompressor(level=3 if level is None else level, dict_data=data) # type: ignore
+        self._decompressor = zstandard.ZstdDecompressor(dict_data=data) # type: ignore
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def decompress(self, data: bytes, limit: Optional[int] = None) -> bytes:
+        if limit is None:
+            return self._decompressor.decompress(data)
+        with self._decompressor.stream_reader(data) as reader:
+            output = reader.read(limit + 1)
+        if len(output) > limit:
+            raise oversized(limit)
+        return output
+
+compressors: Dict[str, Type[BaseCompressor]] = {}
+
+def register_compressor(compressor: Type[BaseCompressor]) -> Type[BaseCompressor]:
+    compressors[compressor.name] = compressor
+    return compressor
+
+def available_compressions() -> List[str]:
+    """
+    Registered algorithms, best first; these are offered during the
+    handshake unless a transport is given a list.
+    """
+    return [name for name in ("zstd", "deflate") if name in compressors]
+
+def dictionary_id(dictionary: bytes) -> str:
+    return hashlib.sha256(dictionary).hexdigest()[:8]
+
+def train_dictionary(samples: List[bytes], size: int = 16 * 1024) -> bytes:
+    """
+    A dictionary for small, repetitive messages, e.g. encoded frames
+    captured from real traffic. Trained by zstd when it is installed,
+    otherwise the most recent samples are used as a zlib preset.
+    """
+    if zstandard is not None:
+        try:
+            return zstandard.train_dictionary(size, samples).as_bytes()
+        except zstandard.ZstdError:
+            pass
+    return b"".join(samples)[-size:]
+
+def offers(names: Iterable[str], dictionary: Optional[bytes] = None) -> List[str]:
+    """
+    Compression names to negotiate, in order of preference: each
+    algorithm with the shared dictionary (`<name>.<dictionary id>`), then
+    each without it.
+    """
+    names = [name for name in names if name in compressors]
+    if not dictionary:
+        return names
+    did = dictionary_id(dictionary)
+    return [f"{name}.{did}" for name in names] + names
+
+class Compression:
+    """
+    Compression of one connection's message frames. Every frame carries a
+    one-byte flag, so messages under `threshold` bytes, or that do not
+    shrink, are sent as they are. Received frames may inflate to at most
+    `limit` bytes.
+    """
+
+    def __init__(self, compressor: BaseCompressor, threshold: int, limit: Optional[int] = None) -> None:
+        self.compressor = compressor
+        self.threshold = threshold
+        self.limit = limit
+        self.sent = self.received = 0
+        self.compressed = self.decompressed = 0
+        self.raw_out = self.wire_out = 0
+        self.raw_in = self.wire_in = 0
+        self.compress_time = self.decompress_time = 0.0
+
+    @property
+    def name(self) -> str:
+        if self.compressor.dictionary:
+            return f"{self.compressor.name}.{dictionary_id(self.compressor.dictionary)}"
+        return self.compressor.name
+
+    def compress(self, data: Any) -> bytes:
+        self.sent += 1
+        size = len(data)
+        self.raw_out += size
+        if size >= self.threshold:
+            start = time.perf_counter()
+            packed = self.compressor.compress(data)
+            self.compress_time += time.perf_counter() - start
+            if len(packed) + 1 < size:
+                self.compressed += 1
+                self.wire_out += len(packed) + 1
+                return PACKED + packed
+        self.wire_out += size + 1
+        return RAW + data
+
+    def decompress(self, data: bytes) -> bytes:
+        self.received += 1
+        self.wire_in += len(data)
+        if data[:1] == PACKED:
+            start = time.perf_counter()
+            data = self.compressor.decompress(memoryview(data)[1:], self.limit)
+            self.decompress_time += time.perf_counter() - start
+            self.decompressed += 1
+        else:
+            data = data[1:]
+        self.raw_in += len(data)
+        return data
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "algorithm": self.name,
+            "threshold": self.threshold,
+            "sent": self.sent,
+            "compressed": self.compressed,
+            "received": self.received,
+            "decompressed": self.decompressed,
+            "ratio_out": self.wire_out / self.raw_out if self.raw_out else 1.0,
+            "ratio_in": self.wire_in / self.raw_in if self.raw_in else 1.0,
+            "compress_ms": self.compress_time * 1000,
+            "decompress_ms": self.decompress_time * 1000,
+        }
+
+def get_compression(
+    name: Optional[str],
+    dictionary: Optional[bytes] = None,
+    level: Optional[int] = None,
+    threshold: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> Optional[Compression]:
+    """
+    The `Compression` for a negotiated name, `None` when nothing was.
+    Without an explicit `threshold`, messages from 1 KiB are compressed,
+    or from 64 bytes with a dictionary. Transports pass their
+    `max_msg_size` as `limit`, which bounds frames after decompression.
+    """
+    if not name:
+        return None
+    algorithm, _, did = name.partition(".")
+    if algorithm not in compressors:
+        return None
+    if not did:
+        dictionary = None
+    if threshold is None:
+        threshold = 64 if dictionary else 1024
+    return Compression(compressors[algorithm](level, dictionary), threshold, limit)
+
+register_compressor(DeflateCompressor)
+if zstandard is not None:
+    register_compressor(ZstdCompressor)
@@ -1,12 +1,14 @@
+import socket
 import asyncio
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 
 import orjson
-import bson
 import aiohttp
 from aiohttp import web, WSCloseCode
 
 from lacia.network.abcbase import BaseServer, Connection
+from lacia.network.codec import BaseCodec, available_codecs, get_codec, to_protocols, from_protocol, compression_from_protocol
+from lacia.network.compress import Compression, available_compressions, get_compression, offers
 from lacia.logger import logger
 from lacia.utils.tool import CallObj
 from lacia.exception import JsonRpcWsConnectException
@@ -19,7 +21,16 @@ class AioServer(BaseServer[web.WebSocketResponse]):
         path: str = "",
         host: str = "localhost",
         port: int = 8080,
-        loop: Optional[asyncio.AbstractEventLoop] = None
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+        codecs: Optional[List[str]] = None,
+        max_msg_size: int = 4 * 1024 * 1024,
+        compression: Optional[List[str]] = None,
+        compress_dictionary: Optional[bytes] = None,
+        compress_threshold: Optional[int] = None,
+        compress_level: Optional[int] = None,
+        metrics_path: Optional[str] = "/metrics",
+        reuse_port: bool = False,
+        sock: Optional[socket.socket] = None,
     ) -> None:
         self.app = web.Application()
         self.active_connections: Connection[web.WebSocketResponse] = Connection()
@@ -28,17 +39,35 @@ class AioServer(BaseServer[web.WebSocketResponse]):
         self.path = path
         self.host = host
         self.port = port
+        self.codecs = codecs if codecs is not None else available_codecs()
+        self.max_msg_size = max_msg_size
+        self.compression_names = offers(compression if compression is not None else available_compressions(), compress_dictionary)
+        self.compress_dictionary = compress_dictionary
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+        self.compressions: Dict[web.WebSocketResponse, Compression] = {}
+        self.metrics_path = metrics_path
+        self.reuse_port = reuse_port
+        self.sock = sock
 
     def start(self) -> None: 
         self.app.add_routes([web.get(self.path, self.websocket_handler)])
+        if self.metrics_path and "metrics" in self.on_events:
+            self.app.add_routes([web.get(self.metrics_path, self.metrics_handler)])
         if self.loop is None: 
             self.loop = asyncio.get_event_loop()
-        web.run_app(self.app, host=self.host, port=self.port, print=logger.info, loop=self.loop)  # type: ignore 
+        if self.sock is not None:
+            web.run_app(self.app, sock=self.sock, print=logger.info, loop=self.loop)  # type: ignore
+        else:
+            web.run_app(self.app, host=self.host, port=self.port, reuse_port=self.reuse_port or None, print=logger.info, loop=self.loop)  # type: ignore
 
     async def websocket_handler(self, request):
         event = asyncio.Event()
-        ws = web.WebSocketResponse(autoclose=False)
+        ws = web.WebSocketResponse(autoclose=False, protocols=to_protocols(self.codecs, self.compression_names), max_msg_size=self.max_msg_size)
         await ws.prepare(request)
+        compression = get_compression(compression_from_protocol(ws.ws_protocol), self.compress_dictionary, self.compress_level, self.compress_threshold, self.max_msg_size)
+        if compression is not None:
+            self.compressions[ws] = compression
         self.active_connections.set_ws(ws, event)
         
         logger.success(f"{str(ws)} connected.")
@@ -50,12 +79,23 @@ class AioServer(BaseServer[web.WebSocketResponse]):
         await event.wait()
         return ws
 
+    async def metrics_handler(self, request):
+        obj = self.on_events["metrics"]
+        text = obj.method(*obj.args, **obj.kwargs)
+        return web.Response(body=text.encode(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    def codec(self, websocket: web.WebSocketResponse) -> BaseCodec:
+        return get_codec(from_protocol(websocket.ws_protocol))
+
+    def compression(self, websocket: web.WebSocketResponse) -> Optional[Compression]:
+        return self.compressions.get(websocket)
+
     def disconnect(self, websocket: web.WebSocketResponse):
-        for ws, event in self.active_connections.ws.items():
-            if ws == websocket: 
-                event.set()
-                self.active_connections.clear_ws(ws)
-                break
+        self.compressions.pop(websocket, None)
+        event = self.active_connections.ws.get(websocket)
+        if event is not None:
+            event.set()
+            self.active_connections.clear_ws(websocket)
 
     async def receive(self, websocket: web.WebSocketResponse):
         try:
@@ -74,10 +114,17 @@ class AioServer(BaseServer[web.WebSocketResponse]):
             data = orjson.loads(data.data)
             return data
         elif data and data.type == aiohttp.WSMsgType.BINARY:
-            data = bson.loads(data.data)
+            compression = self.compression(websocket)
+            data = self.codec(websocket).loads(data.data if compression is None else compression.decompress(data.data))
             return data
         raise JsonRpcWsConnectException("Invalid data type.")
 
+    async def receive_raw(self, websocket: web.WebSocketResponse):
+        data = await self.receive(websocket)
+        if data and data.type in (aiohttp.WSMsgType.TEXT, aiohttp.WSMsgType.BINARY):
+            return data.data
+        raise JsonRpcWsConnectException("Invalid data type.")
+
     async def receive_bytes(self, websocket: web.WebSocketResponse):
         data = await self.receive(websocket)
         if data and data.type == aiohttp.WSMsgType.BINARY:
@@ -97,6 +144,20 @@ class AioServer(BaseServer[web.WebSocketResponse]):
         finally:
             return
 
+    async def iter_raw(self, websocket: web.WebSocketResponse):
+        try:
+            while True:
+                data = await self.receive_raw(websocket)
+                if data:
+                    yield data
+        except JsonRpcWsConnectException:
+            logger.info(f"{str(websocket)} disconnected.")
+        except Exception as e:
+            logger.error(e)
+            logger.info(f"{str(websocket)} disconnected.")
+        finally:
+            return
+
     async def iter_json(self, websocket: web.WebSocketResponse):
         try:
             while True:
@@ -115,7 +176,9 @@ class AioServer(BaseServer[web.WebSocketResponse]):
         self, websocket: web.WebSocketResponse, message: dict, binary: bool = True
     ):
         if binary:
-            return await websocket.send_bytes(bson.dumps(message))
+            data = self.codec(websocket).dumps(message)
+            compression = self.compression(websocket)
+            return await websocket.send_bytes(data if compression is None else compression.compress(data))
         return await websocket.send_json(message)
 
     async def send_bytes(self, websocket: web.WebSocketResponse, message: bytes):
@@ -125,7 +188,9 @@ class AioServer(BaseServer[web.WebSocketResponse]):
         name = str(websocket)
         obj = self.on_events.get("disconnect")
         if not obj is None:
-            await obj.method(websocket, *obj.args, **obj.kwargs)
+            result = obj.method(websocket, *obj.args, **obj.kwargs)
+            if asyncio.iscoroutine(result):
+                await result
         self.disconnect(websocket)
         logger.info(f"{name} disconnected.")
 
@@ -133,9 +198,9 @@ class AioServer(BaseServer[web.WebSocketResponse]):
         await self.app.shutdown()
 
     async def on_shutdown(self):
-        for ws, event in self.active_connections.ws.items():
+        for ws, info in self.active_connections.connections():
             await ws.close(code=WSCloseCode.GOING_AWAY, message=b"Server shutdown")
-            event.set()
+            info.event.set()
 
     def on(self, event: str, func, args: Optional[tuple] = None, kwargs: Optional[dict] = None) -> None:
         self.on_events[event] = CallObj(method=func, args=args, kwargs=kwargs)
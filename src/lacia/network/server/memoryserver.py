@@ -0,0 +1,167 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from lacia.network.abcbase import BaseServer, Connection
+from lacia.network.codec import BaseCodec, available_codecs, get_codec
+from lacia.network.compress import Compression
+from lacia.logger import logger
+from lacia.types import Message
+from lacia.utils.tool import CallObj
+from lacia.exception import JsonRpcWsConnectException
+
+_CLOSE = object()
+
+class MemorySocket:
+    """
+    One end of an in-process connection: frames sent on it are put on its
+    peer's queue.
+    """
+
+    def __init__(self, codec: str) -> None:
+        self.protocol = codec
+        self.queue: "asyncio.Queue[Any]" = asyncio.Queue()
+        self.peer: Optional["MemorySocket"] = None
+        self.closed = False
+
+    @classmethod
+    def pair(cls, codec: str) -> "tuple[MemorySocket, MemorySocket]":
+        a, b = cls(codec), cls(codec)
+        a.peer, b.peer = b, a
+        return a, b
+
+    async def send(self, data: Any) -> None:
+        if self.closed or self.peer is None or self.peer.closed:
+            raise JsonRpcWsConnectException("memory socket closed")
+        self.peer.queue.put_nowait(data)
+
+    async def receive(self) -> Any:
+        data = await self.queue.get()
+        if data is _CLOSE:
+            self.queue.put_nowait(_CLOSE)
+            raise JsonRpcWsConnectException("memory socket closed")
+        return data
+
+    async def close(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put_nowait(_CLOSE)
+        if self.peer is not None:
+            self.peer.queue.put_nowait(_CLOSE)
+
+servers: Dict[str, "MemoryServer"] = {}
+
+class MemoryServer(BaseServer[MemorySocket]):
+    """
+    In-process server for `MemoryClient`s connecting under the same `name`.
+
+    Messages are passed as Python objects, shared and not copied, so
+    encoder fallbacks and handles do not apply. With `serialize`, every
+    frame goes through a real codec (`codec`, the fastest available by
+    default) as it would over a websocket, to catch wire-compatibility
+    bugs. `start` returns once the server accepts connections.
+    """
+
+    def __init__(self, name: str = "default", serialize: bool = False, codec: Optional[str] = None) -> None:
+        self.name = name
+        self.active_connections: Connection[MemorySocket] = Connection()
+        self.name_connections: Dict[str, MemorySocket] = {}
+        self.on_events: Dict[str, CallObj] = {}
+        self.codec_name = (codec or available_codecs()[0]) if serialize else "object"
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> "MemoryServer":
+        if servers.get(self.name, self) is not self:
+            raise JsonRpcWsConnectException(f"memory server {self.name!r} is already running")
+        servers[self.name] = self
+        logger.info(f"{self.__class__.__name__} listening: memory://{self.name}")
+        return self
+
+    async def connect(self) -> MemorySocket:
+        """
+        Accept a client: returns its end of a new connection.
+        """
+        if servers.get(self.name) is not self:
+            raise JsonRpcWsConnectException(f"memory server {self.name!r} is not running")
+        ws, peer = MemorySocket.pair(self.codec_name)
+        self.active_connections.set_ws(ws, asyncio.Event())
+        logger.success(f"{str(ws)} connected.")
+        obj = self.on_events.get("connect")
+        if obj is not None:
+            task = asyncio.get_running_loop().create_task(obj.method(ws, *obj.args, **obj.kwargs))
+            self._tasks.append(task)
+            task.add_done_callback(self._tasks.remove)
+        return peer
+
+    def codec(self, websocket: MemorySocket) -> BaseCodec:
+        return get_codec(websocket.protocol)
+
+    def compression(self, websocket: MemorySocket) -> Optional[Compression]:
+        return None
+
+    def disconnect(self, websocket: MemorySocket):
+        event = self.active_connections.ws.get(websocket)
+        if event is not None:
+            event.set()
+            self.active_connections.clear_ws(websocket)
+
+    async def receive(self, websocket: MemorySocket):
+        try:
+            return await websocket.receive()
+        except JsonRpcWsConnectException:
+            if websocket in self.active_connections:
+                await self.close_ws(websocket)
+            raise JsonRpcWsConnectException(f"{self.__class__.__name__} closed.")
+
+    async def receive_json(self, websocket: MemorySocket):
+        return self.codec(websocket).loads(await self.receive(websocket))
+
+    async def receive_raw(self, websocket: MemorySocket):
+        return await self.receive(websocket)
+
+    async def receive_bytes(self, websocket: MemorySocket):
+        return await self.receive(websocket)
+
+    async def iter_raw(self, websocket: MemorySocket):
+        try:
+            while True:
+                yield await self.receive(websocket)
+        except JsonRpcWsConnectException:
+            logger.info(f"{str(websocket)} disconnected.")
+
+    iter_bytes = iter_raw
+
+    async def iter_json(self, websocket: MemorySocket):
+        async for data in self.iter_raw(websocket):
+            yield self.codec(websocket).loads(data)
+
+    async def send_json(self, websocket: MemorySocket, message: Message, binary: bool = True):
+        return await websocket.send(self.codec(websocket).dumps(message))
+
+    async def send_bytes(self, websocket: MemorySocket, message: Any):
+        if isinstance(message, (memoryview, bytearray)):
+            message = bytes(message)
+        return await websocket.send(message)
+
+    async def close_ws(self, websocket: MemorySocket):
+        name = str(websocket)
+        obj = self.on_events.get("disconnect")
+        if websocket in self.active_connections and obj is not None:
+            result = obj.method(websocket, *obj.args, **obj.kwargs)
+            if asyncio.iscoroutine(result):
+                await result
+        self.disconnect(websocket)
+        await websocket.close()
+        logger.info(f"{name} disconnected.")
+
+    async def close(self):
+        if servers.get(self.name) is self:
+            del servers[self.name]
+        for ws, info in self.active_connections.connections():
+            await self.close_ws(ws)
+
+    def closed(self) -> bool:
+        return servers.get(self.name) is not self
+
+    def on(self, event: str, func, args: Optional[tuple] = None, kwargs: Optional[dict] = None) -> None:
+        self.on_events[event] = CallObj(method=func, args=args, kwargs=kwargs)
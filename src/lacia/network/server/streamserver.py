@@ -0,0 +1,253 @@
+import socket
+import struct
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from lacia.network.abcbase import BaseServer, Connection
+from lacia.network.codec import BaseCodec, available_codecs, get_codec, to_protocols, from_protocol, compression_from_protocol
+from lacia.network.compress import Compression, available_compressions, get_compression, offers
+from lacia.logger import logger
+from lacia.types import Message
+from lacia.utils.tool import CallObj
+from lacia.exception import JsonRpcWsConnectException
+
+HEADER = struct.Struct("!I")
+
+def tune(writer: asyncio.StreamWriter, buffer: int) -> None:
+    """
+    Disable Nagle on TCP and size the kernel socket buffers to `buffer`.
+    """
+    sock = writer.get_extra_info("socket")
+    if sock is None:
+        return
+    if sock.family in (socket.AF_INET, socket.AF_INET6):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    for option in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, option, buffer)
+        except OSError:
+            pass
+    writer.transport.set_write_buffer_limits(high=buffer)
+
+class StreamSocket:
+    """
+    A TCP or Unix domain socket carrying length-prefixed binary frames:
+    a 4-byte big-endian length, then the frame.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, max_msg_size: int) -> None:
+        self.reader = reader
+        self.writer = writer
+        self.max_msg_size = max_msg_size
+        self.protocol: Optional[str] = None
+        self.peer = writer.get_extra_info("peername")
+
+    async def receive(self) -> bytes:
+        try:
+            size, = HEADER.unpack(await self.reader.readexactly(HEADER.size))
+            if size > self.max_msg_size:
+                raise JsonRpcWsConnectException(f"frame of {size} bytes exceeds max_msg_size")
+            return await self.reader.readexactly(size)
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            raise JsonRpcWsConnectException(f"stream closed ({e})")
+
+    async def send(self, data: Any) -> None:
+        if self.writer.is_closing():
+            raise JsonRpcWsConnectException("stream closed")
+        size = data.nbytes if isinstance(data, memoryview) else len(data)
+        self.writer.writelines((HEADER.pack(size), data))
+        try:
+            await self.writer.drain()
+        except ConnectionError as e:
+            raise JsonRpcWsConnectException(f"stream closed ({e})")
+
+    async def close(self) -> None:
+        if self.writer.is_closing():
+            return
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+    @property
+    def closed(self) -> bool:
+        return self.writer.is_closing()
+
+    def __str__(self) -> str:
+        return f"<StreamSocket {self.peer or 'unix'}>"
+
+def select_protocol(offered: bytes, protocols: List[str]) -> str:
+    """
+    The first of our `protocols` the peer offered, as a websocket server
+    picks a subprotocol; empty when none matches.
+    """
+    names = set(offered.decode().split(","))
+    return next((protocol for protocol in protocols if protocol in names), "")
+
+class StreamServer(BaseServer[StreamSocket]):
+    """
+    Server over raw TCP, or a Unix domain socket at `path`, without the
+    HTTP upgrade and websocket framing. Codec and compression are
+    negotiated by a first frame from each side, the client's offer and the
+    server's choice. `start` serves until `close`; `started` is set once
+    it listens.
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        port: int = 8080,
+        path: Optional[str] = None,
+        loop: Optional[asyncio.AbstractEventLoop] = None,
+        codecs: Optional[List[str]] = None,
+        max_msg_size: int = 4 * 1024 * 1024,
+        compression: Optional[List[str]] = None,
+        compress_dictionary: Optional[bytes] = None,
+        compress_threshold: Optional[int] = None,
+        compress_level: Optional[int] = None,
+        buffer: int = 1024 * 1024,
+        reuse_port: bool = False,
+        sock: Optional[socket.socket] = None,
+    ) -> None:
+        self.active_connections: Connection[StreamSocket] = Connection()
+        self.name_connections: Dict[str, StreamSocket] = {}
+        self.on_events: Dict[str, CallObj] = {}
+        self.loop = loop
+        self.host = host
+        self.port = port
+        self.path = path
+        self.codecs = codecs if codecs is not None else available_codecs()
+        self.max_msg_size = max_msg_size
+        self.compression_names = offers(compression if compression is not None else available_compressions(), compress_dictionary)
+        self.compress_dictionary = compress_dictionary
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+        self.compressions: Dict[StreamSocket, Compression] = {}
+        self.buffer = buffer
+        self.reuse_port = reuse_port
+        self.sock = sock
+        self.protocols = to_protocols(self.codecs, self.compression_names)
+        self.started = asyncio.Event()
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> None:
+        if self.path is not None:
+            self.server = await asyncio.start_unix_server(self.stream_handler, None if self.sock else self.path, limit=self.buffer, sock=self.sock)
+            address = f"unix://{self.path}"
+        else:
+            self.server = await asyncio.start_server(
+                self.stream_handler, None if self.sock else self.host, None if self.sock else self.port,
+                limit=self.buffer, sock=self.sock, reuse_port=self.reuse_port or None,
+            )
+            self.port = self.server.sockets[0].getsockname()[1]
+            address = f"tcp://{self.host}:{self.port}"
+        logger.info(f"{self.__class__.__name__} listening: {address}")
+        self.started.set()
+        async with self.server:
+            try:
+                await self.server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+    async def stream_handler(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        tune(writer, self.buffer)
+        ws = StreamSocket(reader, writer, self.max_msg_size)
+        try:
+            ws.protocol = select_protocol(await ws.receive(), self.protocols)
+            await ws.send(ws.protocol.encode())
+        except JsonRpcWsConnectException as e:
+            logger.info(f"{str(ws)} handshake failed: {e}")
+            await ws.close()
+            return
+        compression = get_compression(compression_from_protocol(ws.protocol), self.compress_dictionary, self.compress_level, self.compress_threshold, self.max_msg_size)
+        if compression is not None:
+            self.compressions[ws] = compression
+        self.active_connections.set_ws(ws, asyncio.Event())
+
+        logger.success(f"{str(ws)} connected.")
+
+        obj = self.on_events.get("connect")
+        if obj is not None:
+            await obj.method(ws, *obj.args, **obj.kwargs)
+        if ws in self.active_connections:
+            await self.close_ws(ws)
+
+    def codec(self, websocket: StreamSocket) -> BaseCodec:
+        return get_codec(from_protocol(websocket.protocol))
+
+    def compression(self, websocket: StreamSocket) -> Optional[Compression]:
+        return self.compressions.get(websocket)
+
+    def disconnect(self, websocket: StreamSocket):
+        self.compressions.pop(websocket, None)
+        event = self.active_connections.ws.get(websocket)
+        if event is not None:
+            event.set()
+            self.active_connections.clear_ws(websocket)
+
+    async def receive(self, websocket: StreamSocket):
+        try:
+            return await websocket.receive()
+        except JsonRpcWsConnectException:
+            if websocket in self.active_connections:
+                await self.close_ws(websocket)
+            raise JsonRpcWsConnectException(f"{self.__class__.__name__} closed.")
+
+    async def receive_json(self, websocket: StreamSocket):
+        data = await self.receive(websocket)
+        compression = self.compression(websocket)
+        return self.codec(websocket).loads(data if compression is None else compression.decompress(data))
+
+    async def receive_raw(self, websocket: StreamSocket):
+        return await self.receive(websocket)
+
+    async def receive_bytes(self, websocket: StreamSocket):
+        return await self.receive(websocket)
+
+    async def iter_raw(self, websocket: StreamSocket):
+        try:
+            while True:
+                yield await self.receive(websocket)
+        except JsonRpcWsConnectException:
+            logger.info(f"{str(websocket)} disconnected.")
+
+    iter_bytes = iter_raw
+
+    async def iter_json(self, websocket: StreamSocket):
+        try:
+            while True:
+                yield await self.receive_json(websocket)
+        except JsonRpcWsConnectException:
+            logger.info(f"{str(websocket)} disconnected.")
+
+    async def send_json(self, websocket: StreamSocket, message: Message, binary: bool = True):
+        data = self.codec(websocket).dumps(message)
+        compression = self.compression(websocket)
+        return await websocket.send(data if compression is None else compression.compress(data))
+
+    async def send_bytes(self, websocket: StreamSocket, message: bytes):
+        return await websocket.send(message)
+
+    async def close_ws(self, websocket: StreamSocket):
+        name = str(websocket)
+        obj = self.on_events.get("disconnect")
+        if websocket in self.active_connections and obj is not None:
+            result = obj.method(websocket, *obj.args, **obj.kwargs)
+            if asyncio.iscoroutine(result):
+                await result
+        self.disconnect(websocket)
+        await websocket.close()
+        logger.info(f"{name} disconnected.")
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+        for ws, info in self.active_connections.connections():
+            await self.close_ws(ws)
+
+    def closed(self) -> bool:
+        return self.server is None or not self.server.is_serving()
+
+    def on(self, event: str, func, args: Optional[tuple] = None, kwargs: Optional[dict] = None) -> None:
+        self.on_events[event] = CallObj(method=func, args=args, kwargs=kwargs)
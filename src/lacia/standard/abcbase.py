@@ -1,24 +1,101 @@
 from abc import ABC, abstractmethod, abstractclassmethod
 
-from typing import TypeVar, Generic, Type, Any, Dict, NamedTuple, Hashable
+from typing import TypeVar, Generic, Type, Any, Dict, Hashable, Iterator, Mapping, Optional
 from typing_extensions import Self
 
 T = TypeVar("T")
 S = TypeVar("S")
 
-class Namespace(NamedTuple):
+class Namespace:
+    """
+    Names visible to remote calls: `builtins`, then `globals`, then the
+    `locals` of each connection, later layers shadowing earlier ones.
+    All three are read live, so the dicts may be edited in place.
+    """
 
-    builtins: Dict[str, Any] = {}
-    globals: Dict[str, Any] = {}
-    locals: Dict[Hashable, Dict[str, Any]] = {}
+    def __init__(
+        self,
+        builtins: Optional[Dict[str, Any]] = None,
+        globals: Optional[Dict[str, Any]] = None,
+        locals: Optional[Dict[Hashable, Dict[str, Any]]] = None,
+    ) -> None:
+        self.builtins = builtins if builtins is not None else {}
+        self.globals = globals if globals is not None else {}
+        self.locals = locals if locals is not None else {}
+        self._scopes: Dict[Hashable, Scope] = {}
 
-    def __getitem__(self, key: T) -> Dict[str, Any]:
+    def shares(self, name: str) -> bool:
+        return name in self.globals or name in self.builtins
 
-        return {
-            **self.builtins,
-            **self.globals,
-            **self.locals.get(key, {})
-        }      
+    def update(self, namespace: Dict[str, Any]) -> None:
+        self.globals.update(namespace)
+
+    def set_local(self, key: Hashable, name: str, value: Any) -> None:
+        local = self.locals.get(key)
+        if local is None:
+            local = self.locals[key] = {}
+        local[name] = value
+
+    def drop(self, key: Hashable) -> None:
+        self.locals.pop(key, None)
+        self._scopes.pop(key, None)
+
+    def scope(self, key: Hashable, fallback: Optional[Mapping[str, Any]] = None) -> "Scope":
+        scope = self._scopes.get(key)
+        if scope is None or scope.fallback is not fallback:
+            scope = self._scopes[key] = Scope(self, key, fallback)
+        return scope
+
+    def __getitem__(self, key: Hashable) -> "Scope":
+        return self.scope(key)
+
+class Scope(Mapping[str, Any]):
+    """
+    Lookup view of a `Namespace` for one connection, falling back to
+    `fallback` (the connection's stored results) for unknown names.
+    """
+
+    __slots__ = ("namespace", "key", "fallback")
+
+    def __init__(self, namespace: Namespace, key: Hashable, fallback: Optional[Mapping[str, Any]] = None) -> None:
+        self.namespace = namespace
+        self.key = key
+        self.fallback = fallback
+
+    def __getitem__(self, name: str) -> Any:
+        local = self.namespace.locals.get(self.key)
+        if local is not None and name in local:
+            return local[name]
+        globals = self.namespace.globals
+        if name in globals:
+            return globals[name]
+        builtins = self.namespace.builtins
+        if name in builtins:
+            return builtins[name]
+        if self.fallback is not None:
+            return self.fallback[name]
+        raise KeyError(name)
+
+    def __contains__(self, name: object) -> bool:
+        try:
+            self[name] # type: ignore
+        except KeyError:
+            return False
+        return True
+
+    def _names(self) -> Dict[str, None]:
+        names = dict.fromkeys(self.namespace.builtins)
+        names.update(dict.fromkeys(self.namespace.globals))
+        names.update(dict.fromkeys(self.namespace.locals.get(self.key, {})))
+        if self.fallback is not None:
+            names.update(dict.fromkeys(self.fallback))
+        return names
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._names())
+
+    def __len__(self) -> int:
+        return len(self._names())
 
 class BaseDataTrans(ABC, Generic[T]):
 
@@ -41,6 +118,9 @@ class BaseRunTime(ABC, Generic[S]):
     async def run(self, obj: S) -> Any:
         ...
 
+    async def execute(self, data: Any, datatrans: Type[BaseDataTrans]) -> Any:
+        return await self.run(datatrans.loads(data)) # type: ignore
+
 class BaseStandard(ABC, Generic[T, S]):
     
     datatrans: Type[BaseDataTrans[T]]
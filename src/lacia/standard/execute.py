@@ -38,13 +38,12 @@ class Standard(Generic[S]):
             return None, {"code": JsonRpcCode.ParseError, "message": "jsonrpc is None"}
         elif jsonrpc in cls.execute:
             runtime: BaseRunTime = cls.execute[jsonrpc].runtime(namespace, proxy, proxyresult)
-            obj = cls.execute[jsonrpc].datatrans.loads(data["method"]) # type: ignore
             try:
-                result = await runtime.run(obj)
-                if isinstance(result, proxy):
+                result = await runtime.execute(data["method"], cls.execute[jsonrpc].datatrans)
+                if isinstance(result, proxy) and not data.get("stream"):
                     result = await result
                 if isinstance(result, proxyresult):
-                    if not data["method"]["method"] in ("__aiter__", "__anext__"):
+                    if not _method_name(data["method"]) in ("__aiter__", "__anext__"):
                         result = result.visions
             except StopAsyncIteration as e:
                 return result, {"code": JsonRpcCode.StopAsyncIterationError, "message": ""}
@@ -54,3 +53,7 @@ class Standard(Generic[S]):
             return result, {"code": JsonRpcCode.InternalError, "message": str(error)} if error else None
         return None, {"code": JsonRpcCode.MethodNotFound, "message": f"jsonrpc {jsonrpc} not found"}
 
+def _method_name(method) -> str:
+    if isinstance(method, dict):
+        return method["method"]
+    return getattr(method, "method", None)
@@ -0,0 +1,286 @@
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple, TYPE_CHECKING
+
+from lacia.standard.jsonast.planner import Planner, Peer
+
+if TYPE_CHECKING:
+    from lacia.standard.jsonast.runtime import RunTime
+
+Plan = Callable[["RunTime", List[Any]], Awaitable[Any]]
+Arg = Tuple[int, Any, bool]
+
+SLOT = "$"
+_SCALARS = frozenset((str, int, float, bool, bytes, type(None)))
+LITERAL, NODE, CONTAINER = 0, 1, 2
+
+class Prepared(NamedTuple):
+    plan: Plan
+    slots: List[Any]
+    method: Optional[str]
+
+class Template:
+    """
+    A compiled plan whose slots are partly `{"$param": index}` markers,
+    filled from the parameters of each invocation.
+    """
+
+    def __init__(self, plan: Plan, slots: List[Any], method: Optional[str]) -> None:
+        self.plan = plan
+        self.method = method
+        self.slots = slots
+        self._params: List[Tuple[int, int]] = []
+        self._nested: List[Tuple[int, Any]] = []
+        for index, value in enumerate(slots):
+            if is_param(value):
+                self._params.append((index, value["$param"]))
+            elif _has_param(value):
+                self._nested.append((index, value))
+
+    def bind(self, params: List[Any]) -> Prepared:
+        slots = list(self.slots)
+        for index, position in self._params:
+            slots[index] = params[position]
+        for index, value in self._nested:
+            slots[index] = _substitute(value, params)
+        return Prepared(self.plan, slots, self.method)
+
+def is_param(value: Any) -> bool:
+    return isinstance(value, dict) and len(value) == 1 and "$param" in value
+
+def _has_param(value: Any) -> bool:
+    if is_param(value):
+        return True
+    elif isinstance(value, (list, tuple)):
+        return any(_has_param(v) for v in value)
+    elif isinstance(value, dict):
+        return any(_has_param(v) for v in value.values())
+    return False
+
+def _substitute(value: Any, params: List[Any]) -> Any:
+    if is_param(value):
+        return params[value["$param"]]
+    elif isinstance(value, (list, tuple)):
+        return type(value)(_substitute(v, params) for v in value)
+    elif isinstance(value, dict):
+        return {k: _substitute(v, params) for k, v in value.items()}
+    return value
+
+def is_ast(value: Any) -> bool:
+    return isinstance(value, dict) and len(value) == 4 and "obj" in value and "method" in value and "args" in value and "kwargs" in value
+
+class Compiler:
+    """
+    Turns the wire form of a `JsonAst` into a plan: nested closures that
+    evaluate it, with every literal argument replaced by a slot.
+
+    Plans are cached by the structural shape of the tree (object roots,
+    method and attribute names, nesting), so calls that only differ in
+    their literal arguments reuse the same plan and just fill new slots.
+    """
+
+    def __init__(self, planner: Planner, maxsize: int = 1024) -> None:
+        self.planner = planner
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._plans: "OrderedDict[Any, Plan]" = OrderedDict()
+        self._root = ["server", None] if planner.is_server else ["client", planner.self_name]
+
+    def compile(self, data: Any) -> Tuple[Plan, List[Any]]:
+        if not is_ast(data):
+            raise TypeError(f"method is not a jsonast: {data}")
+        slots: List[Any] = []
+        key = self._shape(data, slots)
+        plan = self._plans.get(key)
+        if plan is None:
+            self.misses += 1
+            plan = self._plans[key] = self._node(data, [0])
+            if len(self._plans) > self.maxsize:
+                self._plans.popitem(last=False)
+        else:
+            self.hits += 1
+            self._plans.move_to_end(key)
+        return plan, slots
+
+    def template(self, data: Any) -> Template:
+        plan, slots = self.compile(data)
+        return Template(plan, slots, data["method"])
+
+    def stats(self) -> Dict[str, Any]:
+        return {"plans": len(self._plans), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+    def _named(self, node: Dict[str, Any]) -> bool:
+        args = node["args"]
+        return (
+            args is not None and len(args) == 1 and type(args[0]) is str
+            and (node["method"] == "__getattr__" or node["obj"] is None or node["obj"] == self._root)
+        )
+
+    def _owner(self, node: Dict[str, Any]) -> Peer:
+        root = node["obj"]
+        while is_ast(root):
+            root = root["obj"]
+        return self.planner.root_owner(root)
+
+    def _shape(self, value: Any, slots: List[Any]) -> Any:
+        tp = type(value)
+        if tp in _SCALARS:
+            slots.append(value)
+            return SLOT
+        elif isinstance(value, dict):
+            if len(value) == 4 and "obj" in value and "method" in value and "args" in value and "kwargs" in value:
+                return self._node_shape(value, slots)
+            mark = len(slots)
+            keys = tuple(value)
+            items = tuple([self._shape(v, slots) for v in value.values()])
+            key: Any = (dict, keys, items)
+        elif isinstance(value, (list, tuple)):
+            mark = len(slots)
+            items = tuple([self._shape(v, slots) for v in value])
+            key = (tp, items)
+        else:
+            slots.append(value)
+            return SLOT
+        for item in items:
+            if item is not SLOT:
+                return key
+        del slots[mark:]
+        slots.append(value)
+        return SLOT
+
+    def _node_shape(self, node: Dict[str, Any], slots: List[Any]) -> Any:
+        obj, method, args, kwargs = node["obj"], node["method"], node["args"], node["kwargs"]
+        named = args is not None and len(args) == 1 and type(args[0]) is str
+        if isinstance(obj, dict):
+            obj_key = self._shape(obj, slots)
+        elif obj is None or obj == self._root:
+            return (None, method, args[0] if named else None)
+        else:
+            obj_key = tuple(obj) if isinstance(obj, list) else obj
+        if named and method == "__getattr__":
+            return (obj_key, method, args[0])
+        if method is None or method == "__anext__" or (args is None and kwargs is None):
+            return (obj_key, method, None)
+        args_key = None if args is None else tuple([self._shape(arg, slots) for arg in args])
+        kwargs_key = None if kwargs is None else (tuple(kwargs), tuple([self._shape(v, slots) for v in kwargs.values()]))
+        return (obj_key, method, args_key, kwargs_key)
+
+    def _value(self, value: Any, counter: List[int]) -> Tuple[bool, Any]:
+        if is_ast(value):
+            return False, self._node(value, counter)
+        elif isinstance(value, (list, tuple, dict)):
+            mark = counter[0]
+            items = [self._value(v, counter) for v in (value.values() if isinstance(value, dict) else value)]
+            if not all(literal for literal, _ in items):
+                return False, self._container(value, items)
+            counter[0] = mark
+        index = counter[0]
+        counter[0] += 1
+        return True, index
+
+    def _container(self, value: Any, items: List[Tuple[bool, Any]]) -> Plan:
+        if isinstance(value, dict):
+            keys = tuple(value)
+
+            async def mapping(rt: "RunTime", slots: List[Any]) -> Any:
+                return {k: slots[item] if literal else await item(rt, slots) for k, (literal, item) in zip(keys, items)}
+            return mapping
+
+        tp = type(value)
+
+        async def sequence(rt: "RunTime", slots: List[Any]) -> Any:
+            return tp([slots[item] if literal else await item(rt, slots) for literal, item in items])
+        return sequence
+
+    def _node(self, node: Dict[str, Any], counter: List[int]) -> Plan:
+        obj, method, args, kwargs = node["obj"], node["method"], node["args"], node["kwargs"]
+        named = self._named(node)
+
+        if is_ast(obj):
+            target = self._node(obj, counter)
+        elif obj is None or obj == self._root:
+            if not named:
+                raise TypeError(f"obj type error: {obj}")
+            name = args[0]
+
+            async def lookup(rt: "RunTime", slots: List[Any]) -> Any:
+                return rt.namespace[name]
+            return lookup
+        elif isinstance(obj, str):
+            async def target(rt: "RunTime", slots: List[Any]) -> Any:
+                return rt.namespace[obj]
+        elif isinstance(obj, list) and len(obj) == 2 and obj[0] == "server":
+            async def target(rt: "RunTime", slots: List[Any]) -> Any:
+                return rt.proxy(rt.rpc, vision=False)
+        elif isinstance(obj, list) and len(obj) == 2 and obj[0] == "client":
+            peer = obj[1]
+
+            async def target(rt: "RunTime", slots: List[Any]) -> Any:
+                return rt.proxy(rt.rpc, peer, vision=False)
+        else:
+            raise TypeError(f"obj type error: {obj}")
+
+        if method is None:
+            return target
+        if named:
+            attr = args[0]
+
+            async def attribute(rt: "RunTime", slots: List[Any]) -> Any:
+                return getattr(await target(rt, slots), attr)
+            return attribute
+        if args is None and kwargs is None:
+            async def bound(rt: "RunTime", slots: List[Any]) -> Any:
+                return getattr(await target(rt, slots), method)
+            return bound
+        if method == "__anext__":
+            async def anext(rt: "RunTime", slots: List[Any]) -> Any:
+                return await getattr(await target(rt, slots), method)()
+            return anext
+
+        owner = self._owner(node)
+        specs = [self._arg(arg, counter, owner) for arg in args or ()]
+        specs += [self._arg(arg, counter, owner) for arg in (kwargs or {}).values()]
+        count = len(args or ())
+        keys = tuple(kwargs or {})
+        is_call = method == "__call__"
+
+        async def call(rt: "RunTime", slots: List[Any]) -> Any:
+            obj = await target(rt, slots)
+            func = getattr(obj, method)
+            values = await _arguments(rt, owner, specs, slots)
+            a, kw = tuple(values[:count]), dict(zip(keys, values[count:]))
+            if is_call and asyncio.iscoroutinefunction(obj):
+                return await func(*a, **kw)
+            elif asyncio.iscoroutinefunction(func):
+                return await func(*a, **kw)
+            elif isinstance(obj, rt.proxy):
+                return func(*a, **kw)
+            return await rt.offload.call(obj if is_call else func, a, kw)
+        return call
+
+    def _arg(self, value: Any, counter: List[int], owner: Peer) -> Arg:
+        if is_ast(value):
+            peer = self._owner(value)
+            return NODE, self._node(value, counter), peer is not None and peer != owner
+        literal, item = self._value(value, counter)
+        return (LITERAL, item, False) if literal else (CONTAINER, item, False)
+
+async def _arguments(rt: "RunTime", owner: Peer, specs: List[Arg], slots: List[Any]) -> List[Any]:
+    values: List[Any] = []
+    fetch: List[int] = []
+    for index, (kind, item, remote) in enumerate(specs):
+        if kind == LITERAL:
+            values.append(slots[item])
+            continue
+        value = await item(rt, slots)
+        if kind == NODE:
+            if remote and isinstance(value, rt.proxy):
+                fetch.append(index)
+        elif owner is None:
+            value = await rt._resolve(value)
+        values.append(value)
+    if fetch:
+        for index, value in zip(fetch, await rt._fetch([values[i] for i in fetch])):
+            values[index] = value
+    return values
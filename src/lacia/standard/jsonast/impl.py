@@ -11,11 +11,14 @@ class BaseJsonAst(NamedTuple):
     kwargs: Optional[Dict[str, Any]] # Optional[Dict[str, "JsonAst" | Any]]
     
     def todict(self):
+        """
+        The AST as plain JSON-shaped values, tuples as lists.
+        """
         def handle_value(value):
             if isinstance(value, BaseJsonAst):
                 return value.todict()
             elif isinstance(value, (list, tuple)):
-                return type(value)(handle_value(v) for v in value)
+                return [handle_value(v) for v in value]
             elif isinstance(value, dict):
                 return {k: handle_value(v) for k, v in value.items()}
             else:
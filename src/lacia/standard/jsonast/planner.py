@@ -0,0 +1,65 @@
+from typing import Any, Optional, Set, Tuple
+
+from lacia.standard.jsonast.impl import JsonAst
+
+Peer = Optional[Tuple[str, Optional[str]]]
+
+class Planner:
+    """
+    Finds the peer that owns each subtree of a `JsonAst` graph.
+
+    The owner of a node is the root object of its `obj` chain: `None` for
+    objects living in the local namespace, otherwise `("server", None)` or
+    `("client", name)`. `RunTime` uses it to keep subtrees owned by the
+    callee inside the frame it ships, and to evaluate every other remote
+    subtree concurrently (batched per peer) before a call is made.
+    """
+
+    def __init__(self, is_server: bool, self_name: Optional[str]) -> None:
+        self.is_server = is_server
+        self.self_name = self_name
+
+    def owner(self, ast: JsonAst) -> Peer:
+        root = ast.obj
+        while isinstance(root, JsonAst):
+            root = root.obj
+        return self.root_owner(root)
+
+    def root_owner(self, root: Any) -> Peer:
+        if root is None or isinstance(root, str):
+            return None
+        if isinstance(root, list) and len(root) == 2:
+            if root[0] == "server":
+                return None if self.is_server else ("server", None)
+            elif root[0] == "client":
+                return None if (root[1] == self.self_name and not self.is_server) else ("client", root[1])
+        raise TypeError(f"obj type error: {root}")
+
+    def target(self, ast: Any) -> Peer:
+        """
+        The remote client owning every subtree of `ast`, or `None` if the
+        graph involves any other peer.
+        """
+        owners: Set[Peer] = set()
+        self._owners(ast, owners)
+        if len(owners) == 1:
+            owner = owners.pop()
+            if owner is not None and owner[0] == "client":
+                return owner
+        return None
+
+    def _owners(self, value: Any, owners: Set[Peer]) -> None:
+        if isinstance(value, JsonAst):
+            owners.add(self.owner(value))
+            while isinstance(value, JsonAst):
+                for arg in value.args or ():
+                    self._owners(arg, owners)
+                for arg in (value.kwargs or {}).values():
+                    self._owners(arg, owners)
+                value = value.obj
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                self._owners(item, owners)
+        elif isinstance(value, dict):
+            for item in value.values():
+                self._owners(item, owners)
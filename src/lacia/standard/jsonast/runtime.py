@@ -1,15 +1,17 @@
+from typing import Dict, Any, Type, Tuple, List, Optional, TYPE_CHECKING
 
-import asyncio
-from typing import Dict, Any, Type, TYPE_CHECKING
-
-from lacia.standard.abcbase import BaseRunTime, BaseStandard, Namespace
+from lacia.standard.abcbase import BaseRunTime, BaseStandard, BaseDataTrans, Namespace
 from lacia.standard.jsonast.impl import JsonAst
+from lacia.standard.jsonast.planner import Planner
+from lacia.standard.jsonast.compiler import Compiler, Prepared
 from lacia.types import Context
 
 if TYPE_CHECKING:
     from lacia.core.proxy import ProxyObj, ResultProxy
 
 class RunTime(BaseRunTime[JsonAst]):
+
+    compilers: Dict[Tuple[bool, Optional[str]], Compiler] = {}
     
     def __init__(self, namespace: Dict[str, Any], proxy: Type["ProxyObj"], proxyresult: Type["ResultProxy"]):
         self.namespace = namespace
@@ -18,70 +20,47 @@ class RunTime(BaseRunTime[JsonAst]):
         self.rpc = Context.rpc.get()
         self.is_server = self.rpc.is_server()
         self.self_name = self.rpc._name
+        self.offload = self.rpc._offload
+        self.compiler = self.compiler_for(self.is_server, self.self_name)
+        self.planner = self.compiler.planner
         # self.is_server = True
         # self.self_name = "server_test"
 
-    async def run(self, ast):
-        if isinstance(ast, JsonAst):
-            if isinstance(ast.obj, JsonAst):
-                obj = await self.run(ast.obj)
-            elif ast.obj is None or (ast.obj == ["server", None] and self.is_server) or (ast.obj == ["client", self.self_name] and not self.is_server):
-                if not ast.args is None:
-                    if len(ast.args) == 1 and isinstance(ast.args[0], str):
-                        obj = self.namespace[ast.args[0]]
-                        return obj
-                    else:
-                        raise TypeError(f"obj type error: {ast.obj}")
-                else:
-                    raise TypeError(f"obj type error: {ast.obj}")    
-            elif isinstance(ast.obj, str):
-                obj = self.namespace[ast.obj]
-            elif isinstance(ast.obj, list) and len(ast.obj) == 2 and ast.obj[0] == "server":
-                obj = self.proxy(self.rpc, vision=False)
-            elif isinstance(ast.obj, list) and len(ast.obj) == 2 and ast.obj[0] == "client":
-                obj = self.proxy(self.rpc, ast.obj[1], vision=False) 
-            else:
-                raise TypeError(f"obj type error: {ast.obj}")
-            if ast.method is None or ast.obj is None:
-                return obj
-            if not ast.args is None:
-                if len(ast.args) == 1 and ast.method == "__getattr__" and isinstance(ast.args[0], str):
-                    return getattr(obj, ast.args[0])
-            func = getattr(obj, ast.method)
-            if ast.args is None and ast.kwargs is None: 
-                return func
-            if ast.method == "__anext__":
-                return await func()
+    @classmethod
+    def compiler_for(cls, is_server: bool, self_name: Optional[str]) -> Compiler:
+        compiler = cls.compilers.get((is_server, self_name))
+        if compiler is None:
+            compiler = cls.compilers[(is_server, self_name)] = Compiler(Planner(is_server, self_name))
+        return compiler
+
+    async def execute(self, data: Any, datatrans: Type[BaseDataTrans]) -> Any:
+        if isinstance(data, Prepared):
+            return await data.plan(self, data.slots)
+        return await self.run(data)
+
+    async def run(self, ast: Any) -> Any:
+        """
+        Evaluate a `JsonAst`, or its wire form, through its compiled plan.
+        """
+        plan, slots = self.compiler.compile(ast.dumps() if isinstance(ast, JsonAst) else ast)
+        return await plan(self, slots)
 
-            args = []
-            kwargs = {}
-            for i in ast.args or ():
-                args.append(await self.run(i))
-            if ast.kwargs:
-                for k,v in ast.kwargs.items():
-                    kwargs[k] = await self.run(v)
-            args = tuple(args)
+    async def _fetch(self, proxies: List["ProxyObj"]) -> List[Any]:
+        for proxy in proxies:
+            proxy._vision = True
+        if len(proxies) == 1:
+            return [await proxies[0]]
+        return await self.rpc.batch(proxies)
 
-            if ast.method == "__call__" and asyncio.iscoroutinefunction(obj):
-                return await func(*args, **kwargs)
-            elif asyncio.iscoroutinefunction(func):
-                return await func(*args, **kwargs)
-            elif isinstance(obj, self.proxy):
-                return func(*args, **kwargs)
-            return func(*args, **kwargs)
-        elif isinstance(ast, self.proxy):
-            return await ast
-        elif isinstance(ast, self.proxyresult):
-            return ast.visions
-        elif isinstance(ast, (list, tuple)):
-            t_args = []
-            for i in ast:
-                t_args.append(await self.run(i))
-            return type(ast)(t_args)
-        elif isinstance(ast, dict):
-            return {k: await self.run(v) for k, v in ast.items()}
-        else:
-            return ast
+    async def _resolve(self, value: Any) -> Any:
+        if isinstance(value, self.proxy):
+            value._vision = True
+            return await value
+        elif isinstance(value, (list, tuple)):
+            return type(value)([await self._resolve(i) for i in value])
+        elif isinstance(value, dict):
+            return {k: await self._resolve(v) for k, v in value.items()}
+        return value
 
 class Standard(BaseStandard[dict, JsonAst]):
 
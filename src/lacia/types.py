@@ -2,7 +2,7 @@ from __future__ import annotations
 
 from enum import Enum
 from contextvars import ContextVar
-from typing import Dict, Any, TYPE_CHECKING
+from typing import Dict, Any, Optional, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from lacia.standard.abcbase import Namespace
@@ -31,6 +31,14 @@ class RpcMessage:
     def id(self) -> Any:
         return self.data.get("id", None)
 
+    @property
+    def retain(self) -> bool:
+        return self.data.get("retain", True)
+
+    @property
+    def order(self) -> Any:
+        return self.data.get("order", None)
+
     @property
     def method(self):
         return self.data.get("method", {})
@@ -51,24 +59,63 @@ class RpcMessage:
     def error_msg(self) -> str:
         return self.data["error"]["message"]
     
+    @property
+    def handle(self) -> Any:
+        handle = self.data.get("handle", None)
+        if handle is True:
+            return str(self.id)
+        return handle
+
+    @property
+    def batch(self) -> list:
+        return self.data.get("batch", [])
+
+    @property
+    def results(self) -> list:
+        return self.data.get("results", [])
+
+    @property
+    def stream(self) -> Optional[int]:
+        return self.data.get("stream", None)
+
+    @property
+    def template(self) -> Any:
+        return self.data.get("template", None)
+
+    @property
+    def params(self) -> list:
+        return self.data.get("params", [])
+
+    @property
+    def is_batch(self) -> bool:
+        return "batch" in self.data
+
+    @property
+    def is_stream(self) -> bool:
+        return "item" in self.data or "end" in self.data
+
+    @property
+    def is_credit(self) -> bool:
+        return "credit" in self.data or "cancel" in self.data
+
     @property
     def is_error(self) -> bool:
         return "error" in self.data
 
     @property
     def is_request(self) -> bool:
-        return "method" in self.data
+        return "method" in self.data or "batch" in self.data or "template" in self.data
     
     @property
     def is_response(self) -> bool:
-        return "result" in self.data or "error" in self.data
+        return "result" in self.data or "error" in self.data or "results" in self.data
 
     @property
     def is_auth(self) -> bool:
 
         return all(
             [
-                self.method["obj"] == {'obj': ["server", None], 'method': '__getattr__', 'args': ['rpc_auto_register'], 'kwargs': {}},
+                self.method.get("obj") == {'obj': ["server", None], 'method': '__getattr__', 'args': ['rpc_auto_register'], 'kwargs': {}},
             ]
         )
 
@@ -0,0 +1,867 @@
+import os
+import socket
+import signal
+import asyncio
+import threading
+import tempfile
+
+from lacia.logger import logger, PayloadLog
+from lacia.core.store import ResultStore
+from lacia.core.pending import PendingCalls
+from lacia.core.executor import ConnectionExecutor
+from lacia.core.relay import RelayTable
+from lacia.network.codec import BsonCodec, get_codec, to_protocols, from_protocol, compression_from_protocol
+from lacia.network.compress import available_compressions, get_compression, offers, dictionary_id
+from lacia.network.abcbase import Connection
+from lacia.standard.abcbase import Namespace
+from lacia.standard.jsonast.compiler import Compiler
+from lacia.standard.jsonast.planner import Planner
+from lacia.core.offload import Offload
+from lacia.core.prepared import Param, TemplateStore
+from lacia.core.attach import Parcel, lift, header, restore
+from lacia.core.transfer import Blob, ChunkSender, Transfers
+from lacia.core.encoder import ResultEncoder
+from lacia.core.metrics import Metrics, CALLER, CALLEE, method_name, to_prometheus
+from lacia.core.proxy import ProxyObj
+from lacia.core.peers import Peers, open_address
+from lacia.core.workers import Workers
+from lacia.core.core import JsonRpc
+from lacia.network.server.memoryserver import MemoryServer
+from lacia.network.client.memoryclient import MemoryClient
+from lacia.network.server.streamserver import StreamServer, StreamSocket
+from lacia.network.client.streamclient import StreamClient
+from lacia.exception import JsonRpcTimeoutException, JsonRpcClosedException, JsonRpcWsConnectException, JsonRpcRuntimeException
+
+class Test:
+
+    async def test_stream_transport(self):
+        path = os.path.join(tempfile.mkdtemp(), "lacia.sock")
+        for options in ({"port": 0}, {"path": path}):
+            transport = StreamServer(compress_threshold=64, **options)
+            server = JsonRpc(name="stream_server", namespace={"echo": lambda value: value})
+            task = asyncio.create_task(server.run_server(transport))
+            await transport.started.wait()
+            client = JsonRpc(name="stream_client", namespace={"twice": lambda value: value * 2})
+            await client.run_client(StreamClient(port=transport.port, path=transport.path))
+
+            payload = {"text": "x" * 1000, "data": b"\x00" * 200_000}
+            assert await ProxyObj(client).echo(payload) == payload
+            assert await ProxyObj(server, "stream_client").twice(21) == 42
+            assert client._client.compression() is not None
+
+            await client._client.close()
+            await transport.close()
+            await task
+            assert not transport.active_connections.ws
+
+    async def test_first_call(self):
+        for serialize in (False, True):
+            name = f"first_call_{serialize}"
+            server = JsonRpc(name=f"{name}_server", namespace={"echo": lambda value: value})
+            await server.run_server(MemoryServer(name, serialize=serialize, codec="msgpack"))
+            client = JsonRpc(name=f"{name}_client")
+            await client.run_client(MemoryClient(name))
+            assert await ProxyObj(client, timeout=1).echo("x") == "x"
+
+            await client._client.close()
+            await server._server.close()
+
+        transport = StreamServer(port=0, codecs=["bson"], compression=["deflate"], compress_threshold=0)
+        server = JsonRpc(name="first_call_server", namespace={"echo": lambda value: value})
+        task = asyncio.create_task(server.run_server(transport))
+        await transport.started.wait()
+        client = JsonRpc(name="first_call_client")
+        await client.run_client(StreamClient(port=transport.port, codecs=["bson"], compression=["deflate"], compress_threshold=0))
+        payload = "jsonast " * 100
+        assert await ProxyObj(client, timeout=1).echo(payload) == payload
+        assert client._compressions[client._client.ws].stats()["compressed"] >= 1
+
+        await client._client.close()
+        await transport.close()
+        await task
+
+    async def test_store_lru(self):
+        store = ResultStore(max_entries=2)
+
+        store.put("ws", 1, "a")
+        store.put("ws", 2, "b")
+        assert store.get("ws", 1) == "a"
+        store.put("ws", 3, "c")
+
+        assert store.get("ws", 2) is None
+        assert store.get("ws", "1") == "a"
+        assert store.stats()["evictions"] == 1
+
+    async def test_store_bytes(self):
+        store = ResultStore(max_bytes=store_size("x" * 100) * 2)
+
+        for i in range(5):
+            store.put("ws", i, "x" * 100)
+
+        assert len(store.bucket("ws")) == 2
+        assert store.stats()["entries"] == 2
+
+        store = ResultStore(max_bytes=1024 * 1024)
+        for i in range(50):
+            store.put("ws", i, [b"x" * 1024 * 1024])
+        assert store.stats()["entries"] == 0 and store.stats()["bytes"] == 0
+        assert store_size({"a": [b"x" * 1000]}) > 1000
+
+    async def test_store_ttl(self):
+        store = ResultStore(ttl=0.01)
+
+        store.put("ws", 1, "a")
+        await asyncio.sleep(0.02)
+
+        assert store.get("ws", 1) is None
+        assert store.stats()["expirations"] == 1
+
+    async def test_store_drop(self):
+        store = ResultStore()
+
+        store.put("a", 1, "a")
+        store.put("b", 1, "b")
+        store.drop("a")
+
+        assert store.get("a", 1) is None
+        assert store.stats()["entries"] == 1
+
+    async def test_pending_resolve(self):
+        pending = PendingCalls()
+
+        call_id, future = pending.create("ws")
+        assert pending.resolve(call_id, "ok")
+        assert await future == "ok"
+
+        pending.discard(call_id)
+        assert len(pending) == 0
+        assert not pending.resolve(call_id, "late")
+
+    async def test_pending_timeout(self):
+        pending = PendingCalls(timeout=0.01)
+
+        call_id, future = pending.create("ws")
+        try:
+            await future
+            assert False
+        except JsonRpcTimeoutException:
+            pass
+        finally:
+            pending.discard(call_id)
+
+    async def test_pending_fail(self):
+        pending = PendingCalls()
+
+        _, a = pending.create("a")
+        _, b = pending.create("b")
+
+        assert pending.fail("a", JsonRpcClosedException("closed")) == 1
+        assert isinstance(a.exception(), JsonRpcClosedException)
+        assert not b.done()
+        assert pending.in_flight("b") == 1
+
+    async def test_executor_limit(self):
+        executor = ConnectionExecutor(limit=2)
+        running, peak = 0, 0
+
+        async def job():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        for _ in range(6):
+            await executor.submit(job())
+        await asyncio.sleep(0.05)
+
+        assert peak == 2
+
+    async def test_executor_order(self):
+        executor = ConnectionExecutor()
+        seen = []
+
+        async def job(i, delay):
+            await asyncio.sleep(delay)
+            seen.append(i)
+
+        await executor.submit(job(0, 0.02), "k")
+        await executor.submit(job(1, 0.0), "k")
+        await executor.submit(job(2, 0.0))
+        await asyncio.sleep(0.05)
+
+        assert seen == [2, 0, 1]
+
+    async def test_relay_frame(self):
+        codec = BsonCodec()
+        data = codec.dumps({"to": "b", "id": 7, "jsonrpc": "jsonast", "method": {}})
+        to, call_id, key = codec.peek(data)
+
+        assert (to.key, to.value, call_id.value, key.key) == ("to", "b", 7, "jsonrpc")
+        assert codec.patch(data, call_id, 2 ** 40) is None
+        assert codec.loads(bytes(codec.patch(data, call_id, 99))) == {"to": "b", "id": 99, "jsonrpc": "jsonast", "method": {}}
+
+    async def test_codec_negotiation(self):
+        assert from_protocol(to_protocols(["cbor", "bson"])[0]) == "cbor"
+        assert from_protocol(None) is None and get_codec(None).name == get_codec("json5").name == "bson"
+
+        codec = get_codec("msgpack")
+        if codec.name != "msgpack":
+            return
+        data = codec.dumps({"to": "b", "id": 7, "credit": 3})
+        to, call_id, credit = codec.peek(data)
+
+        assert (to.value, call_id.value, credit.value) == ("b", 7, 3)
+        assert codec.loads(bytes(codec.patch(data, call_id, 2 ** 40))) == {"to": "b", "id": 2 ** 40, "credit": 3}
+
+    async def test_attach_frames(self):
+        blob = bytearray(b"x" * 8)
+        msg = {"id": 1, "jsonrpc": "jsonast", "result": {"small": b"ab", "items": [blob, (memoryview(blob),)]}}
+        frames = []
+        lifted = header(lift(msg, 8, lambda view: frames.append(view) or {"$attach": len(frames) - 1}), 0, len(frames))
+
+        assert list(lifted)[:2] == ["id", "attach"] and lifted["attach"] == 2
+        assert msg["result"]["items"][0] is blob and all(isinstance(frame, memoryview) for frame in frames)
+        assert lifted["result"]["small"] == b"ab" and lifted["result"]["items"] == [{"$attach": 0}, ({"$attach": 1},)]
+
+        parcel = Parcel(b"", 2)
+        assert not parcel.add(b"x" * 8) and parcel.add(b"y" * 8)
+        result = restore(lifted, parcel.frames)["result"]
+        assert result["items"][0] is parcel.frames[0] and result["items"][1] == (b"y" * 8,)
+
+    async def test_chunk_transfer(self):
+        transfers = Transfers()
+
+        async def credit(msg):
+            transfers.on_frame("a", msg, None)
+
+        async def send(msg, frames):
+            transfers.on_frame("b", msg, frames)
+
+        reader = transfers.receive("b", 1, 2, credit)
+        transfers.start("a", ChunkSender(1, Blob(b"0123456789"), 4, 2, send))
+        assert [bytes(chunk) async for chunk in reader] == [b"0123", b"4567", b"89"]
+
+        reader = transfers.receive("b", 2, 2, credit)
+        transfers.start("a", ChunkSender(2, Blob(b"x" * 10), 4, 2, send))
+        spooled = await reader.spool(max_size=8)
+        assert spooled.read() == b"x" * 10 and spooled._rolled
+
+        assert transfers.stats() == {"sending": 0, "receiving": 0, "chunks_sent": 6, "chunks_received": 6}
+
+    async def test_compression(self):
+        dictionary = b"jsonast method result " * 8
+        names = offers(["deflate"], dictionary)
+        assert names == [f"deflate.{dictionary_id(dictionary)}", "deflate"]
+        protocols = to_protocols(["msgpack"], names)
+        assert protocols[-1] == "lacia.msgpack" and from_protocol(protocols[0]) == "msgpack"
+        assert compression_from_protocol(protocols[0]) == names[0] and compression_from_protocol(protocols[-1]) is None
+
+        sender = get_compression(names[0], dictionary)
+        receiver = get_compression(names[0], dictionary)
+        assert sender is not None and receiver is not None and sender.threshold == 64
+
+        small, large = b"x" * 10, b"jsonast method result " * 20
+        assert sender.compress(small) == b"\x00" + small
+        packed = sender.compress(large)
+        assert len(packed) < len(large) // 4
+        assert receiver.decompress(packed) == large and receiver.decompress(b"\x00" + small) == small
+
+        stats = sender.stats()
+        assert stats["sent"] == 2 and stats["compressed"] == 1 and stats["ratio_out"] < 1
+        assert receiver.stats()["decompressed"] == 1 and get_compression(None) is None
+
+        bomb = b"\x00" * 10_000_000
+        for name in available_compressions():
+            packed = get_compression(name, threshold=0).compress(bomb)
+            assert get_compression(name, limit=len(bomb)).decompress(packed) == bomb
+            try:
+                get_compression(name, limit=1024 * 1024).decompress(packed)
+                assert False
+            except JsonRpcWsConnectException:
+                pass
+
+    async def test_interceptors(self):
+        rpc = JsonRpc(name="intercept")
+        calls = []
+
+        def outer(call_next, websocket, msg):
+            calls.append("outer")
+            return call_next(websocket, {**msg, "outer": True})
+
+        @rpc.intercept("encode")
+        def inner(call_next, websocket, msg):
+            calls.append("inner")
+            return call_next(websocket, msg)
+
+        rpc.intercept("encode", outer, first=True)
+        data, frames, transfers = rpc._encode("ws", {"id": 1})
+        assert calls == ["outer", "inner"] and rpc._decode("ws", data) == {"id": 1, "outer": True}
+
+        rpc.intercept("receive", lambda call_next, websocket, data: None)
+        assert rpc._received is not None and rpc._received("ws", data) is None
+
+        for stage, interceptor in (("encode", outer), ("encode", inner)):
+            rpc.remove_interceptor(stage, interceptor)
+        assert "_encode" not in rpc.__dict__ and "_send" not in rpc.__dict__
+        try:
+            rpc.intercept("dispatch", outer)
+            assert False
+        except ValueError:
+            pass
+
+    async def test_memory_transport(self):
+        for serialize in (False, True):
+            name = f"memory_{serialize}"
+            server = JsonRpc(name=f"{name}_server", namespace={"echo": lambda value: value})
+            await server.run_server(MemoryServer(name, serialize=serialize))
+            client = JsonRpc(name=f"{name}_client", namespace={"twice": lambda value: value * 2})
+            await client.run_client(MemoryClient(name))
+
+            payload = {"text": "x", "list": [1, 2.5, None], "data": b"\x00" * 200_000}
+            assert await ProxyObj(client).echo(payload) == payload
+            assert await ProxyObj(server, f"{name}_client").twice(21) == 42
+            assert client._client.codec().serializes is serialize
+            try:
+                await ProxyObj(client).doesnotexist_123()
+                assert False
+            except Exception:
+                pass
+            assert set(server._metrics.methods[CALLEE]) >= {"echo", "<unknown>"}
+            assert "doesnotexist_123" not in server._metrics.methods[CALLEE]
+
+            await client._client.close()
+            await server._server.close()
+            await asyncio.sleep(0.05)
+            assert not server._server.active_connections.ws
+
+    async def test_stream_cancel(self):
+        closed = asyncio.Event()
+
+        async def count(n):
+            try:
+                for i in range(n):
+                    yield i
+            finally:
+                closed.set()
+
+        server = JsonRpc(name="stream_cancel_server", namespace={"count": count})
+        await server.run_server(MemoryServer("stream_cancel", serialize=True))
+        client = JsonRpc(name="stream_cancel_client")
+        await client.run_client(MemoryClient("stream_cancel"))
+
+        async for i in await client.stream(ProxyObj(client).count(1000), window=4):
+            if i == 2:
+                break
+        await asyncio.wait_for(closed.wait(), 1)
+        await asyncio.sleep(0.05)
+        assert not client._streams and not any(server._producers.values())
+
+        await client._client.close()
+        await server._server.close()
+
+    async def test_batch(self):
+        def fail():
+            raise ValueError("batch item failed")
+
+        server, client = await memory_pair("batch", {"echo": lambda value: value, "fail": fail}, {"whoami": lambda: "first"})
+        other = JsonRpc(name="batch_other", namespace={"whoami": lambda: "other"})
+        await other.run_client(MemoryClient("batch"))
+
+        proxy = ProxyObj(client)
+        assert await client.batch([proxy.echo(i) for i in range(5)]) == [0, 1, 2, 3, 4]
+        try:
+            await client.batch([proxy.echo(1), proxy.fail(), proxy.echo(2)])
+            assert False
+        except JsonRpcRuntimeException as e:
+            assert "batch item failed" in str(e)
+        results = await client.batch([proxy.echo(1), proxy.fail(), proxy.echo(2)], return_exceptions=True)
+        assert results[0] == 1 and results[2] == 2 and isinstance(results[1], JsonRpcRuntimeException)
+
+        names = ["batch_client", "batch_other", "batch_client"]
+        assert await server.batch([ProxyObj(server, name).whoami() for name in names]) == ["first", "other", "first"]
+
+        await other._client.close()
+        await client._client.close()
+        await server._server.close()
+
+    async def test_batch_encode(self):
+        encoder = ResultEncoder("handle")
+        encoder.register(Unencodable, lambda obj: obj.fail())
+        server = JsonRpc(name="batch_encode_server", namespace={"echo": lambda value: value, "opaque": Opaque, "unencodable": Unencodable}, encoder=encoder)
+        await server.run_server(MemoryServer("batch_encode", serialize=True))
+        client = JsonRpc(name="batch_encode_client")
+        await client.run_client(MemoryClient("batch_encode"))
+
+        proxy = ProxyObj(client)
+        results = await client.batch([proxy.echo(1), proxy.opaque(), proxy.unencodable(), proxy.echo(b"x" * 200_000)], return_exceptions=True)
+        assert results[0] == 1 and results[3] == b"x" * 200_000
+        assert await results[1].value == 7
+        assert isinstance(results[2], JsonRpcRuntimeException) and "unencodable" in str(results[2])
+
+        await client._client.close()
+        await server._server.close()
+
+    async def test_peers(self):
+        folder = tempfile.mkdtemp()
+        addresses = {node: f"unix://{os.path.join(folder, node)}.sock" for node in ("a", "b")}
+        servers, clients = [], []
+        for node in addresses:
+            server = JsonRpc(name=f"peer_{node}", peers=Peers(node, addresses, retry=0.05))
+            await server.run_server(MemoryServer(f"peer_{node}"))
+            client = JsonRpc(name=f"peer_client_{node}", namespace={"twice": lambda value: value * 2})
+            await client.run_client(MemoryClient(f"peer_{node}"))
+            servers.append(server)
+            clients.append(client)
+        for _ in range(100):
+            if all(server._peers.owner(f"peer_client_{node}") for server, node in zip(servers, "ba")):
+                break
+            await asyncio.sleep(0.02)
+
+        assert await ProxyObj(servers[0], "peer_client_b").twice(21) == 42
+        assert await ProxyObj(clients[0], "peer_client_b").twice("x") == "xx"
+        assert await servers[1].batch([ProxyObj(servers[1], "peer_client_a").twice(i) for i in range(3)]) == [0, 2, 4]
+        assert servers[0]._peers.stats()["forwarded"] >= 1
+        assert await ProxyObj(servers[0], "peer_client_b").twice(Param(0))._prepare()(21) == 42
+        assert await ProxyObj(clients[0], "peer_client_b").twice(Param(0))._prepare()(4) == 8
+        for rpc in (servers[0], clients[0]):
+            try:
+                async for _ in await rpc.stream(ProxyObj(rpc, "peer_client_b").twice(1)):
+                    pass
+                assert False
+            except JsonRpcRuntimeException as e:
+                assert "not routed across peers" in str(e), e
+
+        intruder = JsonRpc(name="peer_client_b", token="wrong")
+        await intruder.run_client(MemoryClient("peer_a"))
+        assert servers[0]._peers.owner("peer_client_b") == "b"
+        assert await ProxyObj(servers[0], "peer_client_b").twice(21) == 42
+        await intruder._client.close()
+
+        await clients[1]._client.close()
+        for _ in range(100):
+            if servers[0]._peers.owner("peer_client_b") is None:
+                break
+            await asyncio.sleep(0.02)
+        assert servers[0]._peers.owner("peer_client_b") is None
+
+        peers = Peers("b", addresses)
+        peers._own("moved", "a", 10)
+        peers._own("moved", "c", 3)
+        assert peers.owner("moved") == "a"
+        peers.claim("moved")
+        assert peers.names["moved"] == 11 and peers.owner("moved") is None
+        peers._own("moved", "a", 11)
+        assert peers.owner("moved") is None
+        for server in servers:
+            await server._peers.close()
+            await server._server.close()
+
+    async def test_cluster(self):
+        ports = []
+        for _ in range(3):
+            with socket.socket() as sock:
+                sock.bind(("127.0.0.1", 0))
+                ports.append(sock.getsockname()[1])
+        seed = f"tcp://127.0.0.1:{ports[0]}"
+        servers, clients = [], []
+        for node, port in zip("abc", ports):
+            peers = Peers(node, {node: f"tcp://127.0.0.1:{port}"}, retry=0.05, seeds=[seed], secret="cluster")
+            server = JsonRpc(name=f"node_{node}", peers=peers)
+            transport = StreamServer(host="127.0.0.1", port=0)
+            asyncio.create_task(server.run_server(transport))
+            await transport.started.wait()
+            client = JsonRpc(name=f"node_client_{node}", namespace={"where": lambda node=node: node})
+            await client.run_client(StreamClient(host="127.0.0.1", port=transport.port))
+            servers.append(server)
+            clients.append(client)
+
+        names = [f"node_client_{node}" for node in "abc"]
+        for _ in range(200):
+            if all(server._peers.owner(name) for server in servers for name in names if name not in server._server.active_connections.name_ws):
+                break
+            await asyncio.sleep(0.02)
+        assert all(server._peers.stats()["members"] == ["a", "b", "c"] for server in servers)
+
+        assert await ProxyObj(servers[1], "node_client_c").where() == "c"
+        assert await ProxyObj(clients[2], "node_client_b").where() == "b"
+        assert await servers[0].batch([ProxyObj(servers[0], name).where() for name in names]) == ["a", "b", "c"]
+
+        reader, writer = await open_address(seed, 1 << 16)
+        raw = StreamSocket(reader, writer, 1 << 20)
+        await raw.receive()
+        await raw.send(servers[0]._peers.codec.dumps({"id": 1, "to": "node_client_a", "call": {}}))
+        try:
+            await asyncio.wait_for(raw.receive(), 1)
+            assert False
+        except JsonRpcWsConnectException:
+            pass
+        intruder = Peers("x", {"x": f"tcp://127.0.0.1:{ports[2] + 1}"}, retry=0.05, seeds=[seed], secret="wrong")
+        await intruder.start(lambda *args: None) # type: ignore
+        await asyncio.sleep(0.2)
+        assert "x" not in servers[0]._peers.addresses and not intruder.links
+        await intruder.close()
+
+        await servers[2]._peers.close()
+        await servers[2]._server.close()
+        for _ in range(200):
+            if servers[0]._peers.owner("node_client_c") is None and "c" not in servers[0]._peers.addresses:
+                break
+            await asyncio.sleep(0.02)
+        assert servers[0]._peers.owner("node_client_c") is None
+        assert servers[1]._peers.stats()["members"] == ["a", "b"]
+        for server in servers[:2]:
+            await server._peers.close()
+            await server._server.close()
+
+    async def test_workers(self):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        parent = os.fork()
+        if not parent:
+            try:
+                asyncio.set_event_loop_policy(None)
+                rpc = JsonRpc(name="workers", namespace={"pid": os.getpid})
+                Workers(rpc, StreamServer(host="127.0.0.1", port=port), workers=2).run()
+            finally:
+                os._exit(0)
+
+        clients, pids = [], {}
+        for i in range(50):
+            client = JsonRpc(name=f"workers_client_{i}", namespace={"whoami": lambda i=i: f"workers_client_{i}"})
+            try:
+                await client.run_client(StreamClient(host="127.0.0.1", port=port))
+            except OSError:
+                await asyncio.sleep(0.05)
+                continue
+            clients.append(client)
+            pids.setdefault(await ProxyObj(client).pid(), client)
+            if len(pids) == 2:
+                break
+        assert len(pids) == 2 and parent not in pids
+
+        first, second = pids.values()
+        for _ in range(100):
+            try:
+                await ProxyObj(first, second._name).whoami()
+                break
+            except JsonRpcRuntimeException:
+                await asyncio.sleep(0.05)
+        assert await ProxyObj(first, second._name).whoami() == second._name
+        assert await ProxyObj(second, first._name).whoami() == first._name
+
+        os.kill(parent, signal.SIGTERM)
+        assert os.waitstatus_to_exitcode(os.waitpid(parent, 0)[1]) == 0
+        for pid in pids:
+            try:
+                os.kill(pid, 0)
+                assert False
+            except ProcessLookupError:
+                pass
+        for client in clients:
+            await client._client.close()
+
+    async def test_metrics(self):
+        assert method_name(ProxyObj().Test(1, b=2).output("x")._obj.dumps()) == "Test"
+        assert method_name({"obj": ["server", None], "method": "__getattr__", "args": ("12:3",), "kwargs": {}}) == "<result>"
+
+        metrics = Metrics()
+        with metrics.call(CALLEE, "ping"):
+            pass
+        try:
+            with metrics.call(CALLEE, "ping"):
+                raise ValueError()
+        except ValueError:
+            pass
+        metrics.connection("ws").bytes_in += 10
+
+        snapshot = metrics.snapshot({"queue_depth": {"a": 2}}, lambda conn: "peer")
+        ping = snapshot["methods"][CALLEE]["ping"]
+        assert ping["calls"] == 2 and ping["errors"] == 1 and ping["latency"]["p50"] == 0.0005
+        assert snapshot["connections"] == {"peer": {"bytes_in": 10, "bytes_out": 0, "frames_in": 0, "frames_out": 0}}
+
+        capped = Metrics(max_methods=2)
+        for name in ("a", "b", "c", "d"):
+            capped.record(CALLEE, name, 0.001)
+        assert list(capped.methods[CALLEE]) == ["a", "b", "<unknown>"] and capped.methods[CALLEE]["<unknown>"].calls == 2
+
+        text = to_prometheus(snapshot)
+        assert 'lacia_calls_total{side="callee",method="ping"} 2' in text
+        assert 'lacia_call_seconds_bucket{side="callee",method="ping",le="+Inf"} 2' in text
+        assert 'lacia_queue_depth{peer="a"} 2' in text
+
+    async def test_payload_log(self):
+        lines = []
+        sink = logger.add(lines.append, level="DEBUG", format="{message}")
+        try:
+            PayloadLog()("send", {"id": 1})
+            assert lines == []
+
+            log = PayloadLog(True, sample=2, limit=64)
+            for i in range(4):
+                log("send", {"id": i, "result": b"x" * 10_000_000, "items": list(range(1000))})
+            assert len(lines) == 2 and all(len(line) < 128 for line in lines)
+            assert lines[0].startswith("send: {") and "<10000000 bytes>" in log.format(b"x" * 10_000_000)
+        finally:
+            logger.remove(sink)
+
+    async def test_relay_table(self):
+        relays = RelayTable()
+        relays.open(100, "a", 7, "b")
+
+        assert relays.outbound("a", 7) == 100
+        assert relays.inbound("a", 100) is None
+        assert relays.inbound("b", 100).src_id == 7 # type: ignore
+
+        outgoing, incoming = relays.drop("b")
+        assert not outgoing and incoming[0][0] == 100
+        assert len(relays) == 0 and relays.outbound("a", 7) is None
+
+    async def test_connection_registry(self):
+        connections = Connection()
+        for ws in ("a", "b"):
+            connections.set_ws(ws, asyncio.Event())
+
+        connections.set_name_ws("x", "a")
+        connections.set_name_ws("y", "a")
+        assert connections.get_name("a") == "y" and "x" not in connections.name_ws
+
+        connections.set_name_ws("y", "b")
+        assert connections.get_ws("y") == "b"
+        try:
+            connections.get_name("a")
+            assert False
+        except KeyError:
+            pass
+        try:
+            connections.set_name_ws("y", "a", replace=False)
+            assert False
+        except ValueError:
+            pass
+
+        for ws, _ in connections.connections():
+            connections.clear_ws(ws)
+        assert len(connections) == 0 and not connections.name_ws
+
+    async def test_namespace_scope(self):
+        globals = {"b": 1}
+        namespace = Namespace(builtins={"a": 0, "b": 0}, globals=globals)
+        scope = namespace.scope("ws", {"r": 3})
+
+        assert (scope["a"], scope["b"], scope["r"]) == (0, 1, 3)
+
+        namespace.update({"a": 1})
+        namespace.set_local("ws", "b", 2)
+        assert (scope["a"], scope["b"]) == (1, 2)
+        assert "r" in scope and "x" not in scope
+        globals["x"] = 4
+        assert scope["x"] == 4 and namespace.shares("x")
+
+        namespace.drop("ws")
+        assert namespace.scope("ws")["b"] == 1
+
+    async def test_compiler_cache(self):
+        compiler = Compiler(Planner(True, "server"), maxsize=2)
+        runtime = PlanRunTime({"add": lambda a, b=0: a + b})
+
+        def call(*args, **kwargs):
+            func = {"obj": ["server", None], "method": "__getattr__", "args": ["add"], "kwargs": {}}
+            return {"obj": func, "method": "__call__", "args": list(args), "kwargs": kwargs}
+
+        for a, b in ((1, 2), (3, 4)):
+            plan, slots = compiler.compile(call(a, b=b))
+            assert slots == [a, b] and await plan(runtime, slots) == a + b
+        assert (compiler.hits, compiler.misses) == (1, 1)
+
+        plan, slots = compiler.compile(call([1], b=[2]))
+        assert await plan(runtime, slots) == [1, 2] and compiler.hits == 2
+
+        compiler.compile(call(1))
+        compiler.compile(call(a=1))
+        assert compiler.stats()["plans"] == 2 and compiler.misses == 3
+
+    async def test_template_bind(self):
+        compiler = Compiler(Planner(True, "server"))
+        runtime = PlanRunTime({"add": lambda a, b=0: a + b})
+        templates = TemplateStore(max_templates=1)
+
+        func = {"obj": ["server", None], "method": "__getattr__", "args": ["add"], "kwargs": {}}
+        templates.register("ws", 1, {"obj": func, "method": "__call__", "args": [{"$param": 0}], "kwargs": {"b": [{"$param": 1}, 1]}})
+
+        prepared = templates.bind("ws", 1, [[0], 2], compiler)
+        assert await prepared.plan(runtime, prepared.slots) == [0, 2, 1]
+        try:
+            templates.register("ws", 2, {})
+            assert False
+        except Exception:
+            pass
+
+        templates.drop("ws")
+        try:
+            templates.bind("ws", 1, [], compiler)
+            assert False
+        except Exception:
+            pass
+
+    async def test_prepared(self):
+        def fail(value):
+            raise ValueError("prepared failed")
+
+        server, client = await memory_pair("prepared", {"add": lambda a, b: a + b, "fail": fail})
+        websocket = client._client.ws
+
+        failing = ProxyObj(client).fail(Param(0))._prepare()
+        try:
+            await failing(1)
+            assert False
+        except JsonRpcRuntimeException:
+            pass
+        assert websocket not in failing.sent
+
+        add = ProxyObj(client).add(Param(0), Param(1))._prepare()
+        assert await add(1, 2) == 3 and websocket in add.sent
+        server._templates = TemplateStore()
+        assert await add(2, 3) == 5 and websocket in add.sent
+
+        await client._client.close()
+        await server._server.close()
+
+    async def test_offload(self):
+        server, client = await memory_pair(
+            "offload",
+            {"inline_id": lambda: threading.get_ident(), "thread_id": lambda: threading.get_ident()},
+            policies={"thread_id": "thread"},
+        )
+        server.add_namespace({"pid": os.getpid}, policy="process")
+
+        proxy = ProxyObj(client)
+        assert await proxy.inline_id() == threading.get_ident()
+        assert await proxy.thread_id() != threading.get_ident()
+        assert await proxy.pid() != os.getpid()
+        stats = server.offload_stats()
+        assert stats["default"] == "inline" and stats["thread"]["completed"] == 1 and stats["process"]["completed"] == 1
+
+        server._offload.shutdown()
+        await client._client.close()
+        await server._server.close()
+
+    async def test_result_encoder(self):
+        encoder = ResultEncoder()
+        encoder.register(Point, lambda point: [point.x, point.y])
+        encoder.register(Opaque, "handle")
+        server, client = await memory_pair(
+            "result_encoder",
+            {"point": lambda: Point(1, 2), "opaque": Opaque, "label": Label, "tags": lambda: {"a"}},
+            encoder=encoder,
+        )
+
+        proxy = ProxyObj(client)
+        assert await proxy.point() == [1, 2]
+        assert await proxy.label() == "label"
+        assert await proxy.tags() == ["a"]
+        opaque = await proxy.opaque()
+        assert isinstance(opaque, ProxyObj) and await opaque.value == 7
+
+        await client._client.close()
+        await server._server.close()
+
+    async def test_nested_plan(self):
+        server, client = await memory_pair("nested_plan", {"echo": lambda value: value, "add": lambda a, b: a + b})
+        other = JsonRpc(name="nested_plan_other", namespace={"twice": lambda value: value * 2, "inc": lambda value: value + 1})
+        await other.run_client(MemoryClient("nested_plan"))
+
+        traffic = client._metrics.connection(client._client.ws)
+        local, remote = ProxyObj(client), ProxyObj(client, "nested_plan_other")
+        for call, expected in (
+            (lambda: remote.twice(local.add(1, 2)), 6),
+            (lambda: local.add(remote.inc(1), remote.twice(5)), 12),
+            (lambda: remote.inc(remote.twice(local.echo(4))), 9),
+        ):
+            sent = traffic.frames_out
+            assert await call() == expected
+            assert traffic.frames_out - sent == 1
+        assert server._metrics.methods[CALLER]["<batch>"].calls >= 1
+
+        await other._client.close()
+        await client._client.close()
+        await server._server.close()
+
+    async def test_stream(self):
+        produced = 0
+
+        async def count(n):
+            nonlocal produced
+            for i in range(n):
+                produced += 1
+                yield i
+
+        async def broken():
+            yield 0
+            yield 1
+            raise ValueError("stream broke")
+
+        server, client = await memory_pair("stream", {"count": count, "broken": broken})
+
+        items = []
+        async for item in await client.stream(ProxyObj(client).count(100), window=4):
+            items.append(item)
+            await asyncio.sleep(0)
+            assert produced <= len(items) + 4
+        assert items == list(range(100))
+
+        items = []
+        try:
+            async for item in await client.stream(ProxyObj(client).broken()):
+                items.append(item)
+            assert False
+        except JsonRpcRuntimeException as e:
+            assert "stream broke" in str(e)
+        assert items == [0, 1] and not client._streams
+
+        await client._client.close()
+        await server._server.close()
+
+    async def main(self):
+        for func in dir(self):
+            if func.startswith("test_"):
+                await getattr(self, func)()
+                logger.success(f"{func} passed")
+
+class Opaque:
+    value = 7
+
+class Point:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+class Label:
+    def __str__(self):
+        return "label"
+
+class Unencodable:
+    def fail(self):
+        raise ValueError("unencodable")
+
+class PlanRunTime:
+    proxy = type(None)
+    offload = Offload()
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+
+async def memory_pair(name, namespace=None, client_namespace=None, **kwargs):
+    server = JsonRpc(name=f"{name}_server", namespace=namespace, **kwargs)
+    await server.run_server(MemoryServer(name, serialize=True))
+    client = JsonRpc(name=f"{name}_client", namespace=client_namespace)
+    await client.run_client(MemoryClient(name))
+    return server, client
+
+def store_size(value):
+    return ResultStore().sizeof(value)
+
+async def main():
+    await Test().main()
+
+asyncio.run(main())